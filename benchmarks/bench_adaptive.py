@@ -0,0 +1,48 @@
+import argparse
+import base64
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.moondream_client import MoondreamClient
+from stub_server import start_stub_server
+
+PROMPT = "List the visible waste items grouped by material: paper, plastic, metal, and glass."
+
+
+def run(name, url, images_b64, **client_options):
+    client = MoondreamClient("test", api_url=url, **client_options)
+    try:
+        start = time.perf_counter()
+        results = client.caption_many(images_b64, PROMPT)
+        seconds = time.perf_counter() - start
+        lost = sum(1 for result in results if not result)
+        limiter = client.limiter
+        print(f"  {name:<28}: {seconds:6.2f}s  {len(images_b64) / seconds:7.1f} images/s  "
+              f"lost={lost}  retries={client._client.retries}  final limit={limiter.limit:.1f}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AIMD concurrency against a throttling stub server")
+    parser.add_argument("--images", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--capacity", type=int, default=20, help="concurrent requests the stub accepts")
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    args = parser.parse_args()
+
+    images_b64 = [base64.b64encode(os.urandom(30 * 768)).decode("ascii")] * args.images
+    process, url = start_stub_server(latency=args.latency, max_in_flight=args.capacity, retry_after=args.retry_after)
+    try:
+        print(f"{args.images} images, stub accepts {args.capacity} concurrent requests, "
+              f"ideal {args.capacity / args.latency:.0f} images/s")
+        run("fixed 100, no retries", url, images_b64, max_concurrency=100, adaptive=False, max_retries=0)
+        run("fixed 100, retries", url, images_b64, max_concurrency=100, adaptive=False, max_retries=10)
+        run(f"fixed {args.capacity} (oracle)", url, images_b64, max_concurrency=args.capacity, adaptive=False)
+        run("AIMD up to 100, retries", url, images_b64, max_concurrency=100, adaptive=True, max_retries=10)
+    finally:
+        process.terminate()
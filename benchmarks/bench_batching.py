@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.moondream_client import MoondreamClient
+from stub_server import start_stub_server
+
+PROMPT = "List the visible waste items grouped by material: paper, plastic, metal, and glass."
+
+
+def run(url, images, batch_size, concurrency, batch_delay):
+    client = MoondreamClient("test", api_url=url, max_concurrency=concurrency, adaptive=False,
+                             batch_size=batch_size, batch_delay=batch_delay)
+    try:
+        start = time.perf_counter()
+        captions = client.caption_many(images, PROMPT)
+        seconds = time.perf_counter() - start
+        batcher = client._client.batcher
+        fallbacks = batcher.fallbacks if batcher else 0
+        lost = sum(1 for caption in captions if not caption)
+        print(f"  batch size {batch_size:<2}: {seconds:6.2f}s  {len(images) / seconds:7.1f} images/s  "
+              f"lost={lost}  single-image fallbacks={fallbacks}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-image batching throughput against the stub server")
+    parser.add_argument("--images", type=int, default=800)
+    parser.add_argument("--concurrency", type=int, default=8, help="requests the API lets us run at once")
+    parser.add_argument("--latency", type=float, default=0.2, help="fixed seconds per request")
+    parser.add_argument("--per-image-latency", type=float, default=0.03, help="extra seconds per image")
+    parser.add_argument("--batch-delay", type=float, default=0.05)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    # Distinct small payloads so every image is its own request
+    images = [os.urandom(20 * 1024) for _ in range(args.images)]
+    process, url = start_stub_server(latency=args.latency, per_image_latency=args.per_image_latency)
+    try:
+        print(f"{args.images} images, {args.concurrency} concurrent requests, "
+              f"{args.latency * 1000:.0f} ms + {args.per_image_latency * 1000:.0f} ms/image per request")
+        for batch_size in args.batch_sizes:
+            run(url, images, batch_size, args.concurrency, args.batch_delay)
+    finally:
+        process.terminate()
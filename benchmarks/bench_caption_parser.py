@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.caption_parser import parse_caption
+
+ITEMS = ["plastic bottle", "cardboard box", "soda can", "glass jar", "plastic bag", "newspaper",
+         "aluminum foil", "egg carton", "food container", "paper cup", "tin can", "glass bottle"]
+MATERIALS = ["paper", "glass", "metal", "plastic"]
+
+
+# Captions in the layouts the three prompts produce, plus free text
+def synthetic_corpus(count, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        picked = rng.sample(ITEMS, rng.randint(2, 6))
+        layout = rng.randrange(4)
+        if layout == 0:
+            corpus.append("\n".join(f"{item}: {rng.randint(1, 20)}" for item in picked))
+        elif layout == 1:
+            corpus.append("\n\n".join(f"**{material.title()}:**\n" + "\n".join(
+                f"- {rng.randint(1, 9)} {item}s" for item in picked if rng.random() < 0.5) for material in MATERIALS))
+        elif layout == 2:
+            corpus.append("\n".join(f"{material}: " + (", ".join(rng.sample(picked, 2)) if rng.random() < 0.7 else "None")
+                                    for material in MATERIALS))
+        else:
+            corpus.append("The image shows " + ", ".join(f"{rng.randint(1, 9)} {item}s" for item in picked) + ".")
+    return corpus
+
+
+def load_corpus(paths):
+    corpus = []
+    for path in paths:
+        if path.endswith((".sqlite", ".db")):
+            from waste_moondream.result_cache import ResultCache
+            corpus.extend(caption for _, _, caption in ResultCache(path).iter_captions())
+            continue
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                records = (json.loads(line) for line in f if line.strip())
+            else:
+                data = json.load(f)
+                records = data.values() if isinstance(data, dict) else data
+            corpus.extend(record["caption"] for record in records if isinstance(record, dict) and record.get("caption"))
+    return corpus
+
+
+# The three previous parsers, extraction only (no category matching)
+def previous_main(text):
+    return re.findall(r'([^:,\n]+):\s*(\d+)', text.lower())
+
+
+def previous_v2(text):
+    text = text.lower()
+    items = []
+    found = [category for category in ["paper/cardboard", "glass", "metal", "plastic"] if category in text]
+    for category in found:
+        section = text.split(category)[1].split("\n\n")[0]
+        items.extend(re.findall(r'[-•]\s*(\d+)\s*([^,\n]+)', section))
+    if not found:
+        items = re.findall(r'(\d+)\s+([a-zA-Z]+(?:\s+[a-zA-Z]+)*)', text)
+    return items
+
+
+def previous_multithreding(text):
+    items = []
+    for _, items_text in re.findall(r'(paper|glass|metal|plastic):\s*(.*)', text.lower()):
+        if "none" not in items_text:
+            items.extend(item.strip() for item in items_text.split(","))
+    return items
+
+
+def run_all(name, function, corpus):
+    start = time.perf_counter()
+    extracted = sum(len(function(text)) for text in corpus)
+    seconds = time.perf_counter() - start
+    print(f"  {name:<32}: {len(corpus) / seconds:10,.0f} captions/s  {extracted:8d} items extracted")
+    return seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Caption parse throughput over a stored or synthetic corpus")
+    parser.add_argument("sources", nargs="*", help="results .json/.jsonl files or a captions .sqlite cache")
+    parser.add_argument("--count", type=int, default=50000, help="synthetic captions when no sources are given")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.sources) if args.sources else synthetic_corpus(args.count)
+    print(f"{len(corpus)} captions")
+
+    run_all("main.py regex (one format)", previous_main, corpus)
+    run_all("v2 split per category (one format)", previous_v2, corpus)
+    run_all("multithreding regex (one format)", previous_multithreding, corpus)
+    run_all("all three in turn", lambda text: previous_main(text) + previous_v2(text) + previous_multithreding(text),
+            corpus)
+    run_all("parse_caption (every format)", lambda text: parse_caption(text).items, corpus)
+
+    formats = Counter(parse_caption(text).format for text in corpus)
+    print("  detected formats: " + ", ".join(f"{name}={count}" for name, count in formats.most_common()))
@@ -0,0 +1,93 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.cascade import CASCADE_TIERS, ResolutionCascade
+from synthetic_images import make_synthetic_folder
+
+CLEAR_CAPTION = "paper: cardboard box\nglass: None\nmetal: soda can\nplastic: plastic bottle (2)"
+VAGUE_CAPTION = "There are several plastic items and some paper on the ground."
+
+
+def mean_colour(image):
+    image.draft("RGB", (64, 64))
+    return np.asarray(image.convert("RGB").resize((16, 16)), dtype=np.float32).reshape(-1, 3).mean(axis=0)
+
+
+# Stand-in for the API. Each image needs a minimum upload size to be read
+# (assigned at random, found again by the image's mean colour); smaller
+# uploads get a vague caption. Latency is a fixed part, the upload time and
+# inference time growing with the pixel count.
+class SimulatedBackend:
+    def __init__(self, required_sizes, base_latency, uplink_bytes_per_second, seconds_per_megapixel):
+        self.colours = np.stack([colour for colour, _ in required_sizes])
+        self.sizes = [size for _, size in required_sizes]
+        self.base_latency = base_latency
+        self.uplink = uplink_bytes_per_second
+        self.seconds_per_megapixel = seconds_per_megapixel
+        self.clear = 0
+
+    def caption(self, image_data, prompt):
+        image = Image.open(BytesIO(image_data))
+        width, height = image.size
+        required = self.sizes[int(np.argmin(np.abs(self.colours - mean_colour(image)).sum(axis=1)))]
+        time.sleep(self.base_latency + len(image_data) / self.uplink + width * height / 1e6 * self.seconds_per_megapixel)
+        if max(width, height) >= required:
+            self.clear += 1
+            return CLEAR_CAPTION
+        return VAGUE_CAPTION
+
+
+def run(name, paths, backend, tiers, classify, workers):
+    backend.clear = 0
+    cascade = ResolutionCascade(backend, "prompt", classify, tiers)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(cascade.detect_and_classify, paths))
+    seconds = time.perf_counter() - started
+    stats = cascade.stats()
+    clear = sum(1 for result in results if result.get("caption") == CLEAR_CAPTION)
+    print(f"  {name:<22}: {len(paths) / seconds:6.1f} images/s  {stats['requests_per_image']:.2f} requests/image  "
+          f"{stats['mean_bytes_per_image'] / 1024:6.1f} KB/image  {stats['mean_latency_per_image_seconds']:.3f} s/image  "
+          f"read correctly {clear / len(paths):.1%}")
+    return cascade
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resolution cascade against a simulated size-sensitive API")
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--needs-medium", type=float, default=0.2, help="share of images unreadable below 512px")
+    parser.add_argument("--needs-large", type=float, default=0.05, help="share of images unreadable below 1024px")
+    parser.add_argument("--base-latency", type=float, default=0.15)
+    parser.add_argument("--uplink-mbps", type=float, default=8.0)
+    parser.add_argument("--seconds-per-megapixel", type=float, default=0.4)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    folder = os.path.join(tempfile.gettempdir(), f"moondream_bench_cascade_{args.images}")
+    paths = make_synthetic_folder(folder, args.images, size=(2000, 1500))
+    rng = np.random.default_rng(1)
+    draws = rng.random(len(paths))
+    required_sizes = []
+    for path, draw in zip(paths, draws):
+        size = 1024 if draw < args.needs_large else 512 if draw < args.needs_large + args.needs_medium else 256
+        required_sizes.append((mean_colour(Image.open(path)), size))
+
+    from waste_moondream.classifier import classify_caption
+    backend = SimulatedBackend(required_sizes, args.base_latency, args.uplink_mbps * 1e6 / 8, args.seconds_per_megapixel)
+    print(f"{len(paths)} images: {args.needs_medium:.0%} need 512px, {args.needs_large:.0%} need 1024px")
+    run("512px only (scripts)", paths, backend, [(512, 85)], classify_caption, args.workers)
+    run("1024px only", paths, backend, [(1024, 90)], classify_caption, args.workers)
+    cascade = run("cascade", paths, backend, CASCADE_TIERS, classify_caption, args.workers)
+    print()
+    print(cascade.summary())
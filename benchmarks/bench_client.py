@@ -0,0 +1,66 @@
+import argparse
+import base64
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.moondream_client import MoondreamClient, build_payload
+from stub_server import start_stub_server
+
+PROMPT = "List the visible waste items grouped by material: paper, plastic, metal, and glass."
+
+
+# Previous behaviour: a fresh requests.post (new connection) per image, 100 threads
+def run_thread_pool(url, images_b64, max_workers=100):
+    def post(image_b64):
+        response = requests.post(url, headers={"Authorization": "Bearer test"}, json=build_payload(image_b64, PROMPT))
+        return response.json()["choices"][0]["message"]["content"]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(post, images_b64))
+
+
+def run_client(url, images_b64, max_concurrency):
+    client = MoondreamClient("test", api_url=url, max_concurrency=max_concurrency, adaptive=False)
+    try:
+        return client.caption_many(images_b64, PROMPT)
+    finally:
+        client.close()
+
+
+def report(name, seconds, results, count):
+    failed = sum(1 for result in results if not result)
+    print(f"  {name:<32}: {seconds:6.2f}s  {count / seconds:8.1f} images/s  failed={failed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the pooled async client with the thread pool")
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--payload-kb", type=int, default=60, help="size of the fake base64 image")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub server latency in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[32, 100])
+    args = parser.parse_args()
+
+    image_b64 = base64.b64encode(os.urandom(args.payload_kb * 768)).decode("ascii")
+    images_b64 = [image_b64] * args.images
+
+    process, url = start_stub_server(latency=args.latency)
+    try:
+        print(f"{args.images} images, {len(image_b64) // 1024} KB payload, {args.latency * 1000:.0f} ms stub latency")
+
+        start = time.perf_counter()
+        results = run_thread_pool(url, images_b64)
+        report("ThreadPoolExecutor(100) + post", time.perf_counter() - start, results, args.images)
+
+        for max_concurrency in args.concurrency:
+            start = time.perf_counter()
+            results = run_client(url, images_b64, max_concurrency)
+            report(f"MoondreamClient(concurrency={max_concurrency})", time.perf_counter() - start, results, args.images)
+    finally:
+        process.terminate()
@@ -0,0 +1,36 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.multithreding import encode_image_screened
+from waste_moondream.pipeline import discover_images, encode_images, encode_images_parallel
+from synthetic_images import make_synthetic_folder
+
+
+def run(name, folder, stage):
+    start = time.perf_counter()
+    count = sum(1 for _, image_data, _ in stage(discover_images(folder)) if image_data)
+    seconds = time.perf_counter() - start
+    print(f"  {name:<28}: {seconds:6.2f}s  {count / seconds:6.1f} images/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encode stage throughput on a synthetic folder of large JPEGs")
+    parser.add_argument("--folder", default=os.path.join(tempfile.gettempdir(), "moondream_bench_large"))
+    parser.add_argument("--count", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    make_synthetic_folder(args.folder, args.count)
+    print(f"{args.count} images of 4000x3000 in {args.folder}, {args.workers} workers ({os.cpu_count()} cores)")
+
+    run("inline (previous)", args.folder, lambda images: encode_images(images, encode_image_screened))
+    run("thread pool", args.folder,
+        lambda images: encode_images_parallel(images, encode_image_screened, args.workers, use_processes=False))
+    run("process pool", args.folder,
+        lambda images: encode_images_parallel(images, encode_image_screened, args.workers, use_processes=True))
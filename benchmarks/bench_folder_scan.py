@@ -0,0 +1,79 @@
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.folder_scanner import IMAGE_EXTENSIONS, Manifest, scan_images
+
+
+# `count` empty .jpg files spread over subfolders of `per_folder` files
+def make_tree(root, count, per_folder=5000):
+    for index in range(count):
+        folder = os.path.join(root, f"site-{index // per_folder:03d}")
+        if index % per_folder == 0:
+            os.makedirs(folder, exist_ok=True)
+        open(os.path.join(folder, f"IMG-20250410-WA{index:07d}.jpg"), "wb").close()
+
+
+# Previous discovery: list the folder, then one checkpoint query per file
+# (top-level only, so it is run on every subfolder to make it comparable)
+def listdir_scan(root, db):
+    pending = []
+    for folder in sorted(os.listdir(root)):
+        folder_path = os.path.join(root, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        files = [f for f in os.listdir(folder_path) if f.lower().endswith(IMAGE_EXTENSIONS)]
+        for name in files:
+            if db.execute("SELECT 1 FROM done WHERE name = ?", (f"{folder}/{name}",)).fetchone() is None:
+                pending.append(name)
+    return pending
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental folder discovery: scandir + manifest vs listdir")
+    parser.add_argument("--count", type=int, default=500000)
+    parser.add_argument("--new", type=int, default=10, help="files added after the previous run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        images = os.path.join(root, "images")
+        make_tree(images, args.count)
+
+        # The previous run processed every file
+        manifest = Manifest(os.path.join(root, "manifest.sqlite"))
+        done = sqlite3.connect(os.path.join(root, "done.sqlite"))
+        done.execute("CREATE TABLE done (name TEXT PRIMARY KEY)")
+        for entry in scan_images(images):
+            manifest.record(entry)
+            done.execute("INSERT INTO done (name) VALUES (?)", (entry.name,))
+        manifest.commit()
+        done.commit()
+
+        # New files land in the first folder, as a new day of photos would
+        for index in range(args.new):
+            open(os.path.join(images, "site-000", f"IMG-20250411-WA{index:07d}.jpg"), "wb").close()
+        print(f"{args.count} processed images in {len(os.listdir(images))} folders, {args.new} new")
+
+        start = time.perf_counter()
+        pending = listdir_scan(images, done)
+        listdir_seconds = time.perf_counter() - start
+        print(f"  listdir + per-file checkpoint : {listdir_seconds:.2f}s to the first image, "
+              f"{len(pending)} pending")
+
+        start = time.perf_counter()
+        first = None
+        pending = 0
+        for _ in manifest.changed(scan_images(images)):
+            if first is None:
+                first = time.perf_counter() - start
+            pending += 1
+        scan_seconds = time.perf_counter() - start
+        print(f"  scandir + manifest            : {first:.3f}s to the first image, "
+              f"{scan_seconds:.2f}s for the whole scan, {pending} pending")
+        manifest.close()
@@ -0,0 +1,95 @@
+import argparse
+import os
+import random
+import sys
+import time
+from difflib import get_close_matches
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream import classifier
+from waste_moondream.fuzzy_index import FUZZY_CUTOFF, FuzzyIndex
+
+FILLERS = ["crushed", "small", "dirty", "large", "blue", "white", "torn", "empty", "broken", "used", "pile of"]
+# Labels that belong to no category; the right answer is "no match"
+OTHER = ["rubble", "stone", "wood", "leaves", "food waste", "soil", "rope", "shoe", "textile", "brick", "cigarette"]
+
+
+def misspell(word, rng):
+    if len(word) < 4:
+        return word
+    position = rng.randrange(1, len(word) - 1)
+    edit = rng.randrange(3)
+    if edit == 0:
+        return word[:position] + word[position + 1:]
+    if edit == 1:
+        return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    return word[:position] + rng.choice("aeiou") + word[position:]
+
+
+# (label, expected category or None) in the shapes captions use: plurals,
+# adjectives, typos and unrelated objects
+def labeled_sample(categories, count, seed=0):
+    rng = random.Random(seed)
+    keys = list(categories)
+    sample = []
+    for _ in range(count):
+        if rng.random() < 0.15:
+            sample.append((" ".join([rng.choice(FILLERS), rng.choice(OTHER)]), None))
+            continue
+        key = rng.choice(keys)
+        label = key
+        if rng.random() < 0.5:
+            label += "es" if label.endswith(("x", "s", "sh")) else "s"
+        if rng.random() < 0.3:
+            label = misspell(label, rng)
+        if rng.random() < 0.5:
+            label = rng.choice(FILLERS) + " " + label
+        sample.append((label, categories[key]))
+    return sample
+
+
+def difflib_match(keys, label):
+    match = get_close_matches(label, keys, n=1, cutoff=0.3)
+    return match[0] if match else None
+
+
+def accuracy(predicted, sample, categories):
+    correct = sum(1 for key, (_, expected) in zip(predicted, sample)
+                  if (categories[key] if key else None) == expected)
+    return correct / len(sample)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FuzzyIndex against difflib.get_close_matches")
+    parser.add_argument("--labels", type=int, default=100000)
+    parser.add_argument("--sample", type=int, default=5000, help="labeled labels for the accuracy check")
+    parser.add_argument("--cutoff", type=float, default=FUZZY_CUTOFF)
+    args = parser.parse_args()
+
+    categories = classifier.category_by_key
+    keys = classifier.category_keys
+    index = FuzzyIndex(keys)
+
+    corpus = [label for label, _ in labeled_sample(categories, args.labels, seed=1)]
+    print(f"{len(keys)} keys, {len(corpus)} labels")
+
+    start = time.perf_counter()
+    difflib_keys = [difflib_match(keys, label) for label in corpus]
+    difflib_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index_keys = [key for key, _ in index.match_batch(corpus, args.cutoff)]
+    index_seconds = time.perf_counter() - start
+
+    print(f"  difflib      : {difflib_seconds:.3f}s ({len(corpus) / difflib_seconds:,.0f} labels/s)")
+    print(f"  FuzzyIndex   : {index_seconds:.3f}s ({len(corpus) / index_seconds:,.0f} labels/s)")
+    print(f"  speedup      : {difflib_seconds / index_seconds:.1f}x")
+    print(f"  same key     : {sum(a == b for a, b in zip(difflib_keys, index_keys)) / len(corpus):.1%}")
+
+    sample = labeled_sample(categories, args.sample, seed=2)
+    labels = [label for label, _ in sample]
+    print(f"accuracy on {len(sample)} labeled labels (category, or no match for unrelated objects):")
+    print(f"  difflib      : {accuracy([difflib_match(keys, label) for label in labels], sample, categories):.1%}")
+    print(f"  FuzzyIndex   : {accuracy([key for key, _ in index.match_batch(labels, args.cutoff)], sample, categories):.1%}")
@@ -0,0 +1,63 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.image_encoding import encode_jpeg
+from synthetic_images import make_synthetic_folder
+
+
+# Previous encode_image: full-resolution decode, RGB convert, then thumbnail
+def encode_previous(image_path, max_size, quality):
+    image = Image.open(image_path).convert("RGB")
+    image.thumbnail(max_size)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def measure(paths, encode, max_size, quality):
+    times, sizes = [], []
+    for path in paths:
+        start = time.perf_counter()
+        data = encode(path, max_size, quality)
+        times.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(data))
+    return statistics.mean(times), statistics.mean(sizes) / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode time and payload size before/after the draft-mode path")
+    parser.add_argument("--folder", default=os.path.join(tempfile.gettempdir(), "moondream_bench_large"))
+    parser.add_argument("--count", type=int, default=20)
+    args = parser.parse_args()
+
+    paths = make_synthetic_folder(args.folder, args.count)
+    source_kb = statistics.mean(os.path.getsize(path) for path in paths) / 1024
+    print(f"{len(paths)} images of 4000x3000, {source_kb:.0f} KB average on disk")
+
+    configs = [
+        ("main.py / multithreding.py", (512, 512), 85, 85),
+        ("main - v2.py", (800, 800), 95, 95),
+        ("main - v2.py, new default quality", (800, 800), 95, 85),
+    ]
+    for name, max_size, old_quality, new_quality in configs:
+        old_ms, old_kb = measure(paths, encode_previous, max_size, old_quality)
+        new_ms, new_kb = measure(paths, encode_jpeg, max_size, new_quality)
+        print(f"  {name} {max_size[0]}px q{old_quality} -> q{new_quality}")
+        print(f"    before: {old_ms:7.1f} ms/image  {old_kb:6.1f} KB payload")
+        print(f"    after : {new_ms:7.1f} ms/image  {new_kb:6.1f} KB payload  "
+              f"({old_ms / new_ms:.1f}x faster, {old_kb - new_kb:+.1f} KB saved per image, "
+              f"{source_kb - new_kb:.0f} KB below the source file)")
+
+    stats = {}
+    encode_jpeg(paths[0], (512, 512), 85, stats=stats)
+    print(f"  per-image stats for {os.path.basename(paths[0])}: {stats}")
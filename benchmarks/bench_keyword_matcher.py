@@ -0,0 +1,91 @@
+import importlib
+import importlib.util
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# Load one of the scripts as a module (v2 has a space in its file name)
+def load_script(file_name, module_name):
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Previous behaviour: first keyword in dict order that is a substring of the label
+def first_match(categories, label):
+    for keyword, category in categories.items():
+        if keyword in label:
+            return category
+    return None
+
+
+# Same loop, but scanning every keyword to apply the longest-match rule
+# (ties go to the leftmost occurrence, like KeywordMatcher)
+def longest_match(categories, label):
+    best = None
+    for keyword in categories:
+        position = label.find(keyword)
+        if position >= 0 and (best is None or (len(keyword), -position) > (len(best[0]), -best[1])):
+            best = (keyword, position)
+    return categories[best[0]] if best else None
+
+
+def make_labels(categories, count, seed=0):
+    rng = random.Random(seed)
+    keywords = list(categories)
+    fillers = ["crushed", "small", "dirty", "large", "blue", "white", "torn", "empty", "pile of", "some"]
+    labels = []
+    for _ in range(count):
+        parts = [rng.choice(fillers), rng.choice(keywords)]
+        if rng.random() < 0.3:
+            parts.append(rng.choice(keywords))
+        if rng.random() < 0.1:
+            parts = [rng.choice(fillers), "rubble"]
+        labels.append(" ".join(parts))
+    return labels
+
+
+def timed(function, labels):
+    start = time.perf_counter()
+    results = [function(label) for label in labels]
+    return time.perf_counter() - start, results
+
+
+def bench(name, categories, matcher, labels):
+    print(f"{name}: {len(categories)} keywords, {len(labels)} labels")
+
+    first_seconds, first = timed(lambda label: first_match(categories, label), labels)
+    longest_seconds, longest = timed(lambda label: longest_match(categories, label), labels)
+
+    matcher.best_keyword.cache_clear()
+    cold_seconds, compiled = timed(matcher.match, labels)
+    warm_seconds, _ = timed(matcher.match, labels)
+
+    for title, seconds in [("first-match loop", first_seconds), ("longest-match loop", longest_seconds),
+                           ("matcher (cold)", cold_seconds), ("matcher (warm)", warm_seconds)]:
+        print(f"  {title:<20}: {seconds:.3f}s ({len(labels) / seconds:,.0f} labels/s)")
+
+    mismatches = sum(1 for a, b in zip(longest, compiled) if a != b)
+    changed = sum(1 for a, b in zip(first, compiled) if a != b)
+    print(f"  disagreements with longest-match loop: {mismatches}")
+    print(f"  labels whose category changed from the first-match rule: {changed}")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for file_name, module_name in [("main.py", "main_v1"), ("main - v2.py", "main_v2"), ("waste_moondream.classifier", None)]:
+        if module_name is None:
+            module = importlib.import_module(file_name)
+        else:
+            module = load_script(file_name, module_name)
+        unique = make_labels(module.categories, count)
+        # Stored captions draw from a small vocabulary of labels
+        repeated = random.Random(1).choices(unique[:2000], k=count)
+        bench(f"{file_name} (unique labels)", module.categories, module.matcher, unique)
+        bench(f"{file_name} (repeated labels)", module.categories, module.matcher, repeated)
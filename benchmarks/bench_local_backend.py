@@ -0,0 +1,37 @@
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.backends import LocalMoondreamBackend, OnnxRunner, TransformersRunner
+from waste_moondream.image_encoding import encode_jpeg
+from synthetic_images import make_synthetic_folder
+
+PROMPT = "List the visible waste items grouped by material: paper, plastic, metal, and glass."
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Images/sec and latency of the local CPU backend")
+    parser.add_argument("--folder", default=os.path.join(tempfile.gettempdir(), "moondream_bench_local"))
+    parser.add_argument("--count", type=int, default=16)
+    parser.add_argument("--runtime", choices=["transformers", "onnx"], default="transformers")
+    parser.add_argument("--no-quantize", action="store_true", help="keep float32 Linear layers")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    paths = make_synthetic_folder(args.folder, args.count, size=(1600, 1200))
+    images = [encode_jpeg(path) for path in paths]
+
+    if args.runtime == "onnx":
+        runner = OnnxRunner()
+    else:
+        runner = TransformersRunner(quantize=not args.no_quantize)
+
+    for batch_size in args.batch_sizes:
+        backend = LocalMoondreamBackend(runner, batch_size=batch_size)
+        backend.caption_many(images, PROMPT)
+        print(f"batch size {batch_size}: {backend.stats()}")
+        backend.close()
@@ -0,0 +1,61 @@
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.moondream_client import build_payload, build_payload_body
+
+PROMPT = "List the visible waste items grouped by material: paper, plastic, metal, and glass."
+
+
+# Previous path: base64 bytes -> str -> data URL f-string -> json.dumps -> encode
+# (what requests does with json=payload). Each in-flight request keeps the
+# base64 string, the payload dict with its data URL and the encoded body.
+def previous_request(jpeg_bytes):
+    image_b64 = base64.b64encode(jpeg_bytes).decode("utf-8")
+    payload = build_payload(image_b64, PROMPT)
+    body = json.dumps(payload).encode("utf-8")
+    return image_b64, payload, body
+
+
+# New path: the JPEG bytes are streamed into one preallocated body buffer
+def new_request(jpeg_bytes):
+    return jpeg_bytes, build_payload_body(jpeg_bytes, PROMPT)
+
+
+def measure(name, build, images):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    in_flight = [build(jpeg_bytes) for jpeg_bytes in images]
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del in_flight
+    kb = 1024
+    print(f"  {name:<22}: peak {(peak - baseline) / kb / kb:7.2f} MB  "
+          f"held {(current - baseline) / kb / kb:7.2f} MB  build {seconds * 1000:6.1f} ms")
+    return peak - baseline
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="tracemalloc comparison of request body construction")
+    parser.add_argument("--workers", type=int, default=100, help="requests held in flight at once")
+    parser.add_argument("--image-kb", type=int, default=300, help="encoded JPEG size")
+    args = parser.parse_args()
+
+    # Distinct buffers, as each worker has its own image
+    images = [os.urandom(args.image_kb * 1024) for _ in range(args.workers)]
+    print(f"{args.workers} in-flight requests with {args.image_kb} KB JPEGs "
+          f"({args.workers * args.image_kb / 1024:.1f} MB of image data, not counted below)")
+
+    old_peak = measure("previous (json=payload)", previous_request, images)
+    new_peak = measure("preallocated body", new_request, images)
+    print(f"  peak reduction: {old_peak / new_peak:.1f}x")
@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.prefilter import image_measures, rejection_reasons
+
+
+# A cluttered scene: flat shapes over a background, with sensor noise
+def scene(rng, size=(512, 384)):
+    image = Image.new("RGB", size, tuple(int(value) for value in rng.integers(60, 200, 3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = int(rng.integers(0, size[0])), int(rng.integers(0, size[1]))
+        width, height = (int(value) for value in rng.integers(10, 120, 2))
+        shape = draw.ellipse if rng.random() < 0.5 else draw.rectangle
+        shape([x, y, x + width, y + height], fill=tuple(int(value) for value in rng.integers(0, 255, 3)))
+    pixels = np.asarray(image).astype(np.int16) + rng.normal(0, 6, (size[1], size[0], 3)).astype(np.int16)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+# A chat screenshot: white background, a header bar, text and bubbles
+def screenshot(size=(384, 512)):
+    image = Image.new("RGB", size, (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 0, size[0], 40], fill=(18, 140, 126))
+    for line in range(10):
+        draw.rectangle([150, 55 + line * 40, size[0] - 10, 85 + line * 40], fill=(220, 248, 198))
+        draw.text((160, 62 + line * 40), f"message {line}", fill=(0, 0, 0))
+    return image
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-filter measures: speed and what they reject")
+    parser.add_argument("--images", type=int, default=400)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    kinds = {"sharp": [], "blurry": [], "dark": [], "screenshot": []}
+    for _ in range(args.images // 4):
+        image = scene(rng)
+        kinds["sharp"].append(image)
+        kinds["blurry"].append(image.filter(ImageFilter.GaussianBlur(3)))
+        kinds["dark"].append(Image.eval(image, lambda value: int(value * 0.08)))
+        kinds["screenshot"].append(screenshot())
+    arrays = [np.asarray(image) for images in kinds.values() for image in images]
+
+    started = time.process_time()
+    for pixels in arrays:
+        image_measures(pixels)
+    cpu_seconds = time.process_time() - started
+    print(f"image_measures on {len(arrays)} images of ~512x384: {len(arrays) / cpu_seconds:,.0f} images per CPU second "
+          f"({cpu_seconds / len(arrays) * 1000:.2f} ms each)")
+
+    for kind, images in kinds.items():
+        rejected = {}
+        for image in images:
+            for reason in rejection_reasons(image_measures(np.asarray(image))) or ["kept"]:
+                rejected[reason] = rejected.get(reason, 0) + 1
+        print(f"  {kind:<11}: " + ", ".join(f"{reason} {count}/{len(images)}" for reason, count in rejected.items()))
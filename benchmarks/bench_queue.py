@@ -0,0 +1,117 @@
+import argparse
+import multiprocessing
+import os
+import random
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
+from functools import partial
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.folder_scanner import ScanEntry
+from waste_moondream.work_queue import WorkQueue, run_worker
+
+LATENCY = 0.05
+# In the crash test every FLAKY_EVERY-th image fails on its first attempt
+FLAKY_EVERY = 25
+
+
+# Stands in for detect_and_classify: an API round trip of ~LATENCY seconds.
+# With `flaky` (a directory for markers), every FLAKY_EVERY-th image returns
+# an error the first time it is analyzed, like a timed-out request.
+def simulated_analyze(image_path, flaky=None):
+    time.sleep(random.lognormvariate(0, 0.3) * LATENCY)
+    if flaky and int(image_path[-10:-4]) % FLAKY_EVERY == 0:
+        marker = os.path.join(flaky, os.path.basename(image_path))
+        if not os.path.exists(marker):
+            open(marker, "w").close()
+            return {"error": "Read timed out."}
+    return {"paper": 1, "plastic": 2, "metal": 0, "glass": 1}
+
+
+def fill_queue(path, images, lease_seconds):
+    work_queue = WorkQueue(path, lease_seconds=lease_seconds)
+    work_queue.enqueue(ScanEntry(f"site-{index % 7}/IMG-20250410-WA{index:06d}.jpg", "", 1000 + index, 0)
+                       for index in range(images))
+    work_queue.close()
+
+
+def _worker(path, threads, lease_seconds, flaky):
+    sys.stdout = open(os.devnull, "w")
+    run_worker("/share", path, threads=threads, analyze=partial(simulated_analyze, flaky=flaky),
+               lease_seconds=lease_seconds)
+
+
+def start_workers(path, count, threads, lease_seconds, flaky=None):
+    workers = [multiprocessing.Process(target=_worker, args=(path, threads, lease_seconds, flaky))
+               for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+# Images per second with 1, 2, 4... worker processes on a fresh queue, from
+# the start to the last commit (workers then wait a moment for stragglers)
+def scaling(directory, images, counts, threads):
+    print(f"{'workers':>7} {'images/s':>9} {'speedup':>8} {'efficiency':>10}")
+    baseline = None
+    for count in counts:
+        path = os.path.join(directory, f"queue_{count}.sqlite")
+        fill_queue(path, images, 60)
+        started = time.time()
+        for worker in start_workers(path, count, threads, 60):
+            worker.join()
+        db = sqlite3.connect(path)
+        last_commit = db.execute("SELECT MAX(finished) FROM tasks").fetchone()[0]
+        db.close()
+        rate = images / (last_commit - started)
+        baseline = baseline or rate / count
+        print(f"{count:>7} {rate:>9.1f} {rate / baseline:>7.2f}x {rate / baseline / count:>10.0%}")
+
+
+# Kills one worker mid-run: its leases expire and the others finish its
+# images; every image must end up committed exactly once. Images whose first
+# analysis returned an error must have been retried and be done as well.
+def crash(directory, images, threads, lease_seconds=2.0):
+    path = os.path.join(directory, "queue_crash.sqlite")
+    flaky = os.path.join(directory, "flaky")
+    os.makedirs(flaky, exist_ok=True)
+    fill_queue(path, images, lease_seconds)
+    workers = start_workers(path, 4, threads, lease_seconds, flaky)
+    db = sqlite3.connect(path, timeout=60)
+    while db.execute("SELECT COUNT(*) FROM tasks WHERE state = 'done'").fetchone()[0] < images // 5:
+        time.sleep(0.05)
+    os.kill(workers[0].pid, signal.SIGKILL)
+    for worker in workers:
+        worker.join()
+
+    states = dict(db.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+    retried = db.execute("SELECT COUNT(*) FROM tasks WHERE attempts > 1").fetchone()[0]
+    errored = len(range(0, images, FLAKY_EVERY))
+    recovered = db.execute("SELECT COUNT(*) FROM tasks WHERE state = 'done' AND attempts > 1 "
+                           "AND CAST(substr(name, -10, 6) AS INTEGER) % ? = 0", (FLAKY_EVERY,)).fetchone()[0]
+    db.close()
+    done = states.get("done", 0)
+    print(f"\nKilled 1 of 4 workers at 20% (lease {lease_seconds} s): {done}/{images} images done, "
+          f"{retried} re-claimed, {recovered}/{errored} done after an error, states {states}")
+    if done != images or recovered != errored:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Work queue throughput with several worker processes")
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threads", type=int, default=8, help="requests in flight per worker")
+    parser.add_argument("--latency", type=float, default=LATENCY, help="simulated seconds per image")
+    args = parser.parse_args()
+    LATENCY = args.latency
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{args.images} images, {args.threads} threads per worker, ~{LATENCY * 1000:.0f} ms per image")
+        scaling(directory, args.images, args.workers, args.threads)
+        crash(directory, args.images, args.threads)
@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from waste_moondream.prompts import PROMPTS
+from stub_server import caption_for_prompt
+
+
+# A streaming-pipeline results file of `images` lines whose captions come
+# from `distinct` different ones (the API answers alike for alike photos)
+def write_results(path, images, distinct, seed=0):
+    rng = random.Random(seed)
+    prompts = list(PROMPTS.values())
+    captions = [caption_for_prompt(rng.choice(prompts), rng) for _ in range(distinct)]
+    with open(path, "w", encoding="utf-8") as f:
+        for index in range(images):
+            record = {"file": f"IMG-20250410-WA{index:07d}.jpg", "caption": rng.choice(captions),
+                      "paper": 0, "plastic": 0, "metal": 0, "glass": 0}
+            f.write(json.dumps(record) + "\n")
+
+
+def _peak_rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+# Runs in a child process so the peak RSS is its own
+def run_child(path, workers, chunk_size):
+    import resource
+    import time
+
+    from waste_moondream.reclassify import reclassify_file
+
+    started = time.perf_counter()
+    reclassify_file(path, workers=workers, chunk_size=chunk_size)
+    seconds = time.perf_counter() - started
+    with open(path, encoding="utf-8") as f:
+        images = sum(1 for _ in f)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(json.dumps({"captions_per_second": round(images / seconds), "peak_rss_mb": round(_peak_rss_kb() / 1024, 1),
+                      "worker_peak_rss_mb": round(children / 1024, 1)}))
+
+
+def measure(path, workers, chunk_size, memo=True):
+    env = dict(os.environ, **({} if memo else {"MOONDREAM_RECLASSIFY_MEMO_SIZE": "0"}))
+    completed = subprocess.run([sys.executable, __file__, "--child", path, str(workers), str(chunk_size)],
+                               capture_output=True, text=True, check=True, env=env)
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        run_child(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description="Reclassify throughput and memory on generated captions")
+    parser.add_argument("--images", type=int, default=200000)
+    parser.add_argument("--distinct", type=int, default=5000, help="different captions among the images")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'images':>9} {'workers':>7} {'memo':>5} {'captions/s':>11} {'peak RSS':>9} {'worker RSS':>10}")
+        for images in (args.images // 4, args.images):
+            path = os.path.join(directory, f"waste_results_{images}.jsonl")
+            write_results(path, images, args.distinct)
+            runs = [(workers, True) for workers in dict.fromkeys(args.workers)] + [(args.workers[0], False)]
+            for workers, memo in runs:
+                result = measure(path, workers, args.chunk_size, memo)
+                print(f"{images:>9} {workers:>7} {'on' if memo else 'off':>5} {result['captions_per_second']:>11,} "
+                      f"{result['peak_rss_mb']:>6} MB {result['worker_peak_rss_mb']:>7} MB")
@@ -0,0 +1,75 @@
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from waste_moondream.classifier import CATEGORY_FIELDS
+from waste_moondream.results_store import load_results, parse_image_timestamp, totals_by, write_results_table
+
+CAPTION = "Paper: cardboard box, newspaper\nPlastic: 2 plastic bottles, bag\nMetal: soda can\nGlass: None"
+
+
+# `folders` site folders of `images` results each, saved both the way
+# process_folder_parallel saves them (indented JSON) and as result tables
+def make_sites(root, folders, images, seed=0):
+    rng = random.Random(seed)
+    first_day = date(2025, 1, 1)
+    for site in range(folders):
+        folder = os.path.join(root, f"site-{site:03d}")
+        os.makedirs(folder)
+        results = {}
+        for index in range(images):
+            day = first_day + timedelta(days=rng.randrange(120))
+            results[f"IMG-{day:%Y%m%d}-WA{index:04d}.jpg"] = {
+                "caption": CAPTION, **{category: rng.randrange(6) for category in CATEGORY_FIELDS}}
+        with open(os.path.join(folder, "waste_results_parallel.json"), "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+        write_results_table(os.path.join(folder, "waste_results_parallel.arrows"), os.path.basename(folder), results)
+
+
+# Previous way: load every JSON file into dicts and sum per day in Python
+def plastic_per_day_json(root):
+    totals = defaultdict(int)
+    for path in glob.glob(os.path.join(root, "*", "waste_results_parallel.json")):
+        with open(path, encoding="utf-8") as f:
+            for name, result in json.load(f).items():
+                timestamp = parse_image_timestamp(name)
+                totals[timestamp.date() if timestamp else None] += result.get("plastic", 0)
+    return dict(totals)
+
+
+def plastic_per_day_table(root):
+    table = totals_by(load_results(root, columns=["timestamp", "plastic"]), "day")
+    return dict(zip(table["day"].to_pylist(), table["plastic"].to_pylist()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Total plastic per day across site folders: JSON vs result tables")
+    parser.add_argument("--folders", type=int, default=200)
+    parser.add_argument("--images", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        make_sites(root, args.folders, args.images)
+        print(f"{args.folders} folders x {args.images} images")
+
+        start = time.perf_counter()
+        from_json = plastic_per_day_json(root)
+        json_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        from_table = plastic_per_day_table(root)
+        table_seconds = time.perf_counter() - start
+
+        print(f"  JSON files   : {json_seconds:.3f}s")
+        print(f"  result tables: {table_seconds:.3f}s ({json_seconds / table_seconds:.1f}x)")
+        print(f"  same totals  : {from_json == from_table}")
@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+import aiohttp
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_server import free_port, start_stub_server
+
+
+def make_uploads(count, size=(1280, 960), seed=0):
+    rng = np.random.default_rng(seed)
+    uploads = []
+    for _ in range(count):
+        pixels = rng.integers(0, 255, size=(size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+        image = Image.fromarray(pixels, "RGB").resize(size)
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=85)
+        uploads.append(buffer.getvalue())
+    return uploads
+
+
+def start_service(port, upstream_url):
+    env = dict(os.environ, MOONDREAM_API_URL=upstream_url, MOONDREAM_API_KEY="bench", MOONDREAM_CACHE="0")
+    process = subprocess.Popen([sys.executable, "-m", "waste_moondream.service", "--port", str(port)], cwd=ROOT,
+                               env=env, stdout=subprocess.DEVNULL)
+    return process
+
+
+async def wait_ready(session, base_url):
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            async with session.get(base_url + "/health") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("service did not start")
+
+
+def percentiles(latencies):
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return f"p50 {pick(0.5):7.1f} ms  p95 {pick(0.95):7.1f} ms  p99 {pick(0.99):7.1f} ms"
+
+
+async def single_load(session, base_url, uploads, requests, concurrency, seed=0):
+    rng = random.Random(seed)
+    picks = [rng.choice(uploads) for _ in range(requests)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses, coalesced = [], {}, 0
+
+    async def one(data):
+        nonlocal coalesced
+        async with semaphore:
+            started = time.perf_counter()
+            async with session.post(base_url + "/classify", data=data,
+                                    headers={"Content-Type": "image/jpeg"}) as response:
+                await response.read()
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+                coalesced += response.headers.get("x-coalesced") == "1"
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(data) for data in picks))
+    return time.perf_counter() - started, latencies, statuses, coalesced
+
+
+async def batch_load(session, base_url, uploads, batches, batch_size, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(index):
+        form = aiohttp.FormData()
+        for offset in range(batch_size):
+            data = uploads[(index * batch_size + offset) % len(uploads)]
+            form.add_field("images", data, filename=f"IMG-{index:04d}-{offset}.jpg", content_type="image/jpeg")
+        async with semaphore:
+            started = time.perf_counter()
+            async with session.post(base_url + "/classify/batch", data=form) as response:
+                body = await response.json()
+                assert len(body["results"]) == batch_size
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(batches)))
+    return time.perf_counter() - started, latencies
+
+
+async def main(args):
+    stub, upstream_url = start_stub_server(args.latency)
+    port = free_port()
+    service = start_service(port, upstream_url)
+    base_url = f"http://127.0.0.1:{port}"
+    uploads = make_uploads(args.distinct)
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+            await wait_ready(session, base_url)
+            print(f"upstream latency {args.latency * 1000:.0f} ms, {args.distinct} distinct images, "
+                  f"concurrency {args.concurrency}")
+
+            seconds, latencies, statuses, coalesced = await single_load(
+                session, base_url, uploads, args.requests, args.concurrency)
+            print(f"  POST /classify x {args.requests}: {args.requests / seconds:7.1f} req/s  {percentiles(latencies)}"
+                  f"  statuses {statuses}  coalesced {coalesced}")
+
+            seconds, latencies = await batch_load(session, base_url, uploads, args.batches, args.batch_size,
+                                                  args.concurrency)
+            print(f"  POST /classify/batch x {args.batches} ({args.batch_size} images): "
+                  f"{args.batches * args.batch_size / seconds:7.1f} images/s  {percentiles(latencies)}")
+
+            async with session.get(base_url + "/metrics?format=json") as response:
+                server = await response.json()
+            upstream = sum(value for name, value in server["counters"].items() if name.startswith("http_responses"))
+            images = args.requests + args.batches * args.batch_size
+            print(f"  upstream calls: {upstream} for {images} images "
+                  f"(max {server['in_flight'].get('http', {}).get('max')} in flight)")
+            for stage in ("service_classify", "service_classify_batch", "http"):
+                entry = server["stages"].get(stage)
+                if entry:
+                    print(f"  server {stage:<24}: p50 {entry['p50_seconds'] * 1000:7.1f} ms  "
+                          f"p95 {entry['p95_seconds'] * 1000:7.1f} ms  p99 {entry['p99_seconds'] * 1000:7.1f} ms")
+    finally:
+        service.terminate()
+        service.wait()
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of service.py against a stub Moondream API")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--distinct", type=int, default=100, help="distinct images; the rest are re-uploads")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub upstream latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,58 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = [
+    ("python (empty)", ["-c", "pass"]),
+    ("cli --help", ["-m", "waste_moondream.cli", "--help"]),
+    ("cli reclassify --help", ["-m", "waste_moondream.cli", "reclassify", "--help"]),
+    ("import classifier", ["-c", "import waste_moondream.classifier"]),
+    ("import multithreding (scripts)", ["-c", "import waste_moondream.multithreding"]),
+]
+
+
+def wall_time(arguments, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *arguments], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+# Modules with the largest cumulative import time, from `python -X importtime`,
+# down to the modules imported directly by a top-level one
+def slowest_imports(arguments, count):
+    completed = subprocess.run([sys.executable, "-X", "importtime", *arguments], cwd=ROOT, capture_output=True,
+                               text=True, check=True)
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            rows.append((int(cumulative), "  " * depth + name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start-up time of the CLI against importing the scripts")
+    parser.add_argument("--runs", type=int, default=15)
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    for name, arguments in COMMANDS:
+        print(f"  {name:<32}: {wall_time(arguments, args.runs):7.1f} ms (median of {args.runs})")
+
+    for name, arguments in (("cli --help", ["-m", "waste_moondream.cli", "--help"]),
+                            ("import multithreding", ["-c", "import waste_moondream.multithreding"])):
+        print(f"\nslowest top-level imports, {name}:")
+        for cumulative, module in slowest_imports(arguments, args.top):
+            print(f"  {module:<32}: {cumulative / 1000:7.1f} ms")
@@ -0,0 +1,227 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from stub_server import start_stub_server
+from synthetic_images import make_synthetic_folder
+
+MODES = ("sequential", "parallel", "streaming")
+
+# (metric, True when higher is better) compared against a baseline
+COMPARED = (("images_per_second", True), ("caption_p50_ms", False), ("caption_p95_ms", False),
+            ("caption_p99_ms", False), ("cpu_ms_per_image", False), ("peak_rss_mb", False))
+
+
+def _load_script(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Results written by each mode, as {file: result}
+def _read_results(mode, folder_path):
+    if mode == "streaming":
+        results = {}
+        with open(os.path.join(folder_path, "waste_results_stream.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                results[record.pop("file")] = record
+        return results
+    name = "waste_results.json" if mode == "sequential" else "waste_results_parallel.json"
+    with open(os.path.join(folder_path, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Peak RSS of this process in KB. ru_maxrss survives exec on Linux, so it
+# would report the parent's peak; VmHWM belongs to this process only.
+def _peak_rss_kb(usage):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return usage.ru_maxrss if sys.platform != "darwin" else usage.ru_maxrss // 1024
+
+
+# Runs one mode in this (child) process and writes its measurements to
+# `output_path`. stdout is discarded by the parent.
+def run_mode(mode, folder_path, workers, output_path):
+    from waste_moondream.metrics import metrics
+
+    started = time.perf_counter()
+    if mode == "sequential":
+        _load_script(os.path.join(ROOT, "main - v2.py"), "main_v2").process_folder(folder_path)
+    else:
+        from waste_moondream import multithreding
+        if mode == "parallel":
+            multithreding.process_folder_parallel(folder_path, max_workers=workers)
+        else:
+            multithreding.process_folder_streaming(folder_path, max_in_flight=workers)
+    seconds = time.perf_counter() - started
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    results = _read_results(mode, folder_path)
+    failed = sum(1 for result in results.values() if "error" in result)
+    report = metrics.to_dict()
+    caption = report["stages"].get("caption", {})
+    measured = {
+        "images": len(results),
+        "failed": failed,
+        "seconds": round(seconds, 3),
+        "images_per_second": round(len(results) / seconds, 2),
+        "cpu_seconds": round(own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime, 3),
+        "peak_rss_mb": round(max(_peak_rss_kb(own), children.ru_maxrss) / 1024, 1),
+        "http": {name: value for name, value in report["counters"].items()
+                 if name.startswith(("http_responses", "retries"))},
+        "max_in_flight": report["in_flight"].get("http", {}).get("max"),
+    }
+    measured["cpu_ms_per_image"] = round(measured["cpu_seconds"] * 1000 / max(len(results), 1), 2)
+    for quantile in ("p50", "p95", "p99"):
+        measured[f"caption_{quantile}_ms"] = round(caption.get(f"{quantile}_seconds", 0) * 1000, 1)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(measured, f)
+
+
+# A fresh copy of the image folder (hard links when possible), so the
+# incremental manifests of earlier runs never skip images
+def fresh_folder(source, parent):
+    folder_path = tempfile.mkdtemp(dir=parent)
+    for name in os.listdir(source):
+        try:
+            os.link(os.path.join(source, name), os.path.join(folder_path, name))
+        except OSError:
+            shutil.copy(os.path.join(source, name), folder_path)
+    return folder_path
+
+
+def measure(mode, source, args, work_dir):
+    stub, url = start_stub_server(args.latency, retry_after=args.retry_after, jitter=args.jitter,
+                                  error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    folder_path = fresh_folder(source, work_dir)
+    output_path = os.path.join(work_dir, f"{mode}.json")
+    env = dict(os.environ, MOONDREAM_API_URL=url, MOONDREAM_API_KEY="bench", MOONDREAM_CACHE="0")
+    try:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, folder_path, str(args.workers),
+                        output_path], env=env, stdout=subprocess.DEVNULL, check=True)
+    finally:
+        stub.terminate()
+        shutil.rmtree(folder_path, ignore_errors=True)
+    with open(output_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# {(mode, metric): (baseline, current, change)} for every metric that got
+# worse than the baseline by more than `tolerance` (a fraction)
+def regressions(baseline, current, tolerance):
+    found = {}
+    for mode, measured in current["modes"].items():
+        previous = baseline.get("modes", {}).get(mode)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED:
+            old, new = previous.get(metric), measured.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                found[(mode, metric)] = (old, new, change)
+    return found
+
+
+def print_report(current, baseline=None):
+    header = f"{'mode':<11} {'images/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'cpu ms/img':>10} {'rss MB':>7}  failed"
+    print(header)
+    for mode, measured in current["modes"].items():
+        print(f"{mode:<11} {measured['images_per_second']:>9.2f} {measured['caption_p50_ms']:>8.1f} "
+              f"{measured['caption_p95_ms']:>8.1f} {measured['caption_p99_ms']:>8.1f} "
+              f"{measured['cpu_ms_per_image']:>10.2f} {measured['peak_rss_mb']:>7.1f}  "
+              f"{measured['failed']}/{measured['images']}")
+        if baseline and mode in baseline.get("modes", {}):
+            previous = baseline["modes"][mode]
+            print(f"{'  baseline':<11} {previous['images_per_second']:>9.2f} {previous['caption_p50_ms']:>8.1f} "
+                  f"{previous['caption_p95_ms']:>8.1f} {previous['caption_p99_ms']:>8.1f} "
+                  f"{previous['cpu_ms_per_image']:>10.2f} {previous['peak_rss_mb']:>7.1f}")
+
+
+def main(args):
+    size = (args.width, args.height)
+    source = os.path.join(tempfile.gettempdir(), f"moondream_bench_{args.images}_{args.width}x{args.height}")
+    started = time.perf_counter()
+    make_synthetic_folder(source, args.images, size, seed=args.seed)
+    print(f"{args.images} synthetic {args.width}x{args.height} images in {source} "
+          f"({time.perf_counter() - started:.1f}s)")
+    print(f"stub: latency {args.latency * 1000:.0f} ms (jitter {args.jitter}), error rate {args.error_rate}, "
+          f"429 rate {args.rate_limit_rate}, seed {args.seed}\n")
+
+    config = {key: value for key, value in vars(args).items() if key not in ("child", "output", "baseline")}
+    current = {
+        "config": config,
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "modes": {},
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for mode in args.modes:
+            current["modes"][mode] = measure(mode, source, args, work_dir)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"Note: {args.baseline} was recorded with a different configuration.\n")
+    print_report(current, baseline)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=4)
+    print(f"\nResults saved to: {args.output}")
+
+    if baseline:
+        found = regressions(baseline, current, args.tolerance)
+        for (mode, metric), (old, new, change) in found.items():
+            print(f"REGRESSION {mode} {metric}: {old} -> {new} ({change:+.1%})")
+        if found:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%}.")
+
+
+# python benchmarks/bench_suite.py --images 200 --output base.json
+# python benchmarks/bench_suite.py --images 200 --baseline base.json
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == "--child":
+        run_mode(sys.argv[2], sys.argv[3], int(sys.argv[4]), sys.argv[5])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Folder modes against a deterministic stub Moondream API")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--width", type=int, default=1600)
+    parser.add_argument("--height", type=int, default=1200)
+    parser.add_argument("--workers", type=int, default=32, help="threads / requests in flight for the parallel modes")
+    parser.add_argument("--latency", type=float, default=0.2, help="median stub latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="sigma of the log-normal stub latency")
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.02)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_suite_results.json")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown before a metric is flagged")
+    main(parser.parse_args())
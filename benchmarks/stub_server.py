@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import random
+import socket
+import time
+
+from aiohttp import web
+
+CAPTION = "paper: cardboard box, newspaper\nglass: None\nmetal: soda can\nplastic: plastic bottle, plastic bag"
+
+# Items the canned captions are drawn from, with some the taxonomy does not know
+ITEMS = {
+    "paper": ["cardboard box", "newspaper", "milk carton", "paper cup", "magazine", "paper bag"],
+    "glass": ["glass bottle", "glass jar", "broken mirror"],
+    "metal": ["soda can", "tin can", "aluminum foil", "steel wire"],
+    "plastic": ["plastic bottle", "plastic bag", "foam tray", "plastic lid", "yogurt cup", "crate"],
+    "unknown": ["banana peel", "rubber glove", "shoe"],
+}
+
+
+# Caption in the layout each script's prompt asks for:
+#   main.py         "item: quantity" lines
+#   main - v2.py    "paper: item1, item2" template lines
+#   multithreding   category headers with bullet lists
+#   anything else   the fixed CAPTION
+def caption_for_prompt(prompt, rng):
+    prompt = prompt.lower()
+    picked = {category: rng.sample(items, rng.randint(0, min(2, len(items)))) for category, items in ITEMS.items()}
+    if "estimated quantity" in prompt:
+        lines = [f"{item}: {rng.randint(1, 4)}" for items in picked.values() for item in items]
+        return "\n".join(lines) or "No clearly visible waste items."
+    if "use this exact format" in prompt:
+        return "\n".join(f"{category}: {', '.join(picked[category]) or 'None'}"
+                         for category in ("paper", "glass", "metal", "plastic"))
+    if "grouped by material" in prompt:
+        picked["plastic"] += picked.pop("unknown")
+        sections = [f"**{category.title()}:**\n" + "\n".join(f"- {rng.randint(1, 3)} {item}" for item in items)
+                    for category, items in picked.items() if items]
+        return "\n\n".join(sections) or "No waste items are visible."
+    return CAPTION
+
+
+# Local stand-in for /v1/chat/completions that answers after a fixed delay
+# plus `per_image_latency` for every attached image. Requests with several
+# images get one "Image N:" section per image.
+# With `max_in_flight` it behaves like a rate-limited API: requests beyond
+# that many concurrent ones get a 429 with a Retry-After header.
+# With `jitter` the delay is log-normal around `latency` (jitter = sigma), and
+# `error_rate` / `rate_limit_rate` answer that share of requests with a 500
+# or an immediate 429. Delays, failures and captions come from a generator
+# seeded by `seed`, the request content and how often that content was sent,
+# so a run is repeatable whatever order the requests arrive in.
+def make_app(latency, max_in_flight=None, retry_after=1, per_image_latency=0.0, jitter=0.0, error_rate=0.0,
+             rate_limit_rate=0.0, seed=0):
+    in_flight = 0
+    attempts = {}
+
+    async def chat_completions(request):
+        nonlocal in_flight
+        payload = json.loads(await request.read())
+        content = payload["messages"][0]["content"]
+        images = sum(1 for part in content if part.get("type") == "image_url")
+        prompt = "".join(part.get("text", "") for part in content if part.get("type") == "text")
+        if max_in_flight is not None and in_flight >= max_in_flight:
+            return web.json_response({"error": "rate limited"}, status=429, headers={"Retry-After": str(retry_after)})
+
+        digest = hashlib.blake2b(json.dumps(content).encode(), digest_size=16).hexdigest()
+        attempts[digest] = attempts.get(digest, 0) + 1
+        rng = random.Random(f"{seed}:{digest}:{attempts[digest]}")
+        outcome = rng.random()
+        if outcome < rate_limit_rate:
+            return web.json_response({"error": "rate limited"}, status=429, headers={"Retry-After": str(retry_after)})
+
+        delay = latency * rng.lognormvariate(0, jitter) if jitter else latency
+        in_flight += 1
+        try:
+            await asyncio.sleep(delay + per_image_latency * images)
+        finally:
+            in_flight -= 1
+        if outcome < rate_limit_rate + error_rate:
+            return web.json_response({"error": "internal error"}, status=500)
+
+        if images > 1:
+            caption = "\n\n".join(f"Image {number}:\n{caption_for_prompt(prompt, rng)}"
+                                  for number in range(1, images + 1))
+        else:
+            caption = caption_for_prompt(prompt, rng)
+        return web.json_response({"choices": [{"message": {"role": "assistant", "content": caption}}]})
+
+    app = web.Application(client_max_size=32 * 1024 * 1024)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+def serve(port, latency, max_in_flight=None, retry_after=1, per_image_latency=0.0, jitter=0.0, error_rate=0.0,
+          rate_limit_rate=0.0, seed=0):
+    app = make_app(latency, max_in_flight, retry_after, per_image_latency, jitter, error_rate, rate_limit_rate, seed)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, backlog=1024)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Start the stub in a separate process so it does not compete for our GIL.
+# Returns (process, url); terminate the process when done.
+def start_stub_server(latency=0.05, port=None, max_in_flight=None, retry_after=1, per_image_latency=0.0, jitter=0.0,
+                      error_rate=0.0, rate_limit_rate=0.0, seed=0):
+    port = port or free_port()
+    process = multiprocessing.Process(target=serve, args=(port, latency, max_in_flight, retry_after, per_image_latency,
+                                                          jitter, error_rate, rate_limit_rate, seed), daemon=True)
+    process.start()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                break
+        except OSError:
+            time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub Moondream chat completions server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before each response")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="answer 429 above this many concurrent requests")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--per-image-latency", type=float, default=0.0, help="extra seconds per attached image")
+    parser.add_argument("--jitter", type=float, default=0.0, help="sigma of the log-normal latency (0 = fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(f"Listening on http://127.0.0.1:{args.port}/v1/chat/completions")
+    serve(args.port, args.latency, args.max_in_flight, args.retry_after, args.per_image_latency, args.jitter,
+          args.error_rate, args.rate_limit_rate, args.seed)
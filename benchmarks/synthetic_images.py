@@ -0,0 +1,37 @@
+import argparse
+import os
+
+import numpy as np
+from PIL import Image
+
+
+# Writes `count` noisy JPEGs named like the WhatsApp dumps
+# (IMG-YYYYMMDD-WA0000.jpg). Noise keeps the files camera-sized instead of
+# compressing to nothing.
+def make_synthetic_folder(folder_path, count=50, size=(4000, 3000), quality=90, seed=0):
+    os.makedirs(folder_path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    width, height = size
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    paths = []
+    for index in range(count):
+        path = os.path.join(folder_path, f"IMG-202504{10 + index // 1000 % 20:02d}-WA{index % 1000:04d}.jpg")
+        if not os.path.exists(path):
+            noise = rng.normal(0, 40, size=(height // 4, width // 4, 3)).astype(np.float32)
+            noise = np.repeat(np.repeat(noise, 4, axis=0), 4, axis=1)[:height, :width]
+            tint = rng.uniform(0.3, 1.0, size=3).astype(np.float32)
+            pixels = np.clip(gradient * tint + noise, 0, 255).astype(np.uint8)
+            Image.fromarray(pixels, "RGB").save(path, format="JPEG", quality=quality)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a folder of synthetic camera-sized JPEGs")
+    parser.add_argument("folder")
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    args = parser.parse_args()
+    make_synthetic_folder(args.folder, args.count, (args.width, args.height))
+    print(f"Wrote {args.count} images to {args.folder}")
@@ -1,12 +1,15 @@
 from collections import defaultdict
-import re
-import requests
 import base64
-from PIL import Image
-from io import BytesIO
 import os
+import sys
 from dotenv import load_dotenv
 import json
+from waste_moondream.image_encoding import encode_jpeg
+from waste_moondream.keyword_matcher import KeywordMatcher
+from waste_moondream.backends import get_backend
+from waste_moondream.caption_parser import parse_caption
+from waste_moondream.prompts import QUANTITY_PROMPT
+from waste_moondream.metrics import metrics, profile_call, profile_option
 
 load_dotenv()
 
@@ -88,18 +91,19 @@ categories = {
     "food container": "Plastic",
 }
 
+# Anahtar kelime eşleştirici modül yüklenirken bir kez derlenir
+matcher = KeywordMatcher(categories)
+
 
 # Görseli küçültüp base64'e çevir
-def encode_image(image_path, max_size=(512, 512)):
+def encode_image(image_path, max_size=(512, 512), quality=85):
     try:
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Görsel dosyası bulunamadı: {image_path}")
 
-        image = Image.open(image_path).convert("RGB")
-        image.thumbnail(max_size)
-        buffered = BytesIO()
-        image.save(buffered, format="JPEG", quality=85)
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
+        image_data = encode_jpeg(image_path, max_size, quality)
+        with metrics.timer("base64"):
+            return base64.b64encode(image_data).decode("utf-8")
     except Exception as e:
         print(f"Görsel işleme hatası: {str(e)}")
         return None
@@ -107,8 +111,9 @@ def encode_image(image_path, max_size=(512, 512)):
 
 # Moondream API analiz
 def analyze_image_with_moondream(image_path):
-    api_key = os.getenv('MOONDREAM_API_KEY')
-    if not api_key:
+    # MOONDREAM_BACKEND=local ise API anahtarı gerekmez
+    backend = get_backend(os.getenv('MOONDREAM_API_KEY'))
+    if backend is None:
         print("ERROR: MOONDREAM_API_KEY NOT FOUND.")
         return None
 
@@ -116,81 +121,24 @@ def analyze_image_with_moondream(image_path):
     if not image_b64:
         return None
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-
-    payload = {
-        "model": "moondream-2B",
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_b64}"
-                        }
-                    },
-                    {
-                        "type": "text",
-                        "text": "This is a waste/trash image. Please list *unique* waste items with their *estimated quantity* only if they are clearly visible. Avoid repeating the same item multiple times. Focus on: paper, cardboard, plastic, metal, glass."
-                    }
-                ]
-            }
-        ]
-    }
-
-    try:
-        response = requests.post(
-            "https://api.moondream.ai/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
-
-        if response.status_code == 403:
-            print("ERROR: 403 - API erişim izniniz yok. Lütfen Moondream API anahtarınızı kontrol edin.")
-            return None
-        elif response.status_code != 200:
-            print(f"ERROR: {response.status_code} - {response.text}")
-            return None
-
-        result = response.json()
-        message_content = result["choices"][0]["message"]["content"]
-
-        return message_content
-    except requests.exceptions.RequestException as e:
-        print(f"API isteği hatası: {str(e)}")
-        return None
-    except ValueError as e:
-        print(f"JSON ayrıştırma hatası: {str(e)}")
-        return None
+    # API istemcisi tek bir keep-alive bağlantı havuzu kullanır
+    return backend.caption(image_b64, QUANTITY_PROMPT)
 
 
 def classify_waste_items(response_text):
-    response_text = response_text.lower()
     waste_count = defaultdict(int)
 
-    # "item: quantity" formatını yakala (örnek: "plastic bottles: 20")
-    items = re.findall(r'([^:,\n]+):\s*(\d+)', response_text)
-
-    for label, quantity in items:
-        label = label.strip()
-        quantity = int(quantity)
-
-        # Kategori eşleştirme
-        matched_category = None
-        for keyword, category in categories.items():
-            if keyword in label:
-                matched_category = category
-                break
+    # Yanıt tek geçişte ayrıştırılır ("item: quantity", listeler, serbest metin)
+    for item in parse_caption(response_text).items:
+        # Kategori eşleştirme (en uzun anahtar kelime kazanır)
+        matched_category = (matcher.match_word(item.label) if item.free_text else matcher.match(item.label)) \
+            or item.category
 
         if matched_category:
-            waste_count[matched_category] += quantity
-            print(f"Bulundu: {quantity}x {label} → {matched_category}")
+            waste_count[matched_category] += item.quantity
+            print(f"Bulundu: {item.quantity}x {item.label} → {matched_category}")
         else:
-            print(f"Atlandı: {label} (kategori yok)")
+            print(f"Atlandı: {item.label} (kategori yok)")
 
     # JSON çıktısı
     return json.dumps({
@@ -208,11 +156,22 @@ def process_image(image_path):
     if result_text:
         print("\nAPI'dan Gelen Yanıt:")
         print(result_text)
-        json_output = classify_waste_items(result_text)
+        with metrics.timer("classify"):
+            json_output = classify_waste_items(result_text)
         print("\nJSON Çıktısı:")
         print(json_output)
 
 
+# python main.py [--profile | --profile=pyinstrument]
 if __name__ == "__main__":
-    image_path = r"D:\inegol_images\IMG-20250410-WA0016.jpg"
-    process_image(image_path)
+    arguments = [arg for arg in sys.argv[1:] if not arg.startswith("--profile")]
+    if not arguments:
+        sys.exit("usage: python main.py <image> [--profile[=pyinstrument]]\n"
+                 "       or: waste-moondream analyze <image>")
+    image_path = arguments[0]
+    profiler = profile_option(sys.argv[1:])
+    if profiler:
+        profile_call(process_image, image_path, output_path="waste_profile", tool=profiler)
+    else:
+        process_image(image_path)
+    print(f"\n{metrics.summary()}")
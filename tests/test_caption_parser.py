@@ -0,0 +1,69 @@
+import pytest
+
+from waste_moondream.caption_parser import ParsedItem, parse_caption
+
+
+def test_quantity_pairs():
+    result = parse_caption("bottle: 2, can: 3")
+    assert result.format == "quantity"
+    assert result.items == [ParsedItem("bottle", 2, None), ParsedItem("can", 3, None)]
+
+
+def test_category_lines():
+    result = parse_caption("Plastic: bottle, bag\nPaper: 3 boxes\nPaper/Cardboard: a newspaper")
+    assert result.format == "category"
+    assert result.items == [ParsedItem("bottle", 1, "Plastic"), ParsedItem("bag", 1, "Plastic"),
+                            ParsedItem("boxes", 3, "Paper"), ParsedItem("newspaper", 1, "Paper")]
+
+
+def test_category_headers_with_bullets():
+    result = parse_caption("**Glass:**\n- jar x2\n- bottle (4)")
+    assert result.format == "category"
+    assert result.items == [ParsedItem("jar", 2, "Glass"), ParsedItem("bottle", 4, "Glass")]
+
+
+def test_bullets():
+    result = parse_caption("- 3 plastic bottles\n1. cardboard box\n- glass jar ×3")
+    assert result.format == "bullets"
+    assert result.items == [ParsedItem("plastic bottles", 3, None), ParsedItem("cardboard box", 1, None),
+                            ParsedItem("glass jar", 3, None)]
+
+
+def test_category_count():
+    assert parse_caption("Metal: 4").items == [ParsedItem("metal", 4, "Metal")]
+
+
+def test_free_text_counts_each_part():
+    result = parse_caption("The image shows two cans and a jar.")
+    assert result.format == "free_text"
+    assert result.items == [ParsedItem("cans", 2, None, True), ParsedItem("jar", 1, None, True)]
+
+
+def test_free_text_part_without_a_number_has_no_section():
+    assert parse_caption("Plastic:\nsome bottles").items == [ParsedItem("some bottles", 1, None, True)]
+
+
+def test_mixed():
+    assert parse_caption("bottle: 2\nthere are two cans").format == "mixed"
+
+
+@pytest.mark.parametrize("caption", ["", None, "Glass: None", "Paper: n/a\nMetal: -"])
+def test_empty(caption):
+    assert parse_caption(caption) == ("empty", [])
+
+
+@pytest.mark.parametrize("caption", [
+    "There is no plastic in the image.",
+    "I cannot identify any waste items.",
+    "Glass: None\nNo metal items are visible.",
+    "Plastic: no plastic items",
+    "- no glass",
+    "Nothing that looks like waste.",
+])
+def test_negations_are_empty(caption):
+    assert parse_caption(caption).items == []
+
+
+def test_negated_part_does_not_drop_the_rest():
+    assert parse_caption("There are 3 plastic bottles and no glass.").items == [
+        ParsedItem("plastic bottles", 3, None, True)]
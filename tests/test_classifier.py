@@ -0,0 +1,50 @@
+import pytest
+
+from waste_moondream.classifier import classify_caption, classify_items
+
+NOTHING = {"paper": 0, "plastic": 0, "metal": 0, "glass": 0}
+
+
+# Sentences that fuzzy matching used to turn into counts
+@pytest.mark.parametrize("caption", [
+    "There is no plastic in the image.",
+    "The image shows a pile of garbage on the street.",
+    "I cannot identify any waste items.",
+    "Glass: None\nNo metal items are visible.",
+    "Plastic: no plastic items",
+])
+def test_sentences_without_items_count_nothing(caption):
+    assert classify_caption(caption, []) == NOTHING
+
+
+def test_free_text_matches_whole_keywords():
+    assert classify_caption("The image shows 3 plastic bottles and a can.", []) == \
+        {"paper": 0, "plastic": 3, "metal": 1, "glass": 0}
+    assert classify_caption("plastic bottles, cans, cardboard boxes", []) == \
+        {"paper": 1, "plastic": 1, "metal": 1, "glass": 0}
+
+
+def test_free_text_is_not_fuzzy_matched():
+    unmatched = []
+    assert classify_caption("there are two cardbord sheets", unmatched) == NOTHING
+    assert unmatched == ["cardbord sheets"]
+
+
+def test_list_labels_are_fuzzy_matched():
+    assert classify_caption("Paper:\n- newspapre\n- cardbord box", []) == \
+        {"paper": 2, "plastic": 0, "metal": 0, "glass": 0}
+
+
+def test_section_is_the_fallback_for_list_labels():
+    assert classify_caption("Metal:\n- 2 shiny things", []) == {"paper": 0, "plastic": 0, "metal": 2, "glass": 0}
+
+
+def test_longest_keyword_wins():
+    assert classify_items("- 2 paper cups") == {"Paper": 2}
+
+
+def test_unmatched_labels_are_collected(capsys):
+    unmatched = []
+    classify_items("- 2 qwzx", unmatched)
+    assert unmatched == ["qwzx"]
+    assert capsys.readouterr().out == ""
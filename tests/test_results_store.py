@@ -0,0 +1,80 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from waste_moondream.results_store import (RESULTS_FILE_NAMES, ResultsTableWriter, convert_json_results,
+                                           find_results_files, load_results, parse_image_timestamp,
+                                           write_results_table)
+
+
+def counts(plastic, **extra):
+    return {"paper": 0, "plastic": plastic, "metal": 0, "glass": 0, **extra}
+
+
+def plastic_by_file(table):
+    return dict(zip(table["file"].to_pylist(), table["plastic"].to_pylist()))
+
+
+def test_parse_image_timestamp():
+    assert parse_image_timestamp("IMG-20250410-WA0001.jpg") == datetime(2025, 4, 10)
+    assert parse_image_timestamp("sub/IMG_20250410_153012.jpg") == datetime(2025, 4, 10, 15, 30, 12)
+    assert parse_image_timestamp("IMG-20251340-WA0001.jpg") is None
+    assert parse_image_timestamp("photo.jpg") is None
+
+
+def test_latest_run_wins_whatever_the_file_names(tmp_path):
+    folder = str(tmp_path)
+    write_results_table(str(tmp_path / "waste_results_parallel.b.arrows"), folder,
+                        {"IMG-20250410-WA0001.jpg": counts(1)}, run_started=100)
+    write_results_table(str(tmp_path / "waste_results_parallel.a.arrows"), folder,
+                        {"IMG-20250410-WA0001.jpg": counts(2)}, run_started=200)
+    assert plastic_by_file(load_results(folder)) == {"IMG-20250410-WA0001.jpg": 2}
+
+
+def test_converted_json_is_dated_by_its_modification_time(tmp_path):
+    folder = str(tmp_path)
+    json_path = tmp_path / "waste_results_parallel.json"
+    json_path.write_text(json.dumps({"IMG-20250410-WA0001.jpg": counts(1)}))
+    os.utime(json_path, (100, 100))
+    # A newer run; the converted waste_results_parallel.arrows sorts after it by name
+    write_results_table(str(tmp_path / "waste_results_parallel.20250411-000000-0.arrows"), folder,
+                        {"IMG-20250410-WA0001.jpg": counts(5)}, run_started=200)
+    assert convert_json_results(str(json_path)) == str(tmp_path / "waste_results_parallel.arrows")
+    assert plastic_by_file(load_results(folder)) == {"IMG-20250410-WA0001.jpg": 5}
+
+
+def test_last_row_of_a_run_wins_and_failures_are_dropped(tmp_path):
+    folder = str(tmp_path)
+    writer = ResultsTableWriter(str(tmp_path / "waste_results_stream.arrows"), folder)
+    writer.write("a.jpg", counts(1))
+    writer.write("b.jpg", {"error": "Moondream analysis failed."})
+    writer.flush()
+    writer.write("a.jpg", counts(3))
+    writer.close()
+    assert plastic_by_file(load_results(folder)) == {"a.jpg": 3}
+    assert load_results(folder, include_failed=True).num_rows == 2
+    assert load_results(folder, latest_only=False, include_failed=True).num_rows == 3
+
+
+def test_same_file_name_in_two_folders(tmp_path):
+    for site in ("siteA", "siteB"):
+        folder = tmp_path / site / "2025-06"
+        folder.mkdir(parents=True)
+        write_results_table(str(folder / "waste_results_stream.arrows"), str(folder), {"a.jpg": counts(1)})
+    assert load_results(str(tmp_path)).num_rows == 2
+
+
+def test_selected_columns(tmp_path):
+    write_results_table(str(tmp_path / "t.arrows"), str(tmp_path), {"a.jpg": counts(1, caption="x")})
+    assert load_results(str(tmp_path), columns=["file", "caption"]).column_names == ["file", "caption"]
+
+
+def test_find_results_files_skips_metrics_and_reports(tmp_path):
+    for name in (*RESULTS_FILE_NAMES, "waste_results_parallel_metrics.json", "waste_results_cascade_report.json",
+                 "waste_results_total.json", "waste_results_stream_reclassified.jsonl"):
+        (tmp_path / name).write_text("{}")
+    assert [os.path.basename(path) for path in find_results_files(str(tmp_path))] == sorted(RESULTS_FILE_NAMES)
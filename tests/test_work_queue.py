@@ -0,0 +1,124 @@
+import time
+
+import pytest
+
+from waste_moondream.folder_scanner import ScanEntry
+from waste_moondream.work_queue import WorkQueue, run_worker
+
+RESULT = {"paper": 1, "plastic": 2, "metal": 0, "glass": 0}
+
+
+def entry(name, size=1000):
+    return ScanEntry(name, "", size, 0)
+
+
+@pytest.fixture
+def open_queue(tmp_path):
+    queues = []
+
+    def open_queue(**options):
+        work_queue = WorkQueue(str(tmp_path / "queue.sqlite"), **options)
+        queues.append(work_queue)
+        return work_queue
+
+    yield open_queue
+    for work_queue in queues:
+        work_queue.close()
+
+
+def test_enqueue_is_idempotent_and_requeues_changed_images(open_queue):
+    work_queue = open_queue()
+    assert work_queue.enqueue([entry("a.jpg"), entry("b.jpg")]) == 2
+    assert work_queue.enqueue([entry("a.jpg"), entry("b.jpg")]) == 0
+    token, names = work_queue.claim("w1", 2)
+    work_queue.complete([(name, token, RESULT) for name in names])
+    assert work_queue.enqueue([entry("a.jpg", size=2000), entry("b.jpg")]) == 1
+    assert work_queue.counts()["queued"] == 1
+    assert work_queue.counts()["done"] == 1
+
+
+def test_leased_images_are_not_claimed_twice(open_queue):
+    work_queue = open_queue()
+    work_queue.enqueue([entry("a.jpg"), entry("b.jpg"), entry("c.jpg")])
+    _, first = work_queue.claim("w1", 2)
+    _, second = work_queue.claim("w2", 2)
+    assert len(first) == 2
+    assert set(second) == {"a.jpg", "b.jpg", "c.jpg"} - set(first)
+    assert work_queue.claim("w3", 2)[1] == []
+
+
+def test_expired_lease_is_claimed_again_and_the_stale_result_discarded(open_queue):
+    work_queue = open_queue(lease_seconds=0.05)
+    work_queue.enqueue([entry("a.jpg")])
+    stale, _ = work_queue.claim("w1", 1)
+    time.sleep(0.1)
+    assert work_queue.counts()["expired"] == 1
+    token, names = work_queue.claim("w2", 1)
+    assert names == ["a.jpg"]
+    assert work_queue.heartbeat([stale]) == 0
+    assert work_queue.complete([("a.jpg", stale, {**RESULT, "plastic": 9})]) == 0
+    assert work_queue.complete([("a.jpg", token, RESULT)]) == 1
+    assert dict(work_queue.results()) == {"a.jpg": RESULT}
+
+
+def test_heartbeat_keeps_the_lease(open_queue):
+    work_queue = open_queue(lease_seconds=0.2)
+    work_queue.enqueue([entry("a.jpg")])
+    token, _ = work_queue.claim("w1", 1)
+    for _ in range(3):
+        time.sleep(0.1)
+        assert work_queue.heartbeat([token]) == 1
+    assert work_queue.claim("w2", 1)[1] == []
+
+
+def test_errored_result_is_retried_until_max_attempts(open_queue):
+    work_queue = open_queue(max_attempts=3)
+    work_queue.enqueue([entry("a.jpg")])
+    for attempt in range(1, 4):
+        token, names = work_queue.claim("w1", 1)
+        assert names == ["a.jpg"]
+        assert work_queue.complete([("a.jpg", token, {"error": f"timeout {attempt}"})]) == 1
+    counts = work_queue.counts()
+    assert counts["failed"] == 1 and counts["queued"] == 0
+    assert dict(work_queue.results()) == {"a.jpg": {"error": "timeout 3"}}
+    assert work_queue.claim("w1", 1)[1] == []
+
+
+def test_errored_result_then_success_is_done(open_queue):
+    work_queue = open_queue()
+    work_queue.enqueue([entry("a.jpg")])
+    token, _ = work_queue.claim("w1", 1)
+    work_queue.complete([("a.jpg", token, {"error": "HTTP 503"})])
+    assert work_queue.counts()["queued"] == 1
+    token, _ = work_queue.claim("w2", 1)
+    work_queue.complete([("a.jpg", token, RESULT)])
+    assert work_queue.counts()["done"] == 1
+    assert work_queue.totals()["plastic"] == 2
+
+
+def test_release_does_not_count_an_attempt(open_queue):
+    work_queue = open_queue(max_attempts=1)
+    work_queue.enqueue([entry("a.jpg")])
+    token, _ = work_queue.claim("w1", 1)
+    work_queue.release([("a.jpg", token)])
+    token, names = work_queue.claim("w2", 1)
+    assert names == ["a.jpg"]
+    assert work_queue.complete([("a.jpg", token, RESULT)]) == 1
+
+
+def test_run_worker_retries_errors(tmp_path, open_queue):
+    path = str(tmp_path / "queue.sqlite")
+    work_queue = open_queue()
+    work_queue.enqueue([entry(f"IMG-{index}.jpg") for index in range(10)])
+    calls = []
+
+    def analyze(image_path):
+        calls.append(image_path)
+        if image_path.endswith("IMG-3.jpg") and calls.count(image_path) == 1:
+            raise TimeoutError("Read timed out.")
+        return RESULT
+
+    stats = run_worker(str(tmp_path), path, threads=4, analyze=analyze, lease_seconds=5)
+    assert stats["processed"] == 11
+    assert work_queue.counts()["done"] == 10
+    assert work_queue.totals()["plastic"] == 20
@@ -0,0 +1,137 @@
+import asyncio
+import email.utils
+import random
+import time
+
+# Status codes that mean "slow down" rather than "this request is wrong"
+OVERLOAD_STATUSES = {429, 503}
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Fixed concurrency limit; same interface as AIMDLimiter
+class FixedLimiter:
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+
+    def on_success(self, latency):
+        pass
+
+    def on_overload(self):
+        pass
+
+    def on_error(self):
+        pass
+
+
+# Additive-increase / multiplicative-decrease concurrency limit.
+# Every healthy response adds `increase / limit`, so the limit grows by about
+# `increase` per round trip while latency stays near the best seen and the
+# error rate stays low. A 429/503/timeout cuts the limit by `decrease_factor`,
+# at most once per round trip so one burst of rejections counts once.
+class AIMDLimiter:
+    def __init__(self, initial=8, min_limit=1, max_limit=100, increase=1.0, decrease_factor=0.7,
+                 latency_tolerance=2.0, max_error_rate=0.1):
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+
+        self.in_flight = 0
+        self.min_latency = None
+        self.smoothed_latency = None
+        self.error_rate = 0.0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+        # The loop only keeps weak references to tasks
+        self._tasks = set()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify(self._free_slots())
+
+    def _record(self, failed):
+        self.error_rate = 0.9 * self.error_rate + (0.1 if failed else 0.0)
+
+    def on_success(self, latency):
+        self._record(False)
+        if self.min_latency is None or latency < self.min_latency:
+            self.min_latency = latency
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency = 0.8 * self.smoothed_latency + 0.2 * latency
+
+        latency_ok = self.smoothed_latency <= self.min_latency * self.latency_tolerance
+        if latency_ok and self.error_rate <= self.max_error_rate:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            self._wake()
+
+    def on_overload(self):
+        self._record(True)
+        now = time.monotonic()
+        round_trip = self.smoothed_latency or 0.0
+        if now - self._last_decrease >= round_trip:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            self._last_decrease = now
+            self.decreases += 1
+
+    def on_error(self):
+        self._record(True)
+
+    def _free_slots(self):
+        return max(0, int(self.limit) - self.in_flight)
+
+    # A raised limit may let waiting requests through. Only as many waiters
+    # as there are free slots are woken, not the whole queue.
+    def _wake(self):
+        if self._free_slots():
+            task = asyncio.get_running_loop().create_task(self._notify())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify(self._free_slots())
+
+
+# Seconds to wait according to a Retry-After header (delta-seconds or HTTP date)
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+# Exponential backoff with full jitter, or the server's Retry-After when given.
+# `cap` bounds the computed backoff only; an explicit Retry-After is honored
+# in full.
+def backoff_delay(attempt, base=0.5, cap=30.0, retry_after=None):
+    if retry_after is not None:
+        return retry_after + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,197 @@
+import atexit
+import base64
+import os
+import queue
+import statistics
+import threading
+import time
+from concurrent.futures import Future
+from io import BytesIO
+
+from .metrics import metrics
+from .moondream_client import shared_client
+
+# "api" sends images to the Moondream HTTP API; "local" runs Moondream on
+# this machine's CPU, with no network and no API key.
+BACKEND = os.getenv("MOONDREAM_BACKEND", "api")
+LOCAL_RUNTIME = os.getenv("MOONDREAM_LOCAL_RUNTIME", "transformers")
+LOCAL_MODEL = os.getenv("MOONDREAM_LOCAL_MODEL", "vikhyatk/moondream2")
+LOCAL_REVISION = os.getenv("MOONDREAM_LOCAL_REVISION", "2024-08-26")
+LOCAL_BATCH_SIZE = int(os.getenv("MOONDREAM_LOCAL_BATCH_SIZE", "4"))
+LOCAL_BATCH_DELAY = float(os.getenv("MOONDREAM_LOCAL_BATCH_DELAY_MS", "20")) / 1000
+LOCAL_THREADS = int(os.getenv("MOONDREAM_LOCAL_THREADS", str(os.cpu_count() or 1)))
+
+# Every backend offers the same methods as MoondreamClient:
+#   caption(image_data, prompt)        -> caption text or None
+#   submit(image_data, prompt)         -> concurrent.futures.Future of the caption
+#   caption_many(images, prompt)       -> list of captions in input order
+#   close()
+# where image_data is raw JPEG bytes or base64 text.
+
+
+def _to_pil(image_data):
+    from PIL import Image
+
+    if isinstance(image_data, str):
+        image_data = base64.b64decode(image_data)
+    image = Image.open(BytesIO(image_data))
+    return image.convert("RGB") if image.mode != "RGB" else image
+
+
+# moondream2 through transformers on CPU, with dynamic int8 quantization of
+# the Linear layers. Uses the model's batched answering when the revision
+# has it, so one forward pass serves the whole micro-batch.
+class TransformersRunner:
+    def __init__(self, model_id=LOCAL_MODEL, revision=LOCAL_REVISION, quantize=True, threads=LOCAL_THREADS):
+        try:
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError("The local backend needs torch and transformers: "
+                               "pip install torch transformers einops") from e
+
+        torch.set_num_threads(threads)
+        self._torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id, revision=revision)
+        model = AutoModelForCausalLM.from_pretrained(model_id, revision=revision, trust_remote_code=True,
+                                                     torch_dtype=torch.float32)
+        model.eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+
+    def run_batch(self, images, prompts):
+        with self._torch.inference_mode():
+            if hasattr(self.model, "batch_answer"):
+                return self.model.batch_answer(images=images, prompts=prompts, tokenizer=self.tokenizer)
+            if hasattr(self.model, "query"):
+                return [self.model.query(image, prompt)["answer"] for image, prompt in zip(images, prompts)]
+            return [self.model.answer_question(self.model.encode_image(image), prompt, self.tokenizer)
+                    for image, prompt in zip(images, prompts)]
+
+
+# The int8 ONNX build of Moondream through the `moondream` package
+# (onnxruntime on CPU). It answers one image at a time.
+class OnnxRunner:
+    def __init__(self, model_path=LOCAL_MODEL):
+        try:
+            import moondream
+        except ImportError as e:
+            raise RuntimeError("The ONNX runtime needs the moondream package: pip install moondream") from e
+        self.model = moondream.vl(model=model_path)
+
+    def run_batch(self, images, prompts):
+        return [self.model.query(image, prompt)["answer"] for image, prompt in zip(images, prompts)]
+
+
+# Runs Moondream locally. Queued images are grouped by a dynamic
+# micro-batcher: the worker takes whatever is waiting, up to `batch_size`
+# images, waiting at most `batch_delay` seconds for a batch to fill, and
+# runs them as one batch on the runner.
+class LocalMoondreamBackend:
+    def __init__(self, runner=None, batch_size=LOCAL_BATCH_SIZE, batch_delay=LOCAL_BATCH_DELAY):
+        if runner is None:
+            runner = OnnxRunner() if LOCAL_RUNTIME == "onnx" else TransformersRunner()
+        self.runner = runner
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.images = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.latencies = []
+        self._started = None
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="moondream-local", daemon=True)
+        self._worker.start()
+
+    def submit(self, image_data, prompt):
+        future = Future()
+        self._queue.put((image_data, prompt, future, time.perf_counter()))
+        return future
+
+    def caption(self, image_data, prompt):
+        return self.submit(image_data, prompt).result()
+
+    def caption_many(self, images, prompt):
+        futures = [self.submit(image_data, prompt) for image_data in images]
+        return [future.result() for future in futures]
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.batch_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopped.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            if self._started is None:
+                self._started = time.perf_counter()
+
+            started = time.perf_counter()
+            try:
+                images = [_to_pil(image_data) for image_data, _, _, _ in batch]
+                captions = self.runner.run_batch(images, [prompt for _, prompt, _, _ in batch])
+            except Exception as e:
+                print(f"[Moondream] Local inference error: {str(e)}")
+                captions = [None] * len(batch)
+            finished = time.perf_counter()
+
+            self.batches += 1
+            self.images += len(batch)
+            self.busy_seconds += finished - started
+            metrics.observe("local_batch", finished - started)
+            for (_, _, future, queued), caption in zip(batch, captions):
+                self.latencies.append(finished - queued)
+                metrics.observe("caption", finished - queued)
+                future.set_result(caption.strip() if caption else None)
+            del self.latencies[:-10000]
+
+    def stats(self):
+        elapsed = (time.perf_counter() - self._started) if self._started else 0.0
+        latencies = sorted(self.latencies)
+        return {
+            "images": self.images,
+            "batches": self.batches,
+            "images_per_second": round(self.images / elapsed, 3) if elapsed else 0.0,
+            "mean_batch_size": round(self.images / self.batches, 2) if self.batches else 0.0,
+            "latency_p50_seconds": round(statistics.median(latencies), 3) if latencies else None,
+            "latency_p95_seconds": round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else None,
+        }
+
+    def close(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._worker.join()
+        print(f"[Moondream] Local backend: {self.stats()}")
+
+
+_local_backend = None
+_local_lock = threading.Lock()
+
+
+# The backend selected by MOONDREAM_BACKEND. Returns None when the API
+# backend is selected but there is no API key.
+def get_backend(api_key=None):
+    global _local_backend
+    if BACKEND == "local":
+        with _local_lock:
+            if _local_backend is None:
+                _local_backend = LocalMoondreamBackend()
+                atexit.register(_local_backend.close)
+            return _local_backend
+    if not api_key:
+        return None
+    return shared_client(api_key)
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import re
+
+BATCH_SIZE = int(os.getenv("MOONDREAM_BATCH_SIZE", "1"))
+BATCH_DELAY = float(os.getenv("MOONDREAM_BATCH_DELAY_MS", "50")) / 1000
+
+BATCH_PROMPT = """{count} images are attached, numbered 1 to {count} in the order given.
+Answer the following for each image separately. Start each answer on a new line with "Image N:" (N = 1 to {count}) and do not merge images.
+
+{prompt}"""
+
+_SECTION_HEADER = re.compile(r"^[ \t>#*_-]*image[ \t]*#?(\d+)[ \t*_]*[:.)\-]*[ \t*_]*", re.IGNORECASE | re.MULTILINE)
+
+
+# Prompt asking for one "Image N:" section per attached image
+def batch_prompt(prompt, count):
+    return BATCH_PROMPT.format(count=count, prompt=prompt.strip())
+
+
+# Splits a batched answer into one caption per image. Images without a
+# section (or with an empty one) get None so they can be retried alone.
+def split_batch_response(text, count):
+    sections = [None] * count
+    headers = list(_SECTION_HEADER.finditer(text or ""))
+    for index, header in enumerate(headers):
+        number = int(header.group(1))
+        if not 1 <= number <= count or sections[number - 1] is not None:
+            continue
+        end = headers[index + 1].start() if index + 1 < len(headers) else len(text)
+        section = text[header.end():end].strip()
+        sections[number - 1] = section or None
+    return sections
+
+
+# Collects concurrent caption requests for the same prompt into multi-image
+# requests. A batch is sent when it reaches `max_batch_size` images or when
+# its first image has waited `max_delay` seconds, whichever comes first.
+# `send_batch(images, prompt)` returns one caption (or None) per image;
+# `send_one(image, prompt)` is the fallback for images the batched answer
+# did not cover.
+class CaptionBatcher:
+    def __init__(self, send_batch, send_one, max_batch_size=BATCH_SIZE, max_delay=BATCH_DELAY):
+        self.send_batch = send_batch
+        self.send_one = send_one
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.batches_sent = 0
+        self.images_batched = 0
+        self.fallbacks = 0
+        self._pending = {}
+        self._timers = {}
+        # The loop only keeps weak references to tasks
+        self._tasks = set()
+
+    async def caption(self, image_data, prompt):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(prompt, [])
+        batch.append((image_data, future))
+
+        if len(batch) >= self.max_batch_size:
+            self._flush(prompt)
+        elif len(batch) == 1:
+            self._timers[prompt] = loop.call_later(self.max_delay, self._flush, prompt)
+        return await future
+
+    def _flush(self, prompt):
+        timer = self._timers.pop(prompt, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(prompt, None)
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._send(batch, prompt))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch, prompt):
+        images = [image_data for image_data, _ in batch]
+        try:
+            if len(images) == 1:
+                captions = [await self.send_one(images[0], prompt)]
+            else:
+                captions = await self.send_batch(images, prompt)
+                self.batches_sent += 1
+                self.images_batched += len(images)
+
+                missing = [index for index, caption in enumerate(captions) if caption is None]
+                if missing:
+                    self.fallbacks += len(missing)
+                    retried = await asyncio.gather(*(self.send_one(images[index], prompt) for index in missing))
+                    for index, caption in zip(missing, retried):
+                        captions[index] = caption
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), caption in zip(batch, captions):
+            if not future.done():
+                future.set_result(caption)
@@ -0,0 +1,137 @@
+import re
+from collections import namedtuple
+
+# One waste item read from a caption. `category` is the section it was listed
+# under ("Paper", "Glass", ...), or None when the caption did not say.
+# `free_text` items come from a sentence rather than a list: they only count
+# when a keyword appears in them as a whole word, never by fuzzy matching.
+ParsedItem = namedtuple("ParsedItem", ["label", "quantity", "category", "free_text"], defaults=(False,))
+
+# `format` is the caption layout that was detected:
+#   "quantity"   item: N lines (main.py prompt)
+#   "category"   paper: a, b lines, or category headers (v2 / multithreding prompts)
+#   "bullets"    - 3 plastic bottles / 1. cardboard box lists
+#   "free_text"  sentences or bare comma lists
+#   "mixed"      more than one of the above
+#   "empty"      nothing recognisable
+ParseResult = namedtuple("ParseResult", ["format", "items"])
+
+CATEGORY_NAMES = {
+    "paper": "Paper", "paper/cardboard": "Paper", "cardboard": "Paper",
+    "glass": "Glass",
+    "metal": "Metal",
+    "plastic": "Plastic",
+}
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "several": 1,
+}
+EMPTY_VALUES = {"", "none", "n/a", "-", "no items", "nothing", "none visible", "not visible"}
+# "no plastic", "none visible", "I cannot identify any waste": nothing to count
+_NEGATION = re.compile(r"\b(?:no|none|not|cannot|can't|nothing|without|neither|nor)\b")
+
+_DECORATION = re.compile(r"[*_`#>]+")
+_BULLET = re.compile(r"^(?:[-•*+]|\d+[.)])\s+")
+_CATEGORY_LINE = re.compile(r"^(paper\s*/\s*cardboard|paper|cardboard|glass|metal|plastic)s?\s*(?:\(.*?\))?\s*:\s*(.*)$")
+_QUANTITY_PAIR = re.compile(r"([^:,;]+?):\s*(\d+)\b")
+_LEADING_COUNT = re.compile(r"^(?:(\d+)\s*(?:[x×]\s+)?|(" + "|".join(NUMBER_WORDS) + r")\s+)(.+)$")
+_TRAILING_COUNT = re.compile(r"^(.+?)\s*(?:\((\d+)\)|[x×]\s*(\d+)|:\s*(\d+))$")
+_COUNT_IN_TEXT = re.compile(r"\b(?:(\d+)|(" + "|".join(NUMBER_WORDS) + r"))\s+(.+)$")
+_LIST_SEPARATOR = re.compile(r",|;|\band\b")
+
+
+# Label and quantity of one list entry: "3 plastic bottles", "two cans",
+# "plastic bottle (4)", "glass jar x2", "cardboard: 5" or a bare label (1)
+def _split_quantity(text):
+    text = text.strip(" .")
+    match = _TRAILING_COUNT.match(text)
+    if match:
+        count = match.group(2) or match.group(3) or match.group(4)
+        return match.group(1).strip(" ."), int(count)
+    match = _LEADING_COUNT.match(text)
+    if match:
+        quantity = int(match.group(1)) if match.group(1) else NUMBER_WORDS[match.group(2)]
+        return match.group(3).strip(" ."), quantity
+    return text, 1
+
+
+def _list_items(text, category):
+    items = []
+    for part in _LIST_SEPARATOR.split(text):
+        part = part.strip(" .")
+        if part in EMPTY_VALUES or _NEGATION.search(part):
+            continue
+        if part.isdigit() and category:
+            # "plastic: 4" counts the category itself
+            items.append(ParsedItem(category.lower(), int(part), category))
+            continue
+        label, quantity = _split_quantity(part)
+        if label and quantity:
+            items.append(ParsedItem(label, quantity, category))
+    return items
+
+
+# Items in a sentence: each list part is counted from the first number in it,
+# so "the image shows 3 plastic bottles and a can" gives 3 + 1 items. A part
+# without a number is one item with no section, so it only counts when it
+# names a keyword; negated parts ("there is no plastic") are skipped.
+def _free_text_items(text, category):
+    items = []
+    for part in _LIST_SEPARATOR.split(text):
+        part = part.strip(" .")
+        if part in EMPTY_VALUES or _NEGATION.search(part):
+            continue
+        match = _COUNT_IN_TEXT.search(part)
+        if match:
+            quantity = int(match.group(1)) if match.group(1) else NUMBER_WORDS[match.group(2)]
+            if quantity:
+                items.append(ParsedItem(match.group(3).strip(" ."), quantity, category, True))
+        else:
+            items.append(ParsedItem(part, 1, None, True))
+    return items
+
+
+# Reads a caption once, line by line, and returns every item with the
+# layout that was detected. Handles all the prompt formats used here:
+# "item: N", bullet lists (optionally under category headers),
+# "category: a, b" lines and free text.
+def parse_caption(text):
+    items = []
+    formats = set()
+    section = None
+
+    for raw_line in (text or "").lower().splitlines():
+        line = _DECORATION.sub("", raw_line).strip()
+        if not line:
+            continue
+
+        bullet = _BULLET.match(line)
+        if bullet:
+            line = line[bullet.end():]
+
+        match = _CATEGORY_LINE.match(line)
+        if match:
+            section = CATEGORY_NAMES[re.sub(r"\s+", "", match.group(1))]
+            if match.group(2).strip():
+                formats.add("category")
+                items.extend(_list_items(match.group(2), section))
+            continue
+
+        if bullet:
+            formats.add("category" if section else "bullets")
+            items.extend(_list_items(line, section))
+            continue
+
+        pairs = _QUANTITY_PAIR.findall(line)
+        if pairs:
+            formats.add("quantity")
+            items.extend(ParsedItem(label.strip(" .-"), int(quantity), section)
+                         for label, quantity in pairs if int(quantity))
+            continue
+
+        formats.add("free_text")
+        items.extend(_free_text_items(line, section))
+
+    if not items:
+        return ParseResult("empty", [])
+    return ParseResult(formats.pop() if len(formats) == 1 else "mixed", items)
@@ -0,0 +1,178 @@
+import os
+import re
+import threading
+import time
+
+from .caption_parser import parse_caption
+from .image_encoding import encode_jpeg
+from .metrics import metrics
+from .prefilter import PREFILTER_MODE, rejection_reasons, skipped_result
+
+
+# "256:75,512:85,1024:90" -> [(256, 75), (512, 85), (1024, 90)]
+def parse_tiers(text):
+    tiers = []
+    for part in text.split(","):
+        size, _, quality = part.strip().partition(":")
+        tiers.append((int(size), int(quality or 85)))
+    return tiers
+
+
+# Upload sizes (longest side) and JPEG qualities, cheapest first
+CASCADE_TIERS = parse_tiers(os.getenv("MOONDREAM_CASCADE_TIERS", "256:75,512:85,1024:90"))
+# A single item counted more often than this, or more items than
+# CASCADE_MAX_TOTAL in one image, is checked again at the next size
+CASCADE_MAX_ITEM_COUNT = int(os.getenv("MOONDREAM_CASCADE_MAX_ITEM_COUNT", "10"))
+CASCADE_MAX_TOTAL = int(os.getenv("MOONDREAM_CASCADE_MAX_TOTAL", "25"))
+# The size the scripts send without the cascade, used for the savings estimate
+REFERENCE_SIZE = 512
+
+_AMBIGUOUS = re.compile(r"\b(?:several|many|multiple|numerous|various|lots of|a lot of|a pile of|a bunch of|"
+                        r"some|a few|countless|unclear|blurry|hard to (?:see|tell))\b", re.IGNORECASE)
+
+
+# Why a caption is not good enough to keep: no caption, nothing parsed,
+# an implausibly large or vague count, or labels the classifier did not know
+def escalation_reasons(caption, unmatched=(), max_item_count=CASCADE_MAX_ITEM_COUNT, max_total=CASCADE_MAX_TOTAL):
+    if not caption:
+        return ["no_caption"]
+    items = parse_caption(caption).items
+    if not items:
+        return ["empty"]
+    reasons = []
+    if any(item.quantity > max_item_count for item in items) or sum(item.quantity for item in items) > max_total:
+        reasons.append("large_count")
+    if _AMBIGUOUS.search(caption):
+        reasons.append("ambiguous_count")
+    if unmatched:
+        reasons.append("unmatched")
+    return reasons
+
+
+# Sends each image at the smallest tier first and again at the next tier
+# only when the answer needs it (see escalation_reasons). The result of the
+# largest tier that returned a caption is kept, with its size as "tier".
+# `classify(caption, unmatched)` returns the category counts and appends
+# unknown labels to `unmatched`. The pre-filter screens the first tier's
+# image: with "skip" a rejected image is never sent, with "flag" its result
+# gets the reasons as "quality_flags".
+class ResolutionCascade:
+    def __init__(self, backend, prompt, classify, tiers=CASCADE_TIERS, max_item_count=CASCADE_MAX_ITEM_COUNT,
+                 max_total=CASCADE_MAX_TOTAL, prefilter=PREFILTER_MODE):
+        self.backend = backend
+        self.prompt = prompt
+        self.classify = classify
+        self.tiers = list(tiers)
+        self.max_item_count = max_item_count
+        self.max_total = max_total
+        self.prefilter = prefilter
+        self.images = 0
+        self.unresolved = 0
+        self.reasons = {}
+        self._tier_stats = [{"requests": 0, "accepted": 0, "escalated": 0, "failed": 0, "bytes": 0, "seconds": 0.0}
+                            for _ in self.tiers]
+        self._lock = threading.Lock()
+
+    def detect_and_classify(self, image_path):
+        best = None
+        flags = {}
+        for index, (size, quality) in enumerate(self.tiers):
+            try:
+                measures = {} if index == 0 and self.prefilter != "off" else None
+                image_data = encode_jpeg(image_path, (size, size), quality, measures=measures)
+                reasons = rejection_reasons(measures) if measures is not None else []
+                if reasons and self.prefilter == "skip":
+                    print(f"--- SKIPPED: {', '.join(reasons)} ---")
+                    return skipped_result(reasons, measures)
+                if reasons:
+                    flags = {"quality_flags": reasons, "quality": measures}
+                started = time.perf_counter()
+                caption = self.backend.caption(image_data, self.prompt)
+                seconds = time.perf_counter() - started
+            except Exception as e:
+                print(f"[Moondream] Error during detection: {str(e)}")
+                return best or {"error": str(e)}
+
+            unmatched = []
+            if caption:
+                with metrics.timer("classify"):
+                    best = {"caption": caption, **self.classify(caption, unmatched), "tier": size, **flags}
+            reasons = escalation_reasons(caption, unmatched, self.max_item_count, self.max_total)
+            last = index == len(self.tiers) - 1
+            self._record(index, len(image_data), seconds, caption, reasons, last)
+            if not reasons:
+                break
+            if not last:
+                metrics.count("cascade_escalations", tier=size)
+        return best or {"error": "Moondream analysis failed."}
+
+    def _record(self, index, size_bytes, seconds, caption, reasons, last):
+        with self._lock:
+            stats = self._tier_stats[index]
+            stats["requests"] += 1
+            stats["bytes"] += size_bytes
+            stats["seconds"] += seconds
+            stats["failed"] += caption is None
+            if index == 0:
+                self.images += 1
+            if not reasons:
+                stats["accepted"] += 1
+            elif last:
+                self.unresolved += 1
+            else:
+                stats["escalated"] += 1
+            for reason in reasons:
+                self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    # Per tier: share of all images answered there (hit rate), share of its
+    # requests sent on to the next tier, and mean bytes and latency per
+    # request. The savings compare with sending every image once at
+    # REFERENCE_SIZE, using the mean bytes and latency seen at that tier.
+    def stats(self):
+        with self._lock:
+            images = self.images
+            tiers = []
+            for (size, quality), stats in zip(self.tiers, self._tier_stats):
+                requests = stats["requests"]
+                tiers.append({
+                    "size": size,
+                    "quality": quality,
+                    "requests": requests,
+                    "hit_rate": round(stats["accepted"] / images, 4) if images else 0.0,
+                    "escalation_rate": round(stats["escalated"] / requests, 4) if requests else 0.0,
+                    "failed": stats["failed"],
+                    "mean_bytes": round(stats["bytes"] / requests) if requests else None,
+                    "mean_latency_seconds": round(stats["seconds"] / requests, 3) if requests else None,
+                })
+            total_bytes = sum(stats["bytes"] for stats in self._tier_stats)
+            total_seconds = sum(stats["seconds"] for stats in self._tier_stats)
+            report = {
+                "images": images,
+                "requests_per_image": round(sum(tier["requests"] for tier in tiers) / images, 3) if images else 0.0,
+                "mean_bytes_per_image": round(total_bytes / images) if images else None,
+                "mean_latency_per_image_seconds": round(total_seconds / images, 3) if images else None,
+                "unresolved": self.unresolved,
+                "escalation_reasons": dict(self.reasons),
+                "tiers": tiers,
+            }
+        reference = next((tier for tier in tiers if tier["size"] == REFERENCE_SIZE and tier["requests"]), None)
+        if reference and images:
+            report["estimated_bytes_saved"] = round(images * reference["mean_bytes"] - total_bytes)
+            report["estimated_seconds_saved"] = round(images * reference["mean_latency_seconds"] - total_seconds, 1)
+        return report
+
+    def summary(self):
+        report = self.stats()
+        lines = [f"Cascade: {report['images']} images, {report['requests_per_image']} requests per image, "
+                 f"{report['mean_bytes_per_image']} bytes and {report['mean_latency_per_image_seconds']} s per image"]
+        for tier in report["tiers"]:
+            lines.append(f"  {tier['size']:>5}px q{tier['quality']}: {tier['requests']} requests, "
+                         f"hit rate {tier['hit_rate']:.1%}, escalated {tier['escalation_rate']:.1%}, "
+                         f"{tier['mean_bytes']} bytes, {tier['mean_latency_seconds']} s")
+        if report["escalation_reasons"]:
+            lines.append("  reasons: " + ", ".join(f"{reason}={count}"
+                                                   for reason, count in report["escalation_reasons"].items()))
+        if "estimated_bytes_saved" in report:
+            lines.append(f"  vs {REFERENCE_SIZE}px for every image: ~{report['estimated_bytes_saved']} bytes "
+                         f"and ~{report['estimated_seconds_saved']} s of API time saved")
+        return "\n".join(lines)
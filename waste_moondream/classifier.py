@@ -0,0 +1,94 @@
+from collections import defaultdict
+
+from .caption_parser import parse_caption
+from .keyword_matcher import KeywordMatcher
+from .metrics import metrics
+
+CATEGORY_FIELDS = ("paper", "plastic", "metal", "glass")
+
+# Waste taxonomy: keyword -> category
+categories = {
+    # Paper/Cardboard category
+    "cardboard": "Paper", "paper": "Paper", "carton": "Paper", "box": "Paper", "tetra pak": "Paper",
+    "milk carton": "Paper", "juice carton": "Paper", "food packaging": "Paper", "magazine": "Paper",
+    "book": "Paper", "newspaper": "Paper", "paper cup": "Paper", "paper bag": "Paper",
+    "paper wrapper": "Paper", "paper tray": "Paper", "paper container": "Paper",
+
+    # Glass category
+    "glass": "Glass", "bottle": "Glass", "jar": "Glass", "container": "Glass",
+    "window": "Glass", "mirror": "Glass", "vase": "Glass",
+
+    # Metal category
+    "metal": "Metal", "aluminum": "Metal", "tin": "Metal", "can": "Metal",
+    "steel": "Metal", "foil": "Metal",
+
+    # Plastic category
+    "plastic": "Plastic", "pet": "Plastic", "bottle": "Plastic", "container": "Plastic",
+    "bag": "Plastic", "foam": "Plastic", "lid": "Plastic", "wrapper": "Plastic",
+    "tray": "Plastic", "cup": "Plastic", "dish": "Plastic", "bucket": "Plastic",
+    "hose": "Plastic", "crate": "Plastic",
+}
+
+# Lookup structures compiled once at module load. The fuzzy index needs
+# numpy and is built on first use, so importing this module stays cheap.
+category_keys = [key.lower() for key in categories]
+category_by_key = {key.lower(): category for key, category in categories.items()}
+matcher = KeywordMatcher(categories)
+_fuzzy_index = None
+
+
+def get_fuzzy_index():
+    global _fuzzy_index
+    if _fuzzy_index is None:
+        from .fuzzy_index import FuzzyIndex
+        _fuzzy_index = FuzzyIndex(category_keys)
+    return _fuzzy_index
+
+
+# Counts per category. Labels that match nothing are appended to `unmatched`
+# when a list is given (the caller reports them), and printed otherwise.
+# Items read from sentences are matched on whole keywords only: fuzzy
+# matching would turn any sentence into a count.
+def classify_items(caption_text, unmatched=None):
+    waste_count = defaultdict(int)
+
+    items = parse_caption(caption_text).items
+    # All list labels of the caption are scored against the keys in one batch
+    listed = [item.label for item in items if not item.free_text]
+    matches = iter(get_fuzzy_index().match_batch(listed))
+
+    for item in items:
+        key = None if item.free_text else next(matches)[0]
+        if key:
+            waste_count[category_by_key[key]] += item.quantity
+        else:
+            matched_category = (matcher.match_word(item.label) if item.free_text else matcher.match(item.label)) \
+                or item.category
+            if matched_category:
+                waste_count[matched_category] += item.quantity
+            else:
+                if unmatched is None:
+                    print(f"[Moondream] Unmatched label: {item.label}")
+                else:
+                    unmatched.append(item.label)
+
+    return waste_count
+
+
+def classify_caption(caption_text, unmatched=None):
+    category_counts = classify_items(caption_text, unmatched)
+    return {
+        "paper": category_counts.get("Paper", 0),
+        "plastic": category_counts.get("Plastic", 0),
+        "metal": category_counts.get("Metal", 0),
+        "glass": category_counts.get("Glass", 0)
+    }
+
+
+# Result dict for a caption, as returned by detect_and_classify
+def result_from_caption(caption):
+    if not caption:
+        return {"error": "Moondream analysis failed."}
+
+    with metrics.timer("classify"):
+        return {"caption": caption, **classify_caption(caption)}
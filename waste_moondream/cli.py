@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import sys
+from functools import partial
+
+from . import __version__
+
+FOLDER_MODES = ("sequential", "parallel", "streaming")
+
+
+# Backend, prompt, pre-filter and cache are read from the environment when
+# the modules are imported, so the flags are applied before any import.
+# Every command imports what it needs inside its function: `--help` and
+# `reclassify` never load PIL, aiohttp or the API client.
+def _configure(args):
+    options = {"MOONDREAM_BACKEND": args.backend, "MOONDREAM_PROMPT": args.prompt,
+               "MOONDREAM_PREFILTER": args.prefilter, "MOONDREAM_CACHE": "0" if args.no_cache else None}
+    for name, value in options.items():
+        if value is not None:
+            os.environ[name] = value
+
+
+def _call(args, function, *call_args, output_path="waste_profile"):
+    if not args.profile:
+        return function(*call_args)
+    from .metrics import profile_call
+    return profile_call(function, *call_args, output_path=output_path, tool=args.profiler)
+
+
+def analyze(args):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from .multithreding import detect_and_classify
+
+    def run():
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            return dict(zip(args.images, executor.map(detect_and_classify, args.images)))
+
+    results = _call(args, run)
+    print(json.dumps(results, indent=4, ensure_ascii=False))
+
+
+def folder(args):
+    from . import multithreding
+
+    if args.mode == "streaming":
+        if args.dedup or args.cascade:
+            sys.exit("--dedup and --cascade are not available in streaming mode")
+        function = partial(multithreding.process_folder_streaming, max_in_flight=args.workers)
+    else:
+        options = {"max_workers": 1 if args.mode == "sequential" else args.workers, "dedup": args.dedup,
+                   "incremental": not args.full, "cascade": args.cascade}
+        if args.dedup_threshold is not None:
+            options["dedup_threshold"] = args.dedup_threshold
+        function = partial(multithreding.process_folder_parallel, **options)
+    _call(args, function, args.folder, output_path=os.path.join(args.folder, "waste_results_profile"))
+
+
+def reclassify(args):
+    from .reclassify import reclassify_file
+
+    for path in args.results:
+        totals = _call(args, partial(reclassify_file, workers=args.workers, chunk_size=args.chunk_size), path)
+        print(f"Totals: {totals}")
+
+
+def queue(args):
+    from . import work_queue
+
+    if args.action == "enqueue":
+        work_queue.enqueue_folder(args.folder, args.queue)
+    elif args.action == "work":
+        _call(args, partial(work_queue.run_worker, path=args.queue, threads=args.threads), args.folder,
+              output_path=os.path.join(args.folder, "waste_results_profile"))
+    elif args.action == "status":
+        shared = work_queue.WorkQueue(args.queue or work_queue.queue_path(args.folder))
+        print(json.dumps(shared.counts(), indent=4))
+        shared.close()
+    else:
+        print(f"Totals: {work_queue.export_results(args.folder, args.queue)}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="waste-moondream", description="Waste type characterization with Moondream")
+    parser.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
+    parser.add_argument("--backend", choices=("api", "local"), help="Moondream API or local model (MOONDREAM_BACKEND)")
+    parser.add_argument("--prompt", choices=("quantity", "template", "material"),
+                        help="caption format to ask for (MOONDREAM_PROMPT, default material)")
+    parser.add_argument("--prefilter", choices=("off", "flag", "skip"), help="blur/darkness check (MOONDREAM_PREFILTER)")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the caption cache")
+    parser.add_argument("--profile", action="store_true", help="profile the command")
+    parser.add_argument("--profiler", choices=("cprofile", "pyinstrument"), default="cprofile",
+                        help="profiler used by --profile (default cprofile)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("analyze", help="classify single images and print the results")
+    command.add_argument("images", nargs="+")
+    command.add_argument("--workers", type=int, default=8)
+    command.set_defaults(run=analyze)
+
+    command = commands.add_parser("folder", help="classify every new or changed image in a folder")
+    command.add_argument("folder")
+    command.add_argument("--mode", choices=FOLDER_MODES, default="parallel",
+                         help="one image at a time, a thread per request, or the streaming pipeline")
+    command.add_argument("--workers", type=int, default=100, help="threads, or requests in flight when streaming")
+    command.add_argument("--full", action="store_true", help="re-analyze images that were already processed")
+    command.add_argument("--dedup", action="store_true", help="send near-identical images once")
+    command.add_argument("--dedup-threshold", type=int, help="bits (MOONDREAM_DEDUP_THRESHOLD, default 6)")
+    command.add_argument("--cascade", action="store_true", help="send small first, larger only when needed")
+    command.set_defaults(run=folder)
+
+    command = commands.add_parser("reclassify", help="recount stored captions with the current taxonomy")
+    command.add_argument("results", nargs="+", help="waste_results*.json, .jsonl or .arrows files, or folders of .arrows tables")
+    command.add_argument("--workers", type=int, help="processes (default: one per CPU)")
+    command.add_argument("--chunk-size", type=int, default=2000, help="results sent to a process at a time")
+    command.set_defaults(run=reclassify)
+
+    command = commands.add_parser("queue", help="share a folder between workers on several machines")
+    command.add_argument("action", choices=("enqueue", "work", "status", "export"),
+                         help="queue the images, process them until none are left, show the counts, "
+                              "or write the results")
+    command.add_argument("folder", help="the shared folder, as this machine sees it")
+    command.add_argument("--queue", help="queue database (default: waste_queue.sqlite in the folder)")
+    command.add_argument("--threads", type=int, default=16, help="requests in flight in this worker")
+    command.set_defaults(run=queue)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    _configure(args)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+DEDUP_THRESHOLD = int(os.getenv("MOONDREAM_DEDUP_THRESHOLD", "6"))
+
+
+# Tiny grayscale thumbnail for the difference hash, decoded at 1/8 scale for JPEGs
+def load_hash_thumbnail(image_path, hash_size=HASH_SIZE):
+    image = Image.open(image_path)
+    image.draft("L", (hash_size * 8, hash_size * 8))
+    image = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    return np.asarray(image, dtype=np.int16)
+
+
+# dHash of a batch of thumbnails (N, hash_size, hash_size + 1) as uint64:
+# one bit per pixel, set when it is brighter than its right neighbour
+def dhash_batch(thumbnails):
+    bits = thumbnails[:, :, 1:] > thumbnails[:, :, :-1]
+    packed = np.packbits(bits.reshape(len(thumbnails), -1), axis=1)
+    return packed.view(">u8").ravel().astype(np.uint64)
+
+
+# dHash for every path, computed on a thread pool (Pillow releases the GIL
+# while decoding). Unreadable images get no hash and are never grouped.
+def compute_hashes(image_paths, workers=8):
+    def load(path):
+        try:
+            return load_hash_thumbnail(path)
+        except Exception as e:
+            print(f"[Moondream] Hash error ({path}): {str(e)}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        thumbnails = list(executor.map(load, image_paths))
+
+    readable = [index for index, thumbnail in enumerate(thumbnails) if thumbnail is not None]
+    hashes = {}
+    if readable:
+        batch = dhash_batch(np.stack([thumbnails[index] for index in readable]))
+        for index, value in zip(readable, batch):
+            hashes[image_paths[index]] = int(value)
+    return hashes
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+# Burkhard-Keller tree over Hamming distance: finds every stored hash within
+# a radius without comparing against all of them.
+class BKTree:
+    def __init__(self):
+        self._root = None
+
+    def add(self, value, item):
+        node = [value, item, {}]
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    # (distance, item) for every stored hash within max_distance, closest first
+    def search(self, value, max_distance):
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                found.append((distance, item))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+# Groups near-identical images. Each image joins the closest representative
+# within `threshold` bits, or becomes a new representative. Returns
+# {representative path: [duplicate paths]}; every input path appears once.
+def group_near_duplicates(image_paths, threshold=DEDUP_THRESHOLD, hashes=None):
+    if hashes is None:
+        hashes = compute_hashes(image_paths)
+
+    tree = BKTree()
+    groups = {}
+    for path in image_paths:
+        value = hashes.get(path)
+        if value is None:
+            groups[path] = []
+            continue
+        matches = tree.search(value, threshold)
+        if matches:
+            groups[matches[0][1]].append(path)
+        else:
+            tree.add(value, path)
+            groups[path] = []
+    return groups
+
+
+# Summary of the groups for waste_results_dedup_report.json. Images are
+# listed by names[path] (their path relative to the scanned folder, so that
+# same-named files in different subfolders stay apart), or by their path.
+def dedup_report(groups, threshold, names=None):
+    names = names or {}
+    total = sum(1 + len(duplicates) for duplicates in groups.values())
+    duplicate_count = sum(len(duplicates) for duplicates in groups.values())
+    return {
+        "threshold": threshold,
+        "images": total,
+        "representatives": len(groups),
+        "duplicates": duplicate_count,
+        "api_calls_saved": duplicate_count,
+        "groups": {
+            names.get(representative, representative): [names.get(path, path) for path in duplicates]
+            for representative, duplicates in groups.items() if duplicates
+        },
+    }
@@ -0,0 +1,159 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+LOOKUP_BATCH = 512
+
+# `name` is the path relative to the scanned folder with "/" separators
+# ("site-3/IMG-20250410-WA0001.jpg"); it is the key in results and manifests.
+ScanEntry = namedtuple("ScanEntry", ["name", "path", "size", "mtime_ns"])
+
+
+# Every image under `root`, yielded as soon as it is found. One directory is
+# read at a time with os.scandir (no full listing is built) and
+# subdirectories are visited after the files of their parent, most recently
+# modified first: adding files touches the directory, so on an incremental
+# run the folders with new images are read before the old ones. Hidden
+# directories are skipped, and so are unreadable directories and files.
+def scan_images(root, extensions=IMAGE_EXTENSIONS, recursive=True):
+    stack = [("", root)]
+    while stack:
+        prefix, directory = stack.pop()
+        subdirectories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive and not entry.name.startswith("."):
+                                modified = entry.stat().st_mtime_ns
+                                subdirectories.append((modified, prefix + entry.name + "/", entry.path))
+                            continue
+                        if not entry.name.lower().endswith(extensions) or not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except OSError as e:
+                        print(f"[Moondream] Scan error ({entry.path}): {str(e)}")
+                        continue
+                    yield ScanEntry(prefix + entry.name, entry.path, stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            print(f"[Moondream] Scan error ({directory}): {str(e)}")
+        subdirectories.sort()
+        stack.extend((prefix, path) for _, prefix, path in subdirectories)
+
+
+# (name, size, mtime) of every image already processed, in SQLite. Pass a
+# path, or an open connection (and its lock) to share another database.
+class Manifest:
+    def __init__(self, path_or_connection, lock=None):
+        if isinstance(path_or_connection, sqlite3.Connection):
+            self._db = path_or_connection
+            self._owned = False
+        else:
+            self._db = sqlite3.connect(path_or_connection, check_same_thread=False)
+            self._owned = True
+        self._lock = lock or threading.Lock()
+        with self._lock:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS manifest (
+                    name TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL
+                )
+            """)
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM manifest").fetchone()[0]
+
+    # {name: (size, mtime_ns)} for the names that are in the manifest
+    def lookup(self, names):
+        found = {}
+        with self._lock:
+            for start in range(0, len(names), LOOKUP_BATCH):
+                batch = names[start:start + LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                for name, size, mtime_ns in self._db.execute(
+                        f"SELECT name, size, mtime_ns FROM manifest WHERE name IN ({placeholders})", batch):
+                    found[name] = (size, mtime_ns)
+        return found
+
+    def record(self, entry):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO manifest (name, size, mtime_ns) VALUES (?, ?, ?)",
+                             (entry.name, entry.size, entry.mtime_ns))
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def close(self):
+        if self._owned:
+            with self._lock:
+                self._db.commit()
+                self._db.close()
+
+    # Entries that are new or whose size or mtime changed since they were
+    # recorded. Names are looked up in batches of LOOKUP_BATCH, so the first
+    # entries come through before the rest of the folder is scanned.
+    def changed(self, entries):
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= LOOKUP_BATCH:
+                yield from self._changed_batch(batch)
+                batch = []
+        if batch:
+            yield from self._changed_batch(batch)
+
+    def _changed_batch(self, batch):
+        known = self.lookup([entry.name for entry in batch])
+        for entry in batch:
+            if known.get(entry.name) != (entry.size, entry.mtime_ns):
+                yield entry
+
+
+# Incremental runs for the scripts that save one {name: result} JSON per
+# folder. The results of the previous run are loaded, only new or changed
+# images come out of pending(), and results() merges the two, dropping
+# images that are no longer in the folder. With resume=False, or without the
+# previous results file, every image is pending.
+class IncrementalResults:
+    def __init__(self, folder_path, results_path, manifest_path, resume=True):
+        self.folder_path = folder_path
+        self.previous = {}
+        if resume and os.path.exists(results_path):
+            with open(results_path, encoding="utf-8") as f:
+                self.previous = json.load(f)
+        elif os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        self.manifest = Manifest(manifest_path)
+        self.seen = set()
+        self.new = {}
+
+    def pending(self):
+        return self.manifest.changed(self._scan())
+
+    def _scan(self):
+        for entry in scan_images(self.folder_path):
+            self.seen.add(entry.name)
+            yield entry
+
+    # Successful results are recorded in the manifest; failed images stay
+    # pending for the next run
+    def add(self, entry, result):
+        self.new[entry.name] = result
+        if "error" not in result:
+            self.manifest.record(entry)
+
+    def results(self):
+        merged = {name: result for name, result in self.previous.items() if name in self.seen}
+        merged.update(self.new)
+        return merged
+
+    def close(self):
+        self.manifest.close()
@@ -0,0 +1,89 @@
+import math
+import os
+
+import numpy as np
+
+FUZZY_CUTOFF = float(os.getenv("MOONDREAM_FUZZY_CUTOFF", "0.3"))
+CHUNK_SIZE = 4096
+
+
+# Character trigrams of every label, computed for the whole batch at once.
+# Each label is padded with a space on both sides and read as UTF-8 bytes;
+# a trigram is packed into one integer (3 bytes). Returns the label index
+# and the trigram code of every distinct (label, trigram) pair, with its count.
+def trigram_counts(labels):
+    encoded = [(" " + label.lower().strip() + " ").encode("utf-8") for label in labels]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.int64)
+    if len(buffer) < 3:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    rows = np.repeat(np.arange(len(encoded), dtype=np.int64), lengths)
+    codes = (buffer[:-2] << 16) | (buffer[1:-1] << 8) | buffer[2:]
+    # Drop trigrams that run across two labels
+    inside = rows[:-2] == rows[2:]
+    pairs, counts = np.unique((rows[:-2][inside] << 24) | codes[inside], return_counts=True)
+    return pairs >> 24, pairs & 0xFFFFFF, counts
+
+
+# Fuzzy lookup of labels against a fixed vocabulary (the `categories` keys).
+# Keys and labels become TF-IDF vectors over character trigrams and are
+# compared by cosine similarity: one matrix product scores a whole batch of
+# labels against every key, instead of a SequenceMatcher per label and key.
+class FuzzyIndex:
+    def __init__(self, keys):
+        self.keys = list(dict.fromkeys(key.lower() for key in keys))
+
+        rows, codes, counts = trigram_counts(self.keys)
+        self._codes, key_ids = np.unique(codes, return_inverse=True)
+        key_ids = key_ids.ravel()
+
+        # Smoothed IDF; trigrams no key has get the highest weight, so a label
+        # made mostly of unknown trigrams scores low against everything
+        document_frequency = np.bincount(key_ids, minlength=len(self._codes))
+        self._idf = np.log((1 + len(self.keys)) / (1 + document_frequency)) + 1
+        self._unknown_idf = math.log(1 + len(self.keys)) + 1
+
+        matrix = np.zeros((len(self._codes), len(self.keys)), dtype=np.float32)
+        matrix[key_ids, rows] = counts * self._idf[key_ids]
+        norms = np.linalg.norm(matrix, axis=0)
+        self._matrix = matrix / np.where(norms > 0, norms, 1)
+
+    # Cosine similarity of each label to each key, shape (len(labels), len(keys))
+    def scores(self, labels):
+        labels = list(labels)
+        result = np.zeros((len(labels), len(self.keys)), dtype=np.float32)
+        for start in range(0, len(labels), CHUNK_SIZE):
+            chunk = labels[start:start + CHUNK_SIZE]
+            result[start:start + len(chunk)] = self._score_chunk(chunk)
+        return result
+
+    def _score_chunk(self, labels):
+        rows, codes, counts = trigram_counts(labels)
+        ids = np.searchsorted(self._codes, codes)
+        ids = np.minimum(ids, len(self._codes) - 1)
+        known = self._codes[ids] == codes
+
+        weights = counts * np.where(known, self._idf[ids], self._unknown_idf)
+        norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=len(labels)))
+
+        vectors = np.bincount(rows[known] * len(self._codes) + ids[known], weights=weights[known],
+                              minlength=len(labels) * len(self._codes))
+        vectors = vectors.reshape(len(labels), len(self._codes)).astype(np.float32)
+        return (vectors @ self._matrix) / np.where(norms > 0, norms, 1)[:, None].astype(np.float32)
+
+    # Best key and its score for every label; the key is None when the best
+    # score is below `cutoff`
+    def match_batch(self, labels, cutoff=FUZZY_CUTOFF):
+        labels = list(labels)
+        if not labels:
+            return []
+        scores = self.scores(labels)
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(labels)), best]
+        return [(self.keys[index] if score >= cutoff else None, float(score))
+                for index, score in zip(best.tolist(), best_scores.tolist())]
+
+    def match(self, label, cutoff=FUZZY_CUTOFF):
+        return self.match_batch([label], cutoff)[0]
@@ -0,0 +1,54 @@
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from .metrics import metrics
+from .prefilter import image_measures
+
+
+# Decode an image no larger than needed for `max_size`.
+# For JPEGs, draft() asks the decoder for a 1/2, 1/4 or 1/8 scale DCT decode
+# that is still at least max_size, so a 12MP photo is never decoded at full
+# resolution. The RGB conversion runs after the downscale, on the small image,
+# and only when the source is not RGB already.
+def load_downscaled(image_path, max_size=(512, 512)):
+    image = Image.open(image_path)
+    if image.format == "JPEG":
+        image.draft("RGB", max_size)
+    elif image.mode not in ("RGB", "L", "RGBA"):
+        image = image.convert("RGB")
+    image.thumbnail(max_size, reducing_gap=2.0)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+# Downscaled JPEG bytes ready to upload. Pass a dict as `stats` to get the
+# source and payload sizes, the bytes saved and the time spent, and one as
+# `measures` to get the sharpness, brightness and colour entropy of the
+# downscaled image (prefilter.py).
+def encode_jpeg(image_path, max_size=(512, 512), quality=85, stats=None, measures=None):
+    started = time.perf_counter()
+    with metrics.timer("decode"):
+        image = load_downscaled(image_path, max_size)
+    if measures is not None:
+        with metrics.timer("prefilter"):
+            measures.update(image_measures(np.asarray(image)))
+    with metrics.timer("jpeg_encode"):
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=quality)
+        data = buffer.getvalue()
+
+    if stats is not None:
+        source_bytes = os.path.getsize(image_path)
+        stats.update({
+            "source_bytes": source_bytes,
+            "payload_bytes": len(data),
+            "bytes_saved": source_bytes - len(data),
+            "size": image.size,
+            "encode_ms": (time.perf_counter() - started) * 1000,
+        })
+    return data
@@ -0,0 +1,68 @@
+import re
+from functools import lru_cache
+
+
+# Keyword matcher compiled once from a `categories` dict ({keyword: category}).
+# The keywords are folded into a trie and the trie is emitted as one regular
+# expression, so a label is scanned in a single pass by the C regex engine
+# instead of running `keyword in label` for every keyword.
+class KeywordMatcher:
+    def __init__(self, categories, cache_size=65536):
+        self.categories = {keyword.lower(): category for keyword, category in categories.items()}
+
+        trie = {}
+        for keyword in self.categories:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = True
+
+        # The lookahead reports a match at every start position, so keywords
+        # that overlap an earlier match are still found.
+        self._pattern = re.compile(f"(?=({self._trie_to_regex(trie)}))") if trie else None
+        # Same keywords, only as whole words (plurals allowed), for sentences:
+        # "garbage" must not count as a "bag"
+        self._word_pattern = re.compile(rf"(?=\b({self._trie_to_regex(trie)})(?:e?s)?\b)") if trie else None
+
+        # Stored captions repeat the same labels over and over, so remember
+        # the most recent answers.
+        self.best_keyword = lru_cache(maxsize=cache_size)(self._best_keyword)
+
+    # Emit a trie node as a regex. Optional groups are greedy, so the longest
+    # keyword starting at a given position is preferred.
+    def _trie_to_regex(self, node):
+        terminal = "" in node
+        branches = [re.escape(char) + self._trie_to_regex(child)
+                    for char, child in sorted(node.items()) if char != ""]
+        if not branches:
+            return ""
+        if len(branches) == 1:
+            pattern = branches[0]
+            if terminal:
+                return f"(?:{pattern})?"
+            return pattern
+        pattern = "(?:" + "|".join(branches) + ")"
+        if terminal:
+            pattern += "?"
+        return pattern
+
+    # Longest keyword found in the label; ties go to the leftmost occurrence
+    def _best_keyword(self, label):
+        if self._pattern is None:
+            return None
+        found = self._pattern.findall(label.lower())
+        if not found:
+            return None
+        return max(found, key=len) or None
+
+    # Category of the longest keyword found in the label, or None
+    def match(self, label):
+        keyword = self.best_keyword(label)
+        return self.categories[keyword] if keyword else None
+
+    # Category of the longest keyword found as a whole word in the text, or None
+    def match_word(self, text):
+        if self._word_pattern is None:
+            return None
+        keyword = max(self._word_pattern.findall(text.lower()), key=len, default=None)
+        return self.categories[keyword] if keyword else None
@@ -0,0 +1,221 @@
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+MAX_SAMPLES = 100000
+TIMELINE_SECONDS = 3600
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _percentile(sorted_values, quantile):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(quantile * len(sorted_values)))]
+
+
+# Per-stage timings, counters and in-flight gauges for one process.
+#   timer(stage) / observe(stage, seconds)  durations, reported as p50/p95/p99
+#   count(name, value, **labels)            counters such as bytes sent
+#   in_flight(name)                         concurrency gauge, with the highest
+#                                           value seen in each second of the
+#                                           last TIMELINE_SECONDS
+# Each stage keeps at most MAX_SAMPLES durations (a uniform reservoir sample);
+# counts and sums are exact. Memory stays bounded however long the process runs.
+class Metrics:
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._stages.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {"count": 0, "sum": 0.0, "max": 0.0, "samples": []}
+            entry["count"] += 1
+            entry["sum"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            samples = entry["samples"]
+            if len(samples) < self.max_samples:
+                samples.append(seconds)
+            else:
+                index = self._random.randrange(entry["count"])
+                if index < self.max_samples:
+                    samples[index] = seconds
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def _gauge_change(self, name, delta):
+        second = int(time.time() - self.started)
+        with self._lock:
+            gauge = self._gauges.get(name)
+            if gauge is None:
+                gauge = self._gauges[name] = {"current": 0, "max": 0, "timeline": {}}
+            gauge["current"] += delta
+            gauge["max"] = max(gauge["max"], gauge["current"])
+            timeline = gauge["timeline"]
+            if second not in timeline and len(timeline) >= TIMELINE_SECONDS:
+                del timeline[next(iter(timeline))]
+            timeline[second] = max(timeline.get(second, 0), gauge["current"])
+
+    @contextmanager
+    def in_flight(self, name):
+        self._gauge_change(name, 1)
+        try:
+            yield
+        finally:
+            self._gauge_change(name, -1)
+
+    def to_dict(self):
+        with self._lock:
+            stages = {}
+            for stage, entry in self._stages.items():
+                samples = sorted(entry["samples"])
+                stages[stage] = {
+                    "count": entry["count"],
+                    "total_seconds": round(entry["sum"], 6),
+                    "mean_seconds": round(entry["sum"] / entry["count"], 6),
+                    "max_seconds": round(entry["max"], 6),
+                    **{f"p{int(q * 100)}_seconds": round(_percentile(samples, q), 6) for q in QUANTILES},
+                }
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                key = name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+                counters[key] = value
+            gauges = {}
+            for name, gauge in self._gauges.items():
+                timeline = gauge["timeline"]
+                first = next(iter(timeline)) if timeline else 0
+                last = max(timeline) if timeline else -1
+                gauges[name] = {
+                    "current": gauge["current"],
+                    "max": gauge["max"],
+                    # Highest value in each second, starting `per_second_start`
+                    # seconds after the start of the run
+                    "per_second_start": first,
+                    "per_second_max": [timeline.get(second, 0) for second in range(first, last + 1)],
+                }
+            return {"elapsed_seconds": round(time.time() - self.started, 3),
+                    "stages": stages, "counters": counters, "in_flight": gauges}
+
+    # Prometheus text exposition format
+    def prometheus_text(self, prefix="moondream"):
+        data = self.to_dict()
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for stage, entry in data["stages"].items():
+            for quantile in QUANTILES:
+                value = entry[f"p{int(quantile * 100)}_seconds"]
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {value}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {entry["total_seconds"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                declared.add(name)
+            label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+            lines.append(f"{prefix}_{name}_total{label_text} {value}")
+
+        if data["in_flight"]:
+            lines.append(f"# TYPE {prefix}_in_flight gauge")
+            for name, gauge in data["in_flight"].items():
+                lines.append(f'{prefix}_in_flight{{name="{name}"}} {gauge["current"]}')
+            lines.append(f"# TYPE {prefix}_in_flight_max gauge")
+            for name, gauge in data["in_flight"].items():
+                lines.append(f'{prefix}_in_flight_max{{name="{name}"}} {gauge["max"]}')
+        return "\n".join(lines) + "\n"
+
+    # Writes <base_path>_metrics.json and <base_path>_metrics.prom
+    def export(self, base_path):
+        with open(base_path + "_metrics.json", "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=4, ensure_ascii=False)
+        with open(base_path + "_metrics.prom", "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        return base_path + "_metrics.json", base_path + "_metrics.prom"
+
+    # Per-stage table for the console
+    def summary(self):
+        data = self.to_dict()
+        lines = [f"{'stage':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'total s':>10}"]
+        for stage, entry in data["stages"].items():
+            lines.append(f"{stage:<16}{entry['count']:>8}{entry['p50_seconds'] * 1000:>10.1f}"
+                         f"{entry['p95_seconds'] * 1000:>10.1f}{entry['p99_seconds'] * 1000:>10.1f}"
+                         f"{entry['total_seconds']:>10.2f}")
+        for name, value in data["counters"].items():
+            lines.append(f"{name}: {value}")
+        for name, gauge in data["in_flight"].items():
+            lines.append(f"in flight ({name}): max {gauge['max']}")
+        return "\n".join(lines)
+
+
+# Process-wide metrics used by the client, the pipeline and the scripts
+metrics = Metrics()
+
+
+# "--profile" or "--profile=pyinstrument" from the command line, or None
+def profile_option(argv):
+    for arg in argv:
+        if arg == "--profile":
+            return "cprofile"
+        if arg.startswith("--profile="):
+            return arg.partition("=")[2]
+    return None
+
+
+# Runs function(*args) under a profiler and writes the dump to output_path:
+# a .prof file for cProfile (open with snakeviz or pstats) or an HTML report
+# for pyinstrument. Falls back to cProfile when pyinstrument is missing.
+def profile_call(function, *args, output_path="profile", tool="cprofile"):
+    if tool == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("[Moondream] pyinstrument is not installed, using cProfile.")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                return function(*args)
+            finally:
+                profiler.stop()
+                with open(output_path + ".html", "w", encoding="utf-8") as f:
+                    f.write(profiler.output_html())
+                print(f"Profile saved to: {output_path}.html")
+
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        profiler.dump_stats(output_path + ".prof")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+        print(f"Profile saved to: {output_path}.prof")
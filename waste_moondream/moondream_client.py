@@ -0,0 +1,320 @@
+import asyncio
+import atexit
+import binascii
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+
+import aiohttp
+
+from .adaptive_concurrency import AIMDLimiter, FixedLimiter, OVERLOAD_STATUSES, RETRYABLE_STATUSES, \
+    backoff_delay, parse_retry_after
+from .batching import BATCH_DELAY, BATCH_SIZE, CaptionBatcher, batch_prompt, split_batch_response
+from .metrics import metrics
+from .result_cache import cache_key, shared_cache
+
+API_URL = os.getenv("MOONDREAM_API_URL", "https://api.moondream.ai/v1/chat/completions")
+MODEL_NAME = "moondream-2B"
+MAX_CONCURRENCY = int(os.getenv("MOONDREAM_MAX_CONCURRENCY", "100"))
+INITIAL_CONCURRENCY = int(os.getenv("MOONDREAM_INITIAL_CONCURRENCY", "8"))
+ADAPTIVE_CONCURRENCY = os.getenv("MOONDREAM_ADAPTIVE", "1") != "0"
+MAX_RETRIES = int(os.getenv("MOONDREAM_MAX_RETRIES", "5"))
+REQUEST_TIMEOUT = float(os.getenv("MOONDREAM_TIMEOUT", "60"))
+CONNECT_TIMEOUT = float(os.getenv("MOONDREAM_CONNECT_TIMEOUT", "10"))
+
+
+# Chat completion payload with one image and one text prompt
+def build_payload(image_b64, prompt, model=MODEL_NAME):
+    return build_batch_payload([image_b64], prompt, model)
+
+
+# Chat completion payload with several images followed by one text prompt
+def build_batch_payload(images_b64, prompt, model=MODEL_NAME):
+    content = [
+        {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:image/jpeg;base64,{image_b64}"
+            }
+        }
+        for image_b64 in images_b64
+    ]
+    content.append({
+        "type": "text",
+        "text": prompt
+    })
+    return {
+        "model": model,
+        "messages": [
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
+    }
+
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+_IMAGE_MARKER = "@@MOONDREAM_IMAGE@@"
+_BASE64_CHUNK = 3 * 16 * 1024
+
+
+# JSON text around the base64 data of `count` images for a prompt and model
+@lru_cache(maxsize=64)
+def _payload_frame(prompt, model, count=1):
+    text = json.dumps(build_batch_payload([_IMAGE_MARKER] * count, prompt, model))
+    return [piece.encode("utf-8") for piece in text.split(_IMAGE_MARKER)]
+
+
+def _encoded_size(image_data):
+    if isinstance(image_data, str):
+        return len(image_data)
+    return 4 * ((len(image_data) + 2) // 3)
+
+
+# The request body as one preallocated bytearray. Raw JPEG bytes are base64
+# encoded chunk by chunk straight into the buffer, so the image is not copied
+# through a base64 string, a data URL f-string and json.dumps on the way out.
+# A base64 str (from encode_image) is copied in once. `image_data` may also
+# be a list of images for a batched request.
+def build_payload_body(image_data, prompt, model=MODEL_NAME):
+    images = image_data if isinstance(image_data, list) else [image_data]
+    pieces = _payload_frame(prompt, model, len(images))
+
+    body = bytearray(sum(len(piece) for piece in pieces) + sum(_encoded_size(image) for image in images))
+    view = memoryview(body)
+    view[:len(pieces[0])] = pieces[0]
+    position = len(pieces[0])
+
+    for image, piece in zip(images, pieces[1:]):
+        if isinstance(image, str):
+            encoded = image.encode("ascii")
+            view[position:position + len(encoded)] = encoded
+            position += len(encoded)
+        else:
+            source = memoryview(image)
+            for start in range(0, len(source), _BASE64_CHUNK):
+                chunk = binascii.b2a_base64(source[start:start + _BASE64_CHUNK], newline=False)
+                view[position:position + len(chunk)] = chunk
+                position += len(chunk)
+        view[position:position + len(piece)] = piece
+        position += len(piece)
+
+    return body
+
+
+# asyncio client that keeps one keep-alive connection pool for every request
+# and caps the number of requests in flight. With `adaptive` the cap is an
+# AIMD limit between 1 and `max_concurrency` that follows the API's real
+# capacity; otherwise it is a fixed semaphore of `max_concurrency`.
+# Throttled (429/503), failed (5xx) and timed-out requests are retried with
+# jittered exponential backoff, honoring Retry-After. With a `cache`
+# (ResultCache), captions already known for the same image, model and prompt
+# are returned without calling the API. With `batch_size` > 1, concurrent
+# captions for the same prompt are packed into multi-image requests of up to
+# that many images, waiting at most `batch_delay` seconds to fill a batch.
+class AsyncMoondreamClient:
+    def __init__(self, api_key, api_url=API_URL, model=MODEL_NAME, max_concurrency=MAX_CONCURRENCY,
+                 timeout=REQUEST_TIMEOUT, connect_timeout=CONNECT_TIMEOUT, adaptive=ADAPTIVE_CONCURRENCY,
+                 initial_concurrency=INITIAL_CONCURRENCY, max_retries=MAX_RETRIES, cache=None,
+                 batch_size=BATCH_SIZE, batch_delay=BATCH_DELAY):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=connect_timeout)
+        self.adaptive = adaptive
+        self.initial_concurrency = initial_concurrency
+        self.max_retries = max_retries
+        self.cache = cache
+        self.batcher = None
+        if batch_size > 1:
+            self.batcher = CaptionBatcher(self._request_batch, self._request, batch_size, batch_delay)
+        self.retries = 0
+        self.limiter = None
+        self._session = None
+
+    async def start(self):
+        if self._session is None:
+            if self.adaptive:
+                self.limiter = AIMDLimiter(initial=self.initial_concurrency, max_limit=self.max_concurrency)
+            else:
+                self.limiter = FixedLimiter(self.max_concurrency)
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+        return self
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # Caption text for one image, or None if the request failed.
+    # `image_data` is raw JPEG bytes or the base64 text from encode_image.
+    # The cache is SQLite, so its lookups and writes run on a thread rather
+    # than blocking every request in flight on the event loop.
+    async def caption(self, image_data, prompt):
+        started = time.perf_counter()
+        key = None
+        if self.cache is not None:
+            key = cache_key(image_data, self.model, prompt)
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                metrics.count("cache_hits")
+                return cached
+
+        if self.batcher is not None:
+            caption = await self.batcher.caption(image_data, prompt)
+        else:
+            caption = await self._request(image_data, prompt)
+        if caption is not None and key is not None:
+            await asyncio.to_thread(self.cache.put, key, caption, self.model, prompt)
+        metrics.observe("caption", time.perf_counter() - started)
+        return caption
+
+    async def _request(self, image_data, prompt):
+        with metrics.timer("build_body"):
+            body = build_payload_body(image_data, prompt, self.model)
+        return await self._post(body)
+
+    # One request for several images; one caption (or None) per image
+    async def _request_batch(self, images, prompt):
+        with metrics.timer("build_body"):
+            body = build_payload_body(images, batch_prompt(prompt, len(images)), self.model)
+        text = await self._post(body)
+        return split_batch_response(text, len(images))
+
+    # Message content of the response to a prepared request body, or None
+    async def _post(self, body):
+        await self.start()
+        error = None
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+
+            # The slot is released before backing off, so sleeping retries
+            # do not hold back other requests
+            waiting = time.perf_counter()
+            async with self.limiter:
+                metrics.observe("limiter_wait", time.perf_counter() - waiting)
+                started = time.monotonic()
+                try:
+                    with metrics.in_flight("http"), metrics.timer("http"):
+                        metrics.count("bytes_sent", len(body))
+                        async with self._session.post(self.api_url, data=body, headers=JSON_HEADERS) as response:
+                            raw = await response.read()
+                    metrics.count("bytes_received", len(raw))
+                    metrics.count("http_responses", status=response.status)
+
+                    if response.status == 200:
+                        result = json.loads(raw)
+                        self.limiter.on_success(time.monotonic() - started)
+                        return result["choices"][0]["message"]["content"]
+                    if response.status == 403:
+                        print("[Moondream] ERROR: 403 - API access denied. Please check your Moondream API key.")
+                        return None
+
+                    error = f"{response.status} - {raw.decode('utf-8', 'replace')}"
+                    if response.status not in RETRYABLE_STATUSES:
+                        self.limiter.on_error()
+                        print(f"[Moondream] API Error: {error}")
+                        return None
+
+                    if response.status in OVERLOAD_STATUSES:
+                        self.limiter.on_overload()
+                    else:
+                        self.limiter.on_error()
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                except asyncio.TimeoutError:
+                    self.limiter.on_overload()
+                    error = f"timed out after {self.timeout.total:.0f} seconds"
+                except aiohttp.ClientError as e:
+                    self.limiter.on_error()
+                    error = str(e)
+                except (ValueError, KeyError, IndexError) as e:
+                    print(f"[Moondream] JSON parsing error: {str(e)}")
+                    return None
+
+            if attempt < self.max_retries:
+                self.retries += 1
+                metrics.count("retries")
+                await asyncio.sleep(backoff_delay(attempt, retry_after=retry_after))
+
+        print(f"[Moondream] Request failed after {self.max_retries + 1} attempts: {error}")
+        return None
+
+
+# Blocking wrapper around AsyncMoondreamClient for the thread-based scripts.
+# The async client runs on one background event loop, so every calling
+# thread shares the same connection pool and concurrency limit.
+class MoondreamClient:
+    def __init__(self, api_key, **client_options):
+        self._client = AsyncMoondreamClient(api_key, **client_options)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="moondream-client", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def max_concurrency(self):
+        return self._client.max_concurrency
+
+    @property
+    def limiter(self):
+        return self._client.limiter
+
+    @property
+    def cache(self):
+        return self._client.cache
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def caption(self, image_data, prompt):
+        return self._run(self._client.caption(image_data, prompt))
+
+    # concurrent.futures.Future for the caption, without blocking the caller
+    def submit(self, image_data, prompt):
+        return asyncio.run_coroutine_threadsafe(self._client.caption(image_data, prompt), self._loop)
+
+    # Caption several images concurrently; results keep the input order
+    def caption_many(self, images, prompt):
+        async def gather():
+            return await asyncio.gather(*(self._client.caption(image_data, prompt) for image_data in images))
+        return self._run(gather())
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        if self._thread.is_alive():
+            self._run(self._client.close())
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+        self._loop.close()
+
+
+_shared_clients = {}
+_shared_lock = threading.Lock()
+
+
+# One MoondreamClient per API key for the whole process, backed by the
+# shared result cache unless MOONDREAM_CACHE=0
+def shared_client(api_key):
+    with _shared_lock:
+        client = _shared_clients.get(api_key)
+        if client is None:
+            client = MoondreamClient(api_key, cache=shared_cache())
+            _shared_clients[api_key] = client
+        return client
@@ -0,0 +1,222 @@
+import base64
+import os
+import sys
+from dotenv import load_dotenv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .image_encoding import encode_jpeg
+from .backends import get_backend
+from .classifier import classify_caption, result_from_caption
+from .prompts import MATERIAL_PROMPT, PROMPT_NAME, PROMPTS
+from .result_cache import shared_cache
+from .pipeline import open_results_table, run_pipeline
+from .folder_scanner import IncrementalResults
+from .dedup import DEDUP_THRESHOLD, dedup_report, group_near_duplicates
+from .cascade import ResolutionCascade
+from .prefilter import PREFILTER_MODE, Skipped, rejection_reasons, skipped_result
+from .metrics import metrics, profile_call, profile_option
+
+load_dotenv()
+
+API_KEY = os.getenv("MOONDREAM_API_KEY")
+PROMPT_TEXT = PROMPTS.get(PROMPT_NAME, MATERIAL_PROMPT)
+
+
+# Downscaled JPEG bytes; the client streams them into the request body.
+# Unless MOONDREAM_PREFILTER is "off", the downscaled image is also checked
+# for blur, darkness and low colour entropy: the reasons and measures are put
+# in `screening`, and with "skip" such an image comes back as
+# prefilter.Skipped instead of bytes.
+def encode_image_bytes(image_path, max_size=(512, 512), quality=85, screening=None):
+    measures = {} if PREFILTER_MODE != "off" else None
+    try:
+        image_data = encode_jpeg(image_path, max_size, quality, measures=measures)
+    except Exception as e:
+        print(f"[Moondream] Image processing error: {str(e)}")
+        return None
+
+    if measures is None:
+        return image_data
+    reasons = rejection_reasons(measures)
+    if screening is not None:
+        screening.update(reasons=reasons, measures=measures)
+    if reasons and PREFILTER_MODE == "skip":
+        return Skipped(reasons, measures)
+    return image_data
+
+# Encode function of the streaming pipeline: (bytes or prefilter.Skipped,
+# screening). It runs in the encode process pool, so the screening is
+# returned with the image rather than filled in for the caller.
+def encode_image_screened(image_path):
+    screening = {}
+    return encode_image_bytes(image_path, screening=screening), screening
+
+def encode_image(image_path, max_size=(512, 512), quality=85):
+    image_data = encode_image_bytes(image_path, max_size, quality)
+    if not image_data or isinstance(image_data, Skipped):
+        return None
+    with metrics.timer("base64"):
+        return base64.b64encode(image_data).decode("utf-8")
+
+def analyze_image(image_path, screening=None):
+    backend = get_backend(API_KEY)
+    if backend is None:
+        print("[Moondream] API key not found.")
+        return None
+
+    image_data = encode_image_bytes(image_path, screening=screening)
+    if not image_data or isinstance(image_data, Skipped):
+        return None
+
+    # The API client reuses one keep-alive connection pool and caps the
+    # requests in flight, however many worker threads call in
+    return backend.caption(image_data, PROMPT_TEXT)
+
+# Images rejected by the pre-filter get skipped_result() in "skip" mode, and
+# their reasons as "quality_flags" in "flag" mode
+def detect_and_classify(image_path):
+    try:
+        screening = {}
+        caption = analyze_image(image_path, screening)
+        if screening.get("reasons") and PREFILTER_MODE == "skip":
+            print(f"--- SKIPPED: {', '.join(screening['reasons'])} ---")
+            return skipped_result(screening["reasons"], screening["measures"])
+        print(f"--- API CAPTION: {caption} ---")
+        result = result_from_caption(caption)
+        if screening.get("reasons"):
+            result.update(quality_flags=screening["reasons"], quality=screening["measures"])
+        return result
+    except Exception as e:
+        print(f"[Moondream] Error during detection: {str(e)}")
+        return {"error": str(e)}
+
+# With dedup=True, near-identical images (perceptual hash within
+# dedup_threshold bits) are sent once and the result is copied to the others.
+# Subfolders are included; with incremental=True only images that are new or
+# changed since the last run are sent, and the earlier results are kept.
+# With cascade=True each image is sent small first and again at a larger size
+# only when the answer is empty, vague or has unknown labels (cascade.py).
+def process_folder_parallel(folder_path, max_workers=100, dedup=False, dedup_threshold=DEDUP_THRESHOLD,
+                            incremental=True, cascade=False):
+    start_time = time.time()
+    metrics.reset()
+
+    resolution_cascade = None
+    if cascade:
+        backend = get_backend(API_KEY)
+        if backend is None:
+            print("[Moondream] API key not found.")
+            return None
+        resolution_cascade = ResolutionCascade(backend, PROMPT_TEXT, classify_caption)
+
+    results_path = os.path.join(folder_path, "waste_results_parallel.json")
+    state = IncrementalResults(folder_path, results_path,
+                               os.path.join(folder_path, "waste_results_parallel.manifest"), incremental)
+    entries = state.pending()
+
+    duplicates_of = {}
+    if dedup:
+        entries = list(entries)
+        by_path = {entry.path: entry for entry in entries}
+        groups = group_near_duplicates(list(by_path), dedup_threshold)
+        report = dedup_report(groups, dedup_threshold, {path: entry.name for path, entry in by_path.items()})
+        with open(os.path.join(folder_path, "waste_results_dedup_report.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        print(f"Dedup: {report['duplicates']} near-duplicates of {report['representatives']} images skipped.\n")
+
+        entries = [by_path[path] for path in groups]
+        for representative, duplicates in groups.items():
+            duplicates_of[representative] = [by_path[path] for path in duplicates]
+
+    def worker(entry):
+        print(f"Processing {entry.name}...")
+        if resolution_cascade:
+            return resolution_cascade.detect_and_classify(entry.path)
+        return detect_and_classify(entry.path)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Images are submitted while the folder is still being scanned
+        futures = {}
+        for entry in entries:
+            futures[executor.submit(worker, entry)] = entry
+        print(f"\nFound {len(futures)} new or changed images "
+              f"({len(state.seen) - len(futures) - sum(map(len, duplicates_of.values()))} unchanged).\n")
+
+        for idx, future in enumerate(as_completed(futures), 1):
+            entry = futures[future]
+            try:
+                result_dict = future.result()
+                state.add(entry, result_dict)
+                for duplicate in duplicates_of.get(entry.path, []):
+                    state.add(duplicate, {**result_dict, "duplicate_of": entry.name})
+            except Exception as e:
+                print(f"Error processing {entry.name}: {str(e)}")
+
+    state.close()
+    all_results = state.results()
+    total_counts = {"paper": 0, "plastic": 0, "metal": 0, "glass": 0}
+    for result in all_results.values():
+        for category in total_counts:
+            total_counts[category] += result.get(category, 0)
+
+    with metrics.timer("write"):
+        with open(results_path, "w", encoding="utf-8") as f:
+            json.dump(all_results, f, indent=4, ensure_ascii=False)
+
+        with open(os.path.join(folder_path, "waste_results_total_parallel.json"), "w", encoding="utf-8") as f:
+            json.dump(total_counts, f, indent=4, ensure_ascii=False)
+
+        # Only this run's results: load_results merges the tables of earlier
+        # runs, the last row of an image winning
+        table = open_results_table(os.path.join(folder_path, "waste_results_parallel"), folder_path)
+        if table is not None:
+            for image_file, result in state.new.items():
+                table.write(image_file, result)
+            table.close()
+
+    end_time = time.time()
+    print(f"\nCompleted in {end_time - start_time:.2f} seconds.")
+
+    cache = shared_cache()
+    if cache:
+        print(f"Cache: {cache.stats()}")
+
+    if resolution_cascade:
+        with open(os.path.join(folder_path, "waste_results_cascade_report.json"), "w", encoding="utf-8") as f:
+            json.dump(resolution_cascade.stats(), f, indent=4, ensure_ascii=False)
+        print(f"\n{resolution_cascade.summary()}")
+
+    print(f"\n{metrics.summary()}")
+    print(f"Metrics saved to: {metrics.export(os.path.join(folder_path, 'waste_results_parallel'))[0]}")
+
+# Streaming variant: results are appended per image and checkpointed, so a
+# crashed run resumes where it stopped and memory does not grow with the folder
+def process_folder_streaming(folder_path, max_in_flight=100, encode_workers=None):
+    backend = get_backend(API_KEY)
+    if backend is None:
+        print("[Moondream] API key not found.")
+        return None
+
+    totals = run_pipeline(folder_path, backend, PROMPT_TEXT, encode_image_screened, classify_caption,
+                          output_prefix="waste_results_stream", max_in_flight=max_in_flight,
+                          encode_workers=encode_workers)
+
+    cache = shared_cache()
+    if cache:
+        print(f"Cache: {cache.stats()}")
+    return totals
+
+# Main: python -m waste_moondream.multithreding [--profile | --profile=pyinstrument]
+if __name__ == "__main__":
+    arguments = [arg for arg in sys.argv[1:] if not arg.startswith("--profile")]
+    if not arguments:
+        sys.exit("usage: python -m waste_moondream.multithreding <folder> [--profile[=pyinstrument]]\n"
+                 "       or: waste-moondream folder <folder>")
+    folder_path = arguments[0]
+    profiler = profile_option(sys.argv[1:])
+    if profiler:
+        profile_call(process_folder_parallel, folder_path, 100,
+                     output_path=os.path.join(folder_path, "waste_results_profile"), tool=profiler)
+    else:
+        process_folder_parallel(folder_path, max_workers=100)
@@ -0,0 +1,317 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from .classifier import CATEGORY_FIELDS
+from .folder_scanner import Manifest, scan_images
+from .metrics import metrics
+from .prefilter import Skipped, skipped_result
+
+
+# Stage 1: image files in the folder and its subfolders, yielded as they are
+# found. Names are paths relative to the folder. With a checkpoint, only
+# files that are new or changed (size or mtime) since they were processed
+# come through.
+def discover_images(folder_path, checkpoint=None):
+    entries = scan_images(folder_path)
+    if checkpoint is not None:
+        entries = checkpoint.changed(entries)
+    for entry in entries:
+        yield entry.name, entry.path
+
+
+# Stage 2: (name, path) -> (name, encoded image or prefilter.Skipped or None,
+# screening). `encode(path)` returns (image, screening), where screening is
+# the pre-filter's {"reasons", "measures"} (empty when it is off).
+def encode_images(images, encode):
+    for name, path in images:
+        with metrics.timer("encode"):
+            image_data, screening = encode(path)
+        yield name, image_data, screening
+
+
+_END = object()
+
+
+# Stage 2, parallel: encodes on a process pool (or a thread pool, since Pillow
+# releases the GIL while decoding) from a background thread and hands results
+# to the network stage through a bounded queue. Decoding scales with cores,
+# the request stage never waits on CPU work, and at most `queue_size` encoded
+# images wait in memory. Results come out in completion order; `encode` must
+# be picklable for the process pool (a module-level function).
+def encode_images_parallel(images, encode, workers=None, use_processes=True, queue_size=None):
+    workers = workers or os.cpu_count() or 1
+    queue_size = queue_size or 4 * workers
+    encoded = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                encoded.put((time.perf_counter(), item), timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        try:
+            with executor_class(max_workers=workers) as executor:
+                pending = {}
+                for name, path in images:
+                    if stopped.is_set():
+                        break
+                    pending[executor.submit(_timed_call, encode, path)] = name
+                    if len(pending) >= 2 * workers:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            put(_encoded_result(pending.pop(future), future))
+                for future in list(pending):
+                    put(_encoded_result(pending.pop(future), future))
+        except Exception as e:
+            put(e)
+        put(_END)
+
+    producer = threading.Thread(target=produce, name="encode-stage", daemon=True)
+    producer.start()
+    try:
+        while True:
+            queued, item = encoded.get()
+            if item is _END:
+                break
+            # Time an encoded image waited for the request stage
+            metrics.observe("encode_queue", time.perf_counter() - queued)
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+
+# Runs in the pool worker; the elapsed time is recorded in this process,
+# since metrics recorded inside a worker process stay there
+def _timed_call(function, *args):
+    started = time.perf_counter()
+    return function(*args), time.perf_counter() - started
+
+
+def _encoded_result(name, future):
+    try:
+        (image_data, screening), seconds = future.result()
+        metrics.observe("encode", seconds)
+        return name, image_data, screening
+    except Exception as e:
+        print(f"[Moondream] Image processing error ({name}): {str(e)}")
+        return name, None, None
+
+
+# Stage 3: (name, encoded image, screening) -> (name, caption or None,
+# screening), in completion order. Skipped images pass through without a
+# request.
+# At most `max_in_flight` requests are outstanding, so the stages upstream
+# are only pulled as fast as the API answers.
+def request_captions(encoded, client, prompt, max_in_flight=64):
+    pending = {}
+
+    def finish(future):
+        name, screening = pending.pop(future)
+        return name, future.result(), screening
+
+    for name, image_data, screening in encoded:
+        if image_data is None or isinstance(image_data, Skipped):
+            yield name, image_data, screening
+            continue
+
+        pending[client.submit(image_data, prompt)] = name, screening
+        if len(pending) >= max_in_flight:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield finish(future)
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield finish(future)
+
+
+# Stage 4: (name, caption, screening) -> (name, result dict). Images the
+# pre-filter rejected but that were still sent ("flag" mode) get their
+# reasons as "quality_flags", as in detect_and_classify.
+def classify_captions(captioned, classify):
+    for name, caption, screening in captioned:
+        if isinstance(caption, Skipped):
+            yield name, skipped_result(caption.reasons, caption.measures)
+            continue
+        if not caption:
+            yield name, {"error": "Moondream analysis failed."}
+            continue
+        with metrics.timer("classify"):
+            counts = classify(caption)
+        result = {"caption": caption}
+        for category in CATEGORY_FIELDS:
+            result[category] = counts.get(category, 0)
+        if screening and screening.get("reasons"):
+            result.update(quality_flags=screening["reasons"], quality=screening["measures"])
+        yield name, result
+
+
+# Stage 5: appends one JSON line per image and records it in an SQLite
+# checkpoint together with the running totals, so a restarted run skips
+# finished files and resumes the totals. The checkpoint keeps a manifest of
+# (name, size, mtime) and the counts of every processed file: a file that
+# changed is processed again and its old counts are taken out of the totals.
+# Failed images are written to the JSONL file but not checkpointed, so they
+# are retried on the next run; when a file appears more than once, its last
+# line wins. With a `table`
+# (results_store.ResultsTableWriter) every row is also written to the
+# columnar results table, one record batch per commit.
+class CheckpointWriter:
+    def __init__(self, results_path, totals_path, checkpoint_path, commit_every=50, table=None):
+        self.results_path = results_path
+        self.totals_path = totals_path
+        self.table = table
+        self.commit_every = commit_every
+        self.written = 0
+        self.failed = 0
+        self._uncommitted = 0
+
+        # The discover stage reads the manifest from the encode thread
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(checkpoint_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS totals (category TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS file_counts (name TEXT PRIMARY KEY, counts TEXT NOT NULL)")
+        self._db.executemany("INSERT OR IGNORE INTO totals (category, count) VALUES (?, 0)",
+                             [(category,) for category in CATEGORY_FIELDS])
+        self._db.commit()
+        self.totals = dict(self._db.execute("SELECT category, count FROM totals"))
+        self.manifest = Manifest(self._db, self._lock)
+        self._discovered = {}
+        self._results = open(results_path, "a", encoding="utf-8")
+
+    # New and changed entries; remembers their size and mtime until the
+    # result is written
+    def changed(self, entries):
+        for entry in self.manifest.changed(entries):
+            with self._lock:
+                self._discovered[entry.name] = entry
+            yield entry
+
+    def write(self, name, result):
+        with metrics.timer("write"):
+            self._write(name, result)
+
+    def _write(self, name, result):
+        self._results.write(json.dumps({"file": name, **result}, ensure_ascii=False) + "\n")
+        if self.table is not None:
+            self.table.write(name, result)
+        with self._lock:
+            entry = self._discovered.pop(name, None)
+
+        if "error" in result:
+            self.failed += 1
+            return
+
+        self.written += 1
+        counts = {category: result.get(category, 0) for category in CATEGORY_FIELDS}
+        with self._lock:
+            previous = self._db.execute("SELECT counts FROM file_counts WHERE name = ?", (name,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO file_counts (name, counts) VALUES (?, ?)",
+                             (name, json.dumps(counts)))
+        previous = json.loads(previous[0]) if previous else {}
+        for category in CATEGORY_FIELDS:
+            self.totals[category] += counts[category] - previous.get(category, 0)
+        if entry is not None:
+            self.manifest.record(entry)
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+
+    # Results reach the disk before the checkpoint that marks them done
+    def commit(self):
+        with metrics.timer("commit"):
+            self._commit()
+
+    def _commit(self):
+        if self.table is not None:
+            self.table.flush()
+        self._results.flush()
+        os.fsync(self._results.fileno())
+        with self._lock:
+            self._db.executemany("UPDATE totals SET count = ? WHERE category = ?",
+                                 [(count, category) for category, count in self.totals.items()])
+            self._db.commit()
+        self._uncommitted = 0
+        self._write_totals()
+
+    def _write_totals(self):
+        temp_path = self.totals_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.totals, f, indent=4, ensure_ascii=False)
+        os.replace(temp_path, self.totals_path)
+
+    def close(self):
+        self.commit()
+        self._results.close()
+        if self.table is not None:
+            self.table.close()
+        with self._lock:
+            self._db.close()
+
+
+# Columnar results table for this run, or None without pyarrow
+def open_results_table(base_path, folder_path):
+    try:
+        from .results_store import ResultsTableWriter, run_table_path
+    except ImportError:
+        return None
+    return ResultsTableWriter(run_table_path(base_path), os.path.abspath(folder_path))
+
+
+# Runs discover -> encode -> request -> classify -> write over a folder.
+# Writes <prefix>.jsonl, <prefix>_total.json and <prefix>.checkpoint next to
+# the images, plus one <prefix>.<run>.arrows results table per run when
+# pyarrow is installed, and returns the totals. Per-stage metrics of the run
+# are saved to <prefix>_metrics.json and <prefix>_metrics.prom. `encode_workers=0` encodes inline in
+# the calling thread; otherwise a process pool (or thread pool with
+# `encode_processes=False`) of that many workers is used, None meaning one
+# per core.
+def run_pipeline(folder_path, client, prompt, encode, classify, output_prefix="waste_results_stream",
+                 max_in_flight=64, encode_workers=None, encode_processes=True):
+    start_time = time.time()
+    metrics.reset()
+    base_path = os.path.join(folder_path, output_prefix)
+    writer = CheckpointWriter(base_path + ".jsonl", base_path + "_total.json", base_path + ".checkpoint",
+                              table=open_results_table(base_path, folder_path))
+
+    try:
+        images = discover_images(folder_path, writer)
+        if encode_workers == 0:
+            encoded = encode_images(images, encode)
+        else:
+            encoded = encode_images_parallel(images, encode, encode_workers, encode_processes)
+        captioned = request_captions(encoded, client, prompt, max_in_flight)
+        for idx, (name, result) in enumerate(classify_captions(captioned, classify), 1):
+            writer.write(name, result)
+            if "error" in result:
+                print(f"[{idx}] {name}: {result['error']}")
+            elif "skipped" in result:
+                print(f"[{idx}] {name}: skipped ({', '.join(result['skipped'])})")
+            else:
+                print(f"[{idx}] {name}: " + ", ".join(f"{c}={result[c]}" for c in CATEGORY_FIELDS))
+    finally:
+        writer.close()
+
+    print(f"\nCompleted in {time.time() - start_time:.2f} seconds.")
+    print(f"Processed {writer.written} images ({writer.failed} failed).")
+    print(f"Results appended to: {writer.results_path}")
+    print(f"Totals saved to: {writer.totals_path}")
+    if writer.table is not None:
+        print(f"Results table: {writer.table.path}")
+    print(f"\n{metrics.summary()}")
+    print(f"Metrics saved to: {metrics.export(base_path)[0]}")
+    return writer.totals
@@ -0,0 +1,72 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+
+# "off" sends every image, "flag" sends them but records why they look
+# unusable, "skip" does not send them at all
+PREFILTER_MODE = os.getenv("MOONDREAM_PREFILTER", "off")
+# Variance of the Laplacian of the luminance (0-255); lower is blurrier
+PREFILTER_MIN_SHARPNESS = float(os.getenv("MOONDREAM_PREFILTER_MIN_SHARPNESS", "60"))
+# Mean luminance (0-255) below which an image is too dark, above which it is washed out
+PREFILTER_MIN_BRIGHTNESS = float(os.getenv("MOONDREAM_PREFILTER_MIN_BRIGHTNESS", "25"))
+PREFILTER_MAX_BRIGHTNESS = float(os.getenv("MOONDREAM_PREFILTER_MAX_BRIGHTNESS", "245"))
+# Entropy in bits of the colour histogram (3 bits per channel, at most 9);
+# screenshots and blank frames use few colours
+PREFILTER_MIN_ENTROPY = float(os.getenv("MOONDREAM_PREFILTER_MIN_ENTROPY", "2.5"))
+# Measures use every STEP-th pixel of the downscaled image in each direction
+STEP = 2
+
+# Returned by an encode function instead of the image when it is skipped
+Skipped = namedtuple("Skipped", ["reasons", "measures"])
+
+
+# Sharpness, brightness and colour entropy of an RGB uint8 array (H, W, 3),
+# e.g. np.asarray() of the downscaled image from encode_jpeg. The channels
+# are read as strided views, with no copy of the image.
+def image_measures(pixels, step=STEP):
+    red, green, blue = (pixels[::step, ::step, channel] for channel in range(3))
+    # Widened before the multiply: NumPy 1.x keeps uint8 * scalar in uint8
+    luma = red.astype(np.uint16) * np.uint16(77)
+    luma += green.astype(np.uint16) * np.uint16(150)
+    luma += blue.astype(np.uint16) * np.uint16(29)
+    luma = (luma >> 8).astype(np.int16)
+
+    # 4-neighbour Laplacian, in place on int16 (at most 4 * 255)
+    laplacian = luma[1:-1, 1:-1] * np.int16(4)
+    laplacian -= luma[:-2, 1:-1]
+    laplacian -= luma[2:, 1:-1]
+    laplacian -= luma[1:-1, :-2]
+    laplacian -= luma[1:-1, 2:]
+    laplacian = laplacian.ravel().astype(np.float32)
+    sharpness = float(laplacian @ laplacian) / laplacian.size - float(laplacian.mean()) ** 2 if laplacian.size else 0.0
+
+    # The histogram settles with far fewer pixels than the Laplacian needs
+    red, green, blue = red[::2, ::2], green[::2, ::2], blue[::2, ::2]
+    bins = ((red >> 5).astype(np.uint16) << 6) | ((green >> 5).astype(np.uint16) << 3) | (blue >> 5)
+    counts = np.bincount(bins.ravel(), minlength=512)
+    probabilities = counts[counts > 0] / bins.size
+    entropy = float((probabilities * np.log2(1 / probabilities)).sum())
+
+    return {"sharpness": round(sharpness, 1), "brightness": round(float(luma.mean()), 1), "entropy": round(entropy, 3)}
+
+
+# Why an image looks unusable: "blurry", "dark", "overexposed" or
+# "low_entropy" (screenshots, blank frames); empty when it looks fine
+def rejection_reasons(measures, min_sharpness=PREFILTER_MIN_SHARPNESS, min_brightness=PREFILTER_MIN_BRIGHTNESS,
+                      max_brightness=PREFILTER_MAX_BRIGHTNESS, min_entropy=PREFILTER_MIN_ENTROPY):
+    reasons = []
+    if measures["sharpness"] < min_sharpness:
+        reasons.append("blurry")
+    if measures["brightness"] < min_brightness:
+        reasons.append("dark")
+    elif measures["brightness"] > max_brightness:
+        reasons.append("overexposed")
+    if measures["entropy"] < min_entropy:
+        reasons.append("low_entropy")
+    return reasons
+
+
+# Result recorded for a skipped image; it adds nothing to the totals
+def skipped_result(reasons, measures):
+    return {"skipped": reasons, "quality": measures}
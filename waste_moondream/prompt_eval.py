@@ -0,0 +1,291 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from .caption_parser import parse_caption
+from .classifier import CATEGORY_FIELDS
+from .folder_scanner import scan_images
+from .prompts import PROMPTS
+
+EVAL_CACHE_PATH = os.getenv("MOONDREAM_EVAL_CACHE_PATH",
+                            os.path.join(os.path.expanduser("~"), ".cache", "waste-moondream", "eval_captions.sqlite"))
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+# Approximate token count (words and punctuation marks). The API does not
+# report usage, so this is only good for comparing prompts with each other.
+def estimate_tokens(text):
+    return len(_TOKEN.findall(text or ""))
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+
+
+# Every raw caption of an evaluation, keyed by (source image hash, prompt,
+# model, upload size) and never evicted, so scoring can be repeated offline.
+# The API latency of the original call is kept with the caption.
+class CaptionStore:
+    def __init__(self, path=EVAL_CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS eval_captions (
+                image_hash TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                max_size INTEGER NOT NULL,
+                prompt TEXT NOT NULL,
+                caption TEXT NOT NULL,
+                latency_seconds REAL NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (image_hash, prompt_hash, model, max_size)
+            )
+        """)
+
+    @staticmethod
+    def _prompt_hash(prompt):
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    # (caption, latency_seconds) or None
+    def get(self, image_hash, prompt, model, max_size):
+        with self._lock:
+            return self._db.execute(
+                "SELECT caption, latency_seconds FROM eval_captions "
+                "WHERE image_hash = ? AND prompt_hash = ? AND model = ? AND max_size = ?",
+                (image_hash, self._prompt_hash(prompt), model, max_size)).fetchone()
+
+    def put(self, image_hash, prompt, model, max_size, caption, latency_seconds):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO eval_captions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (image_hash, self._prompt_hash(prompt), model, max_size, prompt, caption, latency_seconds,
+                 time.time()))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# Expected counts per image from a JSON file ({"IMG-1.jpg": {"paper": 2, ...}})
+# or a CSV file with a `file` column and one column per category.
+# Missing categories count as 0.
+def load_ground_truth(path):
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = {row.pop("file"): row for row in csv.DictReader(f)}
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+    return {name: {category: int(counts.get(category) or 0) for category in CATEGORY_FIELDS}
+            for name, counts in rows.items()}
+
+
+# {prompt name: {image name: (caption or None, latency_seconds, cached)}}.
+# Only (image, prompt) pairs missing from the store are sent; each image is
+# encoded at most once. With offline=True nothing is sent.
+def collect_captions(images, prompts, store, backend, model, max_size=512, workers=8, offline=False):
+    from .image_encoding import encode_jpeg
+
+    hashes = {entry.name: file_hash(entry.path) for entry in images}
+    records = {name: {} for name in prompts}
+    missing = []
+    for prompt_name, prompt in prompts.items():
+        for entry in images:
+            stored = store.get(hashes[entry.name], prompt, model, max_size)
+            if stored:
+                records[prompt_name][entry.name] = (stored[0], stored[1], True)
+            else:
+                records[prompt_name][entry.name] = (None, None, False)
+                missing.append((prompt_name, entry))
+    if offline or not missing:
+        return records, 0
+
+    def encode(entry):
+        try:
+            with open(entry.path, "rb") as f:
+                return encode_jpeg(BytesIO(f.read()), (max_size, max_size))
+        except Exception as e:
+            print(f"[Moondream] Image encoding error ({entry.name}): {str(e)}")
+            return None
+
+    def call(pair):
+        prompt_name, entry = pair
+        image_data = encoded.get(entry.name)
+        if image_data is None:
+            return
+        prompt = prompts[prompt_name]
+        try:
+            started = time.perf_counter()
+            caption = backend.caption(image_data, prompt)
+            latency = time.perf_counter() - started
+        except Exception as e:
+            print(f"[Moondream] Evaluation error ({entry.name}, {prompt_name}): {str(e)}")
+            return
+        if caption:
+            store.put(hashes[entry.name], prompt, model, max_size, caption, latency)
+        records[prompt_name][entry.name] = (caption, latency, False)
+
+    needed = {entry.name: entry for _, entry in missing}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        encoded = dict(zip(needed, executor.map(encode, needed.values())))
+        list(executor.map(call, missing))
+    return records, len(missing)
+
+
+# Scores of one prompt: how often the caption parses, how close the counts
+# are to the ground truth, and the tokens and API latency it costs
+def score_prompt(prompt, records, truth, classify):
+    captions = {name: caption for name, (caption, _, _) in records.items() if caption}
+    formats = {}
+    for caption in captions.values():
+        layout = parse_caption(caption).format
+        formats[layout] = formats.get(layout, 0) + 1
+    parsed = len(captions) - formats.get("empty", 0)
+
+    labeled = [name for name in captions if name in truth]
+    exact = 0
+    errors = {category: 0 for category in CATEGORY_FIELDS}
+    for name in labeled:
+        counts = classify(captions[name])
+        difference = {category: abs(counts[category] - truth[name][category]) for category in CATEGORY_FIELDS}
+        exact += not any(difference.values())
+        for category in CATEGORY_FIELDS:
+            errors[category] += difference[category]
+
+    latencies = [latency for _, latency, _ in records.values() if latency is not None]
+    completion_tokens = [estimate_tokens(caption) for caption in captions.values()]
+    return {
+        "images": len(records),
+        "captions": len(captions),
+        "parse_success_rate": round(parsed / len(records), 4) if records else 0.0,
+        "formats": formats,
+        "labeled": len(labeled),
+        "exact_match_rate": round(exact / len(labeled), 4) if labeled else None,
+        "mean_absolute_error": {category: round(errors[category] / len(labeled), 3) for category in CATEGORY_FIELDS}
+        if labeled else None,
+        "total_absolute_error": round(sum(errors.values()) / len(labeled), 3) if labeled else None,
+        "prompt_tokens": estimate_tokens(prompt),
+        "mean_completion_tokens": round(sum(completion_tokens) / len(completion_tokens), 1)
+        if completion_tokens else None,
+        "latency_mean_seconds": round(sum(latencies) / len(latencies), 3) if latencies else None,
+        "latency_p50_seconds": round(_percentile(latencies, 0.5), 3) if latencies else None,
+        "latency_p95_seconds": round(_percentile(latencies, 0.95), 3) if latencies else None,
+    }
+
+
+def format_report(scores):
+    lines = [f"{'prompt':<12} {'captions':>9} {'parsed':>7} {'exact':>6} {'MAE':>6} "
+             f"{'tok in':>7} {'tok out':>8} {'p50 s':>6} {'p95 s':>6}"]
+    show = lambda value, pattern: format(value, pattern) if value is not None else "-"
+    for name, score in scores.items():
+        lines.append(f"{name:<12} {score['captions']:>4}/{score['images']:<4} {score['parse_success_rate']:>7.1%} "
+                     f"{show(score['exact_match_rate'], '6.1%'):>6} {show(score['total_absolute_error'], '6.2f'):>6} "
+                     f"{score['prompt_tokens']:>7} {show(score['mean_completion_tokens'], '8.1f'):>8} "
+                     f"{show(score['latency_p50_seconds'], '6.2f'):>6} {show(score['latency_p95_seconds'], '6.2f'):>6}")
+    return "\n".join(lines)
+
+
+# Images to evaluate: the labeled ones when there is a ground truth,
+# otherwise the whole folder; `sample` picks that many at random
+def select_images(folder_path, truth=None, sample=None, seed=0):
+    images = sorted(scan_images(folder_path), key=lambda entry: entry.name)
+    if truth:
+        images = [entry for entry in images if entry.name in truth]
+    if sample and sample < len(images):
+        images = sorted(random.Random(seed).sample(images, sample), key=lambda entry: entry.name)
+    return images
+
+
+def _model_name():
+    from .backends import BACKEND, LOCAL_MODEL
+    from .moondream_client import MODEL_NAME
+    return LOCAL_MODEL if BACKEND == "local" else MODEL_NAME
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare prompts on a sample of images with cached captions")
+    parser.add_argument("folder")
+    parser.add_argument("--prompts", nargs="+", default=list(PROMPTS),
+                        help=f"prompt names ({', '.join(PROMPTS)}) or names from --prompt-file")
+    parser.add_argument("--prompt-file", help='JSON file of extra prompts: {"name": "prompt text"}')
+    parser.add_argument("--truth", help="expected counts per image (JSON or CSV)")
+    parser.add_argument("--sample", type=int, help="evaluate this many images picked at random")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-size", type=int, default=512, help="upload size for every prompt")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--offline", action="store_true", help="score stored captions only, never call the API")
+    parser.add_argument("--output", default="prompt_eval_report.json")
+    args = parser.parse_args(argv)
+
+    available = dict(PROMPTS)
+    if args.prompt_file:
+        with open(args.prompt_file, encoding="utf-8") as f:
+            available.update(json.load(f))
+    unknown = [name for name in args.prompts if name not in available]
+    if unknown:
+        parser.error(f"unknown prompts: {', '.join(unknown)}")
+    prompts = {name: available[name] for name in args.prompts}
+
+    truth = load_ground_truth(args.truth) if args.truth else {}
+    images = select_images(args.folder, truth, args.sample, args.seed)
+    if not images:
+        print("[Moondream] No images to evaluate.")
+        return None
+
+    from .classifier import classify_caption
+    from .multithreding import API_KEY
+    backend = None
+    if not args.offline:
+        from .backends import get_backend
+        backend = get_backend(API_KEY)
+        if backend is None:
+            print("[Moondream] API key not found; scoring stored captions only.")
+            args.offline = True
+
+    store = CaptionStore()
+    try:
+        records, calls = collect_captions(images, prompts, store, backend, _model_name(), args.max_size,
+                                          args.workers, args.offline)
+    finally:
+        store.close()
+
+    scores = {name: score_prompt(prompts[name], records[name], truth, classify_caption) for name in prompts}
+    cached = sum(1 for by_image in records.values() for _, _, hit in by_image.values() if hit)
+    print(f"\n{len(images)} images x {len(prompts)} prompts: {cached} captions from the store, {calls} API calls.\n")
+    print(format_report(scores))
+
+    report = {"folder": args.folder, "images": len(images), "api_calls": calls, "prompts": prompts, "scores": scores}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(f"\nReport saved to: {args.output}")
+    return report
+
+
+# python -m waste_moondream.prompt_eval D:\inegol_images --truth labels.csv --sample 100
+# python -m waste_moondream.prompt_eval D:\inegol_images --truth labels.csv --sample 100 --offline   # re-score only
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,38 @@
+import os
+
+# The prompts used by the scripts, shared so they can be compared
+# (prompt_eval.py). Changing the text changes the cache key of every caption.
+
+# main.py: "item: quantity" lines
+QUANTITY_PROMPT = "This is a waste/trash image. Please list *unique* waste items with their *estimated quantity* only if they are clearly visible. Avoid repeating the same item multiple times. Focus on: paper, cardboard, plastic, metal, glass."
+
+# main - v2.py: one "category: item1, item2" line per category
+TEMPLATE_PROMPT = """
+            You are a waste classification assistant.
+            Categories:
+            - Paper
+            - Glass
+            - Metal
+            - Plastic
+            Instructions:
+            - Look at the image and list visible, clearly identifiable waste items under each category.
+            - If no items for a category, write "None".
+            - Use this exact format:
+            paper: item1, item2
+            glass: item1, item2
+            metal: item1, item2
+            plastic: item1, item2
+            Do not include explanations.
+            """
+
+# multithreding.py: items grouped by material, in any layout
+MATERIAL_PROMPT = "List the visible waste items grouped by material: paper, plastic, metal, and glass."
+
+PROMPTS = {
+    "quantity": QUANTITY_PROMPT,
+    "template": TEMPLATE_PROMPT,
+    "material": MATERIAL_PROMPT,
+}
+
+# Prompt sent by multithreding.py and the CLI, by name
+PROMPT_NAME = os.getenv("MOONDREAM_PROMPT", "material")
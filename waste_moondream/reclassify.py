@@ -0,0 +1,196 @@
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .classifier import CATEGORY_FIELDS, classify_caption
+
+# Stored results sent to a pool worker at a time
+RECLASSIFY_CHUNK_SIZE = int(os.getenv("MOONDREAM_RECLASSIFY_CHUNK_SIZE", "2000"))
+# Distinct captions whose counts each worker keeps (least recently used out)
+RECLASSIFY_MEMO_SIZE = int(os.getenv("MOONDREAM_RECLASSIFY_MEMO_SIZE", "100000"))
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+# The writers put "file" first: {"file": "IMG-1.jpg", ...}
+_FILE_FIELD = re.compile(r'\{"file": ("(?:[^"\\]|\\.)*")')
+
+_memo = OrderedDict()
+
+
+def _file_name(line):
+    match = _FILE_FIELD.match(line)
+    return json.loads(match.group(1)) if match else json.loads(line)["file"]
+
+
+# Numbers of the lines to keep in a JSONL results file, in order: the last
+# line of each file, since a reprocessed image is written again. The index
+# is built in a temporary SQLite file, so memory does not grow with the
+# number of images.
+def _last_lines(path):
+    with tempfile.TemporaryDirectory() as directory:
+        db = sqlite3.connect(os.path.join(directory, "last_lines.sqlite"))
+        try:
+            db.execute("CREATE TABLE last_lines (name TEXT PRIMARY KEY, line INTEGER NOT NULL)")
+            with open(path, encoding="utf-8") as f:
+                db.executemany("INSERT OR REPLACE INTO last_lines VALUES (?, ?)",
+                               ((_file_name(line), number) for number, line in enumerate(f) if line.strip()))
+            for (number,) in db.execute("SELECT line FROM last_lines ORDER BY line"):
+                yield number
+        finally:
+            db.close()
+
+
+# (file, result) of every image in a results file, once per image (its last
+# record): the JSON object written by process_folder /
+# process_folder_parallel ({file: result}), the JSONL lines of the streaming
+# pipeline and the watch daemon ({"file": ..., ...}), or Arrow results
+# tables (a .arrows file, or every table under a folder, deduplicated across
+# runs by results_store.load_results). JSONL lines are returned unparsed with
+# raw=True (the pool workers parse them) and read one at a time; a .json
+# file, and the caption column of Arrow tables, are loaded whole.
+def iter_stored_results(path, raw=False):
+    if path.endswith(".jsonl"):
+        kept = _last_lines(path)
+        next_kept = next(kept, None)
+        with open(path, encoding="utf-8") as f:
+            for number, line in enumerate(f):
+                if number == next_kept:
+                    yield line if raw else _parse_line(line)
+                    next_kept = next(kept, None)
+    elif path.endswith(".arrows") or os.path.isdir(path):
+        from .results_store import load_results
+
+        table = load_results(path, columns=["folder", "file", "caption", "error", *CATEGORY_FIELDS],
+                             include_failed=True)
+        for batch in table.to_batches():
+            for row in batch.to_pylist():
+                name = row.pop("file")
+                if row["error"] is None:
+                    del row["error"]
+                yield name, row
+    else:
+        with open(path, encoding="utf-8") as f:
+            yield from json.load(f).items()
+
+
+def _parse_line(line):
+    record = json.loads(line)
+    return record.pop("file"), record
+
+
+# (category counts, number of unmatched labels) of a caption, from the
+# worker's memo when the same caption was seen before; the second value
+# tells whether it was
+def _counts(caption):
+    counts = _memo.get(caption)
+    if counts is not None:
+        _memo.move_to_end(caption)
+        return counts, True
+    unmatched = []
+    counts = _memo[caption] = (classify_caption(caption, unmatched), len(unmatched))
+    if len(_memo) > RECLASSIFY_MEMO_SIZE:
+        _memo.popitem(last=False)
+    return counts, False
+
+
+# Counts for a stored result from its caption with the current taxonomy.
+# Results without a caption (failed or skipped) are returned unchanged.
+def reclassify_result(result):
+    caption = result.get("caption")
+    if not caption:
+        return result
+    return {**{key: value for key, value in result.items() if key not in CATEGORY_FIELDS},
+            **_counts(caption)[0][0]}
+
+
+# Runs in a pool worker: reclassifies a chunk of stored results (JSONL lines
+# or (file, result) pairs) and returns the output lines (without captions),
+# the chunk totals and (images, captions, captions found in the memo,
+# unmatched labels)
+def _reclassify_chunk(chunk):
+    lines = []
+    totals = dict.fromkeys(CATEGORY_FIELDS, 0)
+    captions = hits = unmatched = 0
+    for item in chunk:
+        name, result = _parse_line(item) if isinstance(item, str) else item
+        caption = result.pop("caption", None)
+        if caption:
+            (counts, labels), hit = _counts(caption)
+            result.update(counts)
+            captions += 1
+            hits += hit
+            unmatched += labels
+        for category in CATEGORY_FIELDS:
+            totals[category] += result.get(category, 0)
+        lines.append(json.dumps({"file": name, **result}, ensure_ascii=False) + "\n")
+    return "".join(lines), totals, (len(chunk), captions, hits, unmatched)
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Reclassified chunks in input order. Chunks go to a process pool with at
+# most 2 per worker outstanding, so memory stays bounded however long the
+# input is; with workers=1 they are reclassified in this process.
+def reclassify_chunks(items, workers=None, chunk_size=RECLASSIFY_CHUNK_SIZE):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        yield from map(_reclassify_chunk, _chunks(items, chunk_size))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in _chunks(items, chunk_size):
+            pending.append(executor.submit(_reclassify_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# Writes <results>_reclassified.jsonl (one line per image, without the
+# caption) and <results>_reclassified_total.json, or
+# waste_results_reclassified* in a folder of Arrow tables; returns the
+# totals. Prints the throughput every few seconds and at the end.
+def reclassify_file(path, workers=None, chunk_size=RECLASSIFY_CHUNK_SIZE):
+    if os.path.isdir(path):
+        base_path = os.path.join(path, "waste_results_reclassified")
+    else:
+        base_path = os.path.splitext(path)[0] + "_reclassified"
+    totals = dict.fromkeys(CATEGORY_FIELDS, 0)
+    images = captions = hits = unmatched = 0
+    started = last_report = time.perf_counter()
+    with open(base_path + ".jsonl", "w", encoding="utf-8") as out:
+        for lines, chunk_totals, chunk_counts in reclassify_chunks(iter_stored_results(path, raw=True), workers,
+                                                                   chunk_size):
+            out.write(lines)
+            for category in CATEGORY_FIELDS:
+                totals[category] += chunk_totals[category]
+            images += chunk_counts[0]
+            captions += chunk_counts[1]
+            hits += chunk_counts[2]
+            unmatched += chunk_counts[3]
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                print(f"{path}: {images} images, {captions / (now - started):,.0f} captions/s")
+
+    with open(base_path + "_total.json", "w", encoding="utf-8") as f:
+        json.dump(totals, f, indent=4, ensure_ascii=False)
+    seconds = time.perf_counter() - started
+    print(f"{path}: {images} images, {captions} captions reclassified in {seconds:.1f} s "
+          f"({captions / seconds if seconds else 0:,.0f} captions/s, {hits / captions if captions else 0:.0%} "
+          f"from the memo, {unmatched} unmatched labels) -> {base_path}.jsonl")
+    return totals
@@ -0,0 +1,134 @@
+import base64
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = os.getenv("MOONDREAM_CACHE_PATH",
+                       os.path.join(os.path.expanduser("~"), ".cache", "waste-moondream", "captions.sqlite"))
+CACHE_MAX_BYTES = int(os.getenv("MOONDREAM_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CACHE_ENABLED = os.getenv("MOONDREAM_CACHE", "1") != "0"
+
+
+# Content address of one request: the encoded JPEG bytes, the model and the
+# prompt. `image_data` may be raw JPEG bytes or the base64 text sent to the API.
+def cache_key(image_data, model, prompt):
+    if isinstance(image_data, str):
+        image_data = base64.b64decode(image_data)
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(image_data).digest())
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Persistent caption cache in SQLite. Only the raw caption is stored, so the
+# classification can be recomputed offline. When the stored captions exceed
+# `max_bytes`, the least recently used entries are evicted.
+class ResultCache:
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS captions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                caption TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS captions_last_access ON captions (last_access)")
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM captions").fetchone()[0]
+
+    # Cached caption for the key, or None
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT caption FROM captions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE captions SET last_access = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key, caption, model="", prompt=""):
+        size = len(caption.encode("utf-8")) + len(prompt) + 128
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM captions WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO captions (key, model, prompt, caption, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, prompt, caption, size, now, now),
+            )
+            self._size += size - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    # Drop least recently used entries until the cache is back under 90% of its bound
+    def _evict(self):
+        excess = self._size - self.max_bytes * 0.9
+        victims = []
+        for key, size in self._db.execute("SELECT key, size FROM captions ORDER BY last_access"):
+            if excess <= 0:
+                break
+            victims.append((key,))
+            excess -= size
+            self._size -= size
+        self._db.executemany("DELETE FROM captions WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    # Every stored (model, prompt, caption), for offline re-classification
+    def iter_captions(self):
+        reader = sqlite3.connect(self.path)
+        try:
+            yield from reader.execute("SELECT model, prompt, caption FROM captions")
+        finally:
+            reader.close()
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM captions").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_bytes": self._size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+# Process-wide cache, or None when disabled with MOONDREAM_CACHE=0
+def shared_cache():
+    global _shared_cache
+    if not CACHE_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResultCache()
+        return _shared_cache
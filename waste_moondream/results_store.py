@@ -0,0 +1,236 @@
+import argparse
+import glob
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .classifier import CATEGORY_FIELDS
+
+TABLE_EXTENSION = ".arrows"
+# Per-image results written by the folder modes; the other waste_results*
+# files (totals, metrics, reports, reclassified copies) are not converted
+RESULTS_FILE_NAMES = ("waste_results.json", "waste_results_parallel.json", "waste_results_stream.jsonl",
+                      "waste_results_watch.jsonl", "waste_results_queue.jsonl")
+
+# One row per image. Files are Arrow IPC streams: they can be appended batch
+# by batch while a run is going, are still readable up to the last complete
+# batch after a crash, and are memory-mapped when read back. `folder` is the
+# absolute path of the image folder. Each file's schema metadata holds the
+# time its run started (`run_started`, seconds since the epoch).
+SCHEMA = pa.schema([
+    ("folder", pa.string()),
+    ("file", pa.string()),
+    ("timestamp", pa.timestamp("s")),
+    *[(category, pa.int32()) for category in CATEGORY_FIELDS],
+    ("caption", pa.string()),
+    ("error", pa.string()),
+])
+
+# IMG-20250410-WA0001.jpg (WhatsApp) and IMG_20250410_153012.jpg (camera)
+_TIMESTAMP_IN_NAME = re.compile(r"IMG[-_](\d{8})(?:[-_](\d{6}))?", re.IGNORECASE)
+
+
+# Capture time from the file name, or None when the name has no date
+def parse_image_timestamp(name):
+    match = _TIMESTAMP_IN_NAME.search(name)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1) + (match.group(2) or "000000"), "%Y%m%d%H%M%S")
+    except ValueError:
+        return None
+
+
+def _row(folder, name, result):
+    row = {
+        "folder": folder,
+        "file": name,
+        "timestamp": parse_image_timestamp(name),
+        "caption": result.get("caption"),
+        "error": result.get("error"),
+    }
+    for category in CATEGORY_FIELDS:
+        row[category] = result.get(category, 0)
+    return row
+
+
+# Appends result rows to an Arrow stream file. Rows are buffered and written
+# as one record batch per flush().
+class ResultsTableWriter:
+    def __init__(self, path, folder, run_started=None):
+        self.path = path
+        self.folder = folder
+        self.run_started = time.time() if run_started is None else run_started
+        self.rows = 0
+        self._pending = []
+        self._sink = pa.OSFile(path, "wb")
+        self._writer = pa.ipc.new_stream(self._sink, SCHEMA.with_metadata({"run_started": repr(self.run_started)}))
+
+    def write(self, name, result):
+        self._pending.append(_row(self.folder, name, result))
+
+    def flush(self):
+        if not self._pending:
+            return
+        self._writer.write_batch(pa.RecordBatch.from_pylist(self._pending, schema=SCHEMA))
+        self.rows += len(self._pending)
+        self._pending = []
+        self._sink.flush()
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        self._sink.close()
+
+
+# New table file for one run: <base_path>.<run start>-<random>.arrows. The
+# writer truncates its file, so two runs started in the same second (an
+# incremental rerun in the same process) must not share a name.
+def run_table_path(base_path):
+    return f"{base_path}.{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:12]}{TABLE_EXTENSION}"
+
+
+# Writes a whole {file name: result} dict (as saved in waste_results*.json)
+def write_results_table(path, folder, results, run_started=None):
+    writer = ResultsTableWriter(path, folder, run_started)
+    try:
+        for name, result in results.items():
+            writer.write(name, result)
+    finally:
+        writer.close()
+    return writer.rows
+
+
+# Converts an existing waste_results*.json or streaming .jsonl file into a
+# table next to it, dated by the file's modification time. Returns the
+# table path.
+def convert_json_results(json_path):
+    folder = os.path.dirname(os.path.abspath(json_path))
+    with open(json_path, encoding="utf-8") as f:
+        if json_path.endswith(".jsonl"):
+            results = {}
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    results[record.pop("file")] = record
+        else:
+            results = json.load(f)
+    table_path = os.path.splitext(json_path)[0] + TABLE_EXTENSION
+    write_results_table(table_path, folder, results, os.path.getmtime(json_path))
+    return table_path
+
+
+# Per-image results files (RESULTS_FILE_NAMES) under a folder, recursively
+def find_results_files(root):
+    paths = []
+    for name in RESULTS_FILE_NAMES:
+        paths.extend(glob.glob(os.path.join(root, "**", name), recursive=True))
+    return sorted(paths)
+
+
+# Every table file under the given folders, searched recursively
+def find_result_tables(*roots):
+    paths = []
+    for root in roots:
+        if root.endswith(TABLE_EXTENSION):
+            paths.append(root)
+        else:
+            paths.extend(glob.glob(os.path.join(root, "**", "*" + TABLE_EXTENSION), recursive=True))
+    return sorted(paths)
+
+
+# (run start time, table) of one file
+def _read_table(path, columns):
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_stream(source)
+        run_started = float((reader.schema.metadata or {}).get(b"run_started", 0))
+        batches = []
+        try:
+            for batch in reader:
+                batches.append(batch)
+        except (pa.ArrowInvalid, OSError):
+            # A run that crashed mid-batch: keep the complete batches
+            pass
+    table = pa.Table.from_batches(batches, schema=SCHEMA)
+    return run_started, table.select(columns) if columns else table
+
+
+# All rows from the given table files (or folders) as one Arrow table. The
+# files are memory-mapped, so columns that are not selected are never read.
+# When an image appears more than once (a retried failure, a rerun), the
+# row of the run that started last wins, whatever the file names; failed
+# rows are dropped unless include_failed is set.
+def load_results(paths, columns=None, include_failed=False, latest_only=True):
+    paths = find_result_tables(*paths) if isinstance(paths, (list, tuple)) else find_result_tables(paths)
+    needed = None
+    if columns:
+        needed = list(dict.fromkeys(["folder", "file", "error", *columns]))
+    runs = sorted(((path, *_read_table(path, needed)) for path in paths), key=lambda run: (run[1], run[0]))
+    tables = [table for _, _, table in runs]
+    if not tables:
+        return SCHEMA.empty_table().select(needed) if needed else SCHEMA.empty_table()
+    table = pa.concat_tables(tables)
+
+    if latest_only and table.num_rows:
+        table = table.append_column("_row", pa.array(range(table.num_rows), pa.int64()))
+        last = table.group_by(["folder", "file"]).aggregate([("_row", "max")])
+        rows = last["_row_max"]
+        table = table.take(pc.take(rows, pc.sort_indices(rows))).drop_columns(["_row"])
+    if not include_failed:
+        table = table.filter(pc.is_null(table["error"]))
+    return table.select(columns) if columns else table
+
+
+# Totals of the category columns in the table, grouped by any of: day,
+# month, folder, file or a column name. Images without a date in their
+# name fall into a null day/month.
+def totals_by(table, by=("day",)):
+    by = [by] if isinstance(by, str) else list(by)
+    for key in by:
+        if key == "day" and "day" not in table.column_names:
+            table = table.append_column("day", pc.cast(table["timestamp"], pa.date32()))
+        elif key == "month" and "month" not in table.column_names:
+            table = table.append_column("month", pc.strftime(table["timestamp"], format="%Y-%m"))
+
+    aggregations = [(category, "sum") for category in CATEGORY_FIELDS if category in table.column_names]
+    aggregations.append(([], "count_all"))
+    totals = table.group_by(by).aggregate(aggregations)
+    totals = totals.rename_columns(["images" if name == "count_all" else name.removesuffix("_sum")
+                                    for name in totals.column_names])
+    return totals.sort_by([(key, "ascending") for key in by])
+
+
+# Plain-text table for the console
+def format_table(table):
+    rows = [table.column_names] + [["" if value is None else str(value) for value in row.values()]
+                                   for row in table.to_pylist()]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(table.column_names))]
+    return "\n".join("  ".join(value.rjust(width) for value, width in zip(row, widths)) for row in rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate waste results across folders")
+    parser.add_argument("roots", nargs="+", help="folders searched recursively for result tables")
+    parser.add_argument("--by", nargs="+", default=["day"], help="day, month, folder, file (default: day)")
+    parser.add_argument("--convert", action="store_true",
+                        help="first convert the results files (" + ", ".join(RESULTS_FILE_NAMES) +
+                             ") found under the folders")
+    args = parser.parse_args()
+
+    if args.convert:
+        for root in args.roots:
+            for json_path in find_results_files(root):
+                print(f"Converted {json_path} -> {convert_json_results(json_path)}")
+
+    start_time = time.time()
+    columns = [key for key in args.by if key not in ("day", "month")]
+    table = load_results(args.roots, columns=["timestamp", *CATEGORY_FIELDS, *columns])
+    totals = totals_by(table, args.by)
+    print(format_table(totals))
+    print(f"\n{table.num_rows} images aggregated in {time.time() - start_time:.2f} seconds.")
@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import email.parser
+import email.policy
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qs
+
+from .image_encoding import encode_jpeg
+from .metrics import metrics
+from .prefilter import PREFILTER_MODE, rejection_reasons, skipped_result
+
+MAX_UPLOAD_BYTES = int(os.getenv("MOONDREAM_SERVICE_MAX_UPLOAD_MB", "20")) * 1024 * 1024
+MAX_BATCH_FILES = int(os.getenv("MOONDREAM_SERVICE_MAX_BATCH", "64"))
+ENCODE_WORKERS = int(os.getenv("MOONDREAM_SERVICE_ENCODE_WORKERS", str(os.cpu_count() or 1)))
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# (file name, bytes) of every file part of a multipart/form-data body
+def parse_multipart(body, content_type):
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    if not message.is_multipart():
+        raise HTTPError(400, "Malformed multipart body.")
+    files = []
+    for part in message.iter_parts():
+        data = part.get_payload(decode=True)
+        if data:
+            files.append((part.get_filename() or part.get_param("name", header="content-disposition") or "", data))
+    return files
+
+
+# detect_and_classify for uploaded images. Identical uploads that are in
+# progress at the same time (same SHA-256 of the bytes) share one upstream
+# call: the second request waits for the first one's result. All requests go
+# through the one process-wide backend, so the API concurrency limit (and
+# the caption cache) is shared by every client of the service. Uploads are
+# screened by the pre-filter like the folder modes' images.
+class ClassificationService:
+    def __init__(self, backend=None, encode_workers=ENCODE_WORKERS, prefilter=PREFILTER_MODE):
+        from . import multithreding
+
+        self._script = multithreding
+        self.backend = backend if backend is not None else multithreding.get_backend(multithreding.API_KEY)
+        self.prefilter = prefilter
+        self._executor = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix="service-encode")
+        self._in_progress = {}
+
+    # (result dict, whether it was coalesced with an identical upload)
+    async def classify(self, data):
+        key = hashlib.sha256(data).digest()
+        task = self._in_progress.get(key)
+        coalesced = task is not None
+        if coalesced:
+            metrics.count("service_coalesced")
+        else:
+            task = asyncio.ensure_future(self._classify_upload(data))
+            self._in_progress[key] = task
+            task.add_done_callback(lambda _: self._in_progress.pop(key, None))
+        # A client that disconnects does not cancel the shared work
+        return await asyncio.shield(task), coalesced
+
+    async def _classify_upload(self, data):
+        if self.backend is None:
+            raise HTTPError(503, "Moondream API key not found.")
+        loop = asyncio.get_running_loop()
+        measures = {} if self.prefilter != "off" else None
+        image_data = await loop.run_in_executor(self._executor, self._encode, data, measures)
+        reasons = rejection_reasons(measures) if measures is not None else []
+        if reasons and self.prefilter == "skip":
+            return skipped_result(reasons, measures)
+        caption = await asyncio.wrap_future(self.backend.submit(image_data, self._script.PROMPT_TEXT))
+        result = self._script.result_from_caption(caption)
+        if reasons:
+            result.update(quality_flags=reasons, quality=measures)
+        return result
+
+    @staticmethod
+    def _encode(data, measures=None):
+        try:
+            return encode_jpeg(BytesIO(data), measures=measures)
+        except Exception as e:
+            raise HTTPError(400, f"Unreadable image: {str(e)}")
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+# ASGI application (run with uvicorn):
+#   POST /classify         one image, as the raw body or a multipart file
+#   POST /classify/batch   multipart/form-data with several image files
+#   GET  /health
+#   GET  /metrics          Prometheus text; ?format=json for JSON
+class ServiceApp:
+    def __init__(self, service=None):
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        started = time.perf_counter()
+        route = f"{scope['method']} {scope['path']}"
+        try:
+            status, body, headers = await self._handle(scope, receive)
+        except HTTPError as e:
+            status, body, headers = e.status, {"error": e.message}, {}
+        except Exception as e:
+            print(f"[Moondream] Service error ({route}): {str(e)}")
+            status, body, headers = 500, {"error": "Internal error."}, {}
+
+        if isinstance(body, str):
+            payload, content_type = body.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            payload, content_type = json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json"
+        response_headers = [(b"content-type", content_type.encode()), (b"content-length", str(len(payload)).encode())]
+        response_headers += [(name.encode(), value.encode()) for name, value in headers.items()]
+        await send({"type": "http.response.start", "status": status, "headers": response_headers})
+        await send({"type": "http.response.body", "body": payload})
+
+        if scope["path"].startswith("/classify"):
+            metrics.observe("service_" + scope["path"].strip("/").replace("/", "_"), time.perf_counter() - started)
+            metrics.count("service_responses", status=status)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.service is None:
+                    self.service = ClassificationService()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.service is not None:
+                    self.service.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _handle(self, scope, receive):
+        method, path = scope["method"], scope["path"]
+        if path == "/health":
+            return 200, {"status": "ok"}, {}
+        if path == "/metrics":
+            query = parse_qs(scope.get("query_string", b"").decode())
+            if query.get("format") == ["json"]:
+                return 200, metrics.to_dict(), {}
+            return 200, metrics.prometheus_text(), {}
+        if path not in ("/classify", "/classify/batch"):
+            raise HTTPError(404, "Not found.")
+        if method != "POST":
+            raise HTTPError(405, "Use POST.")
+
+        if self.service is None:
+            self.service = ClassificationService()
+        body = await self._read_body(receive)
+        content_type = dict(scope["headers"]).get(b"content-type", b"").decode("latin-1")
+        files = parse_multipart(body, content_type) if content_type.startswith("multipart/") else [("", body)]
+        if not files or not files[0][1]:
+            raise HTTPError(400, "No image in the request.")
+
+        if path == "/classify":
+            result, coalesced = await self.service.classify(files[0][1])
+            return (502 if "error" in result else 200), result, {"x-coalesced": "1" if coalesced else "0"}
+
+        if len(files) > MAX_BATCH_FILES:
+            raise HTTPError(413, f"At most {MAX_BATCH_FILES} images per batch.")
+        outcomes = await asyncio.gather(*(self.service.classify(data) for _, data in files), return_exceptions=True)
+        results = []
+        for (name, _), outcome in zip(files, outcomes):
+            if isinstance(outcome, HTTPError):
+                results.append({"file": name, "error": outcome.message})
+            elif isinstance(outcome, Exception):
+                raise outcome
+            else:
+                results.append({"file": name, **outcome[0]})
+        return 200, {"results": results}, {}
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPError(413, f"Upload larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+
+app = ServiceApp()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP service for waste classification")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("The service needs an ASGI server: pip install uvicorn")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,369 @@
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import os
+import queue
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from .classifier import CATEGORY_FIELDS
+from .folder_scanner import IMAGE_EXTENSIONS, ScanEntry, scan_images
+from .metrics import metrics
+from .pipeline import CheckpointWriter, open_results_table
+
+WATCH_WORKERS = int(os.getenv("MOONDREAM_WATCH_WORKERS", "16"))
+WATCH_QUEUE_SIZE = int(os.getenv("MOONDREAM_WATCH_QUEUE_SIZE", "256"))
+POLL_INTERVAL = float(os.getenv("MOONDREAM_WATCH_POLL_INTERVAL", "5"))
+# Files modified more recently than this are assumed to still be copying
+SETTLE_SECONDS = float(os.getenv("MOONDREAM_WATCH_SETTLE_SECONDS", "2"))
+COMMIT_INTERVAL = float(os.getenv("MOONDREAM_WATCH_COMMIT_INTERVAL", "10"))
+MAX_REMEMBERED_FAILURES = 10000
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+# Linux inotify through ctypes: reports files when they are closed after
+# writing or moved in, and follows new subdirectories. Calls
+# on_file(root, path) for each image, and on_rescan(root, directory) when a
+# subdirectory appears (files may have landed before it was watched) or
+# the kernel event queue overflowed.
+class InotifyWatcher:
+    # A file still being written sends IN_CLOSE_WRITE later, so rescans can
+    # take every file as it is
+    settle = False
+
+    def __init__(self, roots):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches = {}
+        for root in roots:
+            self._watch_tree(root, root)
+
+    def _watch_tree(self, root, directory):
+        self._add_watch(root, directory)
+        for current, subdirectories, _ in os.walk(directory):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith(".")]
+            for name in subdirectories:
+                self._add_watch(root, os.path.join(current, name))
+
+    def _add_watch(self, root, directory):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            if ctypes.get_errno() == errno.ENOENT:
+                # Renamed or removed before it could be watched
+                return
+            print(f"[Moondream] Cannot watch {directory}: {os.strerror(ctypes.get_errno())}")
+            return
+        self._watches[wd] = (root, directory)
+
+    def run(self, on_file, on_rescan, stopped):
+        while not stopped.is_set():
+            readable, _, _ = select.select([self._fd], [], [], 0.5)
+            if not readable:
+                continue
+            try:
+                buffer = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+                name = buffer[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += _EVENT_HEADER.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    for root in {root for root, _ in self._watches.values()}:
+                        on_rescan(root, root)
+                    continue
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                if wd not in self._watches:
+                    continue
+                root, directory = self._watches[wd]
+                path = os.path.join(directory, os.fsdecode(name))
+
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and not os.fsdecode(name).startswith("."):
+                        self._watch_tree(root, path)
+                        on_rescan(root, path)
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and _is_image(path):
+                    on_file(root, path)
+
+    def close(self):
+        os.close(self._fd)
+
+
+# Rescans the folders every `interval` seconds. Used where inotify is not
+# available (Windows, network shares mounted without change notifications).
+class PollingWatcher:
+    # Files modified in the last settle_seconds may still be copying
+    settle = True
+
+    def __init__(self, roots, interval=POLL_INTERVAL):
+        self.roots = roots
+        self.interval = interval
+
+    def run(self, on_file, on_rescan, stopped):
+        while not stopped.wait(self.interval):
+            for root in self.roots:
+                on_rescan(root, root)
+
+    def close(self):
+        pass
+
+
+_STOP = object()
+
+
+# Long-running ingestion of one or more folders. New images go through
+# `analyze` (detect_and_classify) on a fixed pool of worker threads. The
+# watcher blocks when `queue_size` images are waiting, so a burst of uploads
+# is absorbed by the queue and the kernel instead of memory. One writer
+# thread appends each result to waste_results_watch.jsonl in the folder,
+# updates the checkpoint and the rolling totals, and commits them every
+# `commit_interval` seconds together with a Prometheus metrics file. On
+# start the folders are scanned once for images that arrived while the
+# daemon was down. stop() finishes the queued and in-flight images before
+# returning.
+class WatchDaemon:
+    def __init__(self, folders, analyze, workers=WATCH_WORKERS, queue_size=WATCH_QUEUE_SIZE, use_inotify=True,
+                 poll_interval=POLL_INTERVAL, settle_seconds=SETTLE_SECONDS, commit_interval=COMMIT_INTERVAL,
+                 output_prefix="waste_results_watch"):
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.analyze = analyze
+        self.workers = workers
+        self.use_inotify = use_inotify
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.commit_interval = commit_interval
+        self.output_prefix = output_prefix
+        self.processed = 0
+
+        self._tasks = queue.Queue(maxsize=queue_size)
+        self._results = queue.Queue(maxsize=queue_size)
+        self._stopped = threading.Event()
+        self._dropping = threading.Event()
+        self._lock = threading.Lock()
+        self._in_progress = set()
+        # Images that failed, with the size and mtime they had, so they are
+        # not retried on every rescan until the file changes
+        self._failed = OrderedDict()
+        self._writers = {}
+        self._threads = []
+        self.watcher = None
+
+    def start(self):
+        for folder in self.folders:
+            base_path = os.path.join(folder, self.output_prefix)
+            self._writers[folder] = CheckpointWriter(
+                base_path + ".jsonl", base_path + "_total.json", base_path + ".checkpoint",
+                table=open_results_table(base_path, folder))
+
+        if self.use_inotify:
+            try:
+                self.watcher = InotifyWatcher(self.folders)
+            except OSError as e:
+                print(f"[Moondream] inotify unavailable ({str(e)}), polling every {self.poll_interval}s.")
+        if self.watcher is None:
+            self.watcher = PollingWatcher(self.folders, self.poll_interval)
+
+        self._threads.append(threading.Thread(target=self._watch, name="watch", daemon=True))
+        self._threads.append(threading.Thread(target=self._write_results, name="watch-writer", daemon=True))
+        for index in range(self.workers):
+            self._threads.append(threading.Thread(target=self._work, name=f"watch-worker-{index}", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        print(f"Watching {', '.join(self.folders)} ({type(self.watcher).__name__}, {self.workers} workers).")
+        return self
+
+    def _watch(self):
+        # Catch up on images that arrived while the daemon was down
+        for folder in self.folders:
+            self._rescan(folder, folder)
+        self.watcher.run(self._on_file, self._rescan, self._stopped)
+
+    def _on_file(self, root, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        name = os.path.relpath(path, root).replace(os.sep, "/")
+        self._queue_changed(root, [ScanEntry(name, path, stat.st_size, stat.st_mtime_ns)])
+
+    def _rescan(self, root, directory):
+        prefix = os.path.relpath(directory, root).replace(os.sep, "/") + "/" if directory != root else ""
+        settled_before = time.time_ns() - int(self.settle_seconds * 1e9 if self.watcher.settle else 0)
+        self._queue_changed(root, (entry._replace(name=prefix + entry.name) for entry in scan_images(directory)
+                                   if entry.mtime_ns <= settled_before))
+
+    # Images already queued, or that failed and have not changed since, are
+    # dropped before the manifest check, so the checkpoint only ever records
+    # the size and mtime of the version that was analyzed
+    def _queue_changed(self, root, entries):
+        def not_pending():
+            for entry in entries:
+                key = (root, entry.name)
+                with self._lock:
+                    if key in self._in_progress or self._failed.get(key) == (entry.size, entry.mtime_ns):
+                        continue
+                yield entry
+
+        for entry in self._writers[root].changed(not_pending()):
+            if self._stopped.is_set():
+                return
+            key = (root, entry.name)
+            with self._lock:
+                self._in_progress.add(key)
+            # Blocks while the queue is full: backpressure on the watcher
+            while not self._stopped.is_set():
+                try:
+                    self._tasks.put((root, entry), timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                with self._lock:
+                    self._in_progress.discard(key)
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is _STOP:
+                return
+            root, entry = task
+            if self._dropping.is_set():
+                continue
+            with metrics.in_flight("watch"):
+                try:
+                    result = self.analyze(entry.path)
+                except Exception as e:
+                    result = {"error": str(e)}
+            self._results.put((root, entry, result))
+
+    def _write_results(self):
+        last_commit = time.monotonic()
+        while True:
+            try:
+                item = self._results.get(timeout=1.0)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                break
+
+            if item is not None:
+                root, entry, result = item
+                self._writers[root].write(entry.name, result)
+                key = (root, entry.name)
+                with self._lock:
+                    self._in_progress.discard(key)
+                    if "error" in result:
+                        self._failed[key] = (entry.size, entry.mtime_ns)
+                        if len(self._failed) > MAX_REMEMBERED_FAILURES:
+                            self._failed.popitem(last=False)
+                    else:
+                        self._failed.pop(key, None)
+                self.processed += 1
+                if "error" in result:
+                    print(f"{entry.name}: {result['error']}")
+                else:
+                    print(f"{entry.name}: " + ", ".join(f"{c}={result.get(c, 0)}" for c in CATEGORY_FIELDS))
+
+            if time.monotonic() - last_commit >= self.commit_interval:
+                self._commit()
+                last_commit = time.monotonic()
+        self._commit()
+
+    # Rolling totals and metrics reach the disk
+    def _commit(self):
+        for folder, writer in self._writers.items():
+            writer.commit()
+            metrics.export(os.path.join(folder, self.output_prefix))
+
+    def totals(self):
+        return {folder: dict(writer.totals) for folder, writer in self._writers.items()}
+
+    # Stops watching and returns once every queued and in-flight image is
+    # written. With drain=False the queued images are dropped instead; they
+    # are picked up again by the catch-up scan of the next start.
+    def stop(self, drain=True):
+        if not drain:
+            self._dropping.set()
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        watch_thread, writer_thread, *worker_threads = self._threads
+        watch_thread.join()
+        self.watcher.close()
+
+        if not self._dropping.is_set():
+            with self._lock:
+                pending = len(self._in_progress)
+            print(f"Stopping: finishing {pending} queued and in-flight images...")
+        for _ in worker_threads:
+            self._tasks.put(_STOP)
+        for thread in worker_threads:
+            thread.join()
+        self._results.put(_STOP)
+        writer_thread.join()
+        for writer in self._writers.values():
+            writer.close()
+        print(f"Stopped after {self.processed} images. Totals: {self.totals()}")
+
+    # Runs until SIGINT or SIGTERM, then drains. A second signal stops
+    # without waiting for the queued images.
+    def run_forever(self):
+        self.start()
+        interrupted = threading.Event()
+
+        def handle(signum, frame):
+            if interrupted.is_set():
+                print("Second signal: dropping queued images.")
+                self._dropping.set()
+                return
+            interrupted.set()
+
+        signal.signal(signal.SIGINT, handle)
+        signal.signal(signal.SIGTERM, handle)
+        while not interrupted.wait(1.0):
+            pass
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuously classify images dropped into the given folders")
+    parser.add_argument("folders", nargs="+")
+    parser.add_argument("--workers", type=int, default=WATCH_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=WATCH_QUEUE_SIZE)
+    parser.add_argument("--poll", action="store_true", help="poll instead of using inotify")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    args = parser.parse_args()
+
+    from .multithreding import detect_and_classify
+
+    WatchDaemon(args.folders, detect_and_classify, workers=args.workers, queue_size=args.queue_size,
+                use_inotify=not args.poll, poll_interval=args.poll_interval).run_forever()
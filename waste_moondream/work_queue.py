@@ -0,0 +1,323 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from .classifier import CATEGORY_FIELDS
+from .folder_scanner import scan_images
+
+QUEUE_FILE_NAME = "waste_queue.sqlite"
+# Seconds a claimed image stays with its worker without a heartbeat; after
+# that any worker may claim it again
+QUEUE_LEASE_SECONDS = float(os.getenv("MOONDREAM_QUEUE_LEASE_SECONDS", "120"))
+# Claims after which an image is marked failed (a worker died on it, or its
+# analysis returned an error, each time)
+QUEUE_MAX_ATTEMPTS = int(os.getenv("MOONDREAM_QUEUE_MAX_ATTEMPTS", "5"))
+# Rows written per transaction when enqueuing, so workers are not locked out
+# while a large folder is scanned
+ENQUEUE_BATCH = 1000
+
+
+# Images of a folder shared out to worker processes on any number of
+# machines through one SQLite file, with no server. A worker claims a few
+# images at a time under a lease (a random token and an expiry), keeps the
+# lease alive with heartbeats, and its result is only written while its
+# token still holds the image: an image whose lease expired and was claimed
+# again is committed by exactly one worker. Every write is a short
+# BEGIN IMMEDIATE transaction. The default rollback journal is kept, since
+# WAL needs shared memory and does not work over network shares.
+class WorkQueue:
+    def __init__(self, path, lease_seconds=QUEUE_LEASE_SECONDS, max_attempts=QUEUE_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        with self._write():
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    name TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    token TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    finished REAL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_expires)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS tasks_token ON tasks (token)")
+
+    # One write transaction, rolled back when the block raises
+    @contextmanager
+    def _write(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    # Adds the images (folder_scanner.ScanEntry) that are not queued yet, and
+    # queues again those whose size or mtime changed; returns how many
+    def enqueue(self, entries):
+        added = 0
+        batch = []
+        for entry in entries:
+            batch.append((entry.name, entry.size, entry.mtime_ns))
+            if len(batch) >= ENQUEUE_BATCH:
+                added += self._enqueue_batch(batch)
+                batch = []
+        if batch:
+            added += self._enqueue_batch(batch)
+        return added
+
+    def _enqueue_batch(self, batch):
+        added = 0
+        with self._write() as db:
+            for row in batch:
+                added += db.execute(
+                    "INSERT INTO tasks (name, size, mtime_ns) VALUES (?, ?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+                    "state = 'queued', attempts = 0, worker = NULL, token = NULL, lease_expires = NULL, "
+                    "result = NULL, finished = NULL "
+                    "WHERE size != excluded.size OR mtime_ns != excluded.mtime_ns", row).rowcount
+        return added
+
+    # Leases up to `count` images that are queued or whose lease expired;
+    # returns (token, names). Images that reached max_attempts are marked
+    # failed instead of being handed out again.
+    def claim(self, worker, count):
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self._write() as db:
+            db.execute("UPDATE tasks SET state = 'failed', token = NULL, lease_expires = NULL, result = ?, finished = ? "
+                       "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                       (json.dumps({"error": "Lease expired too many times."}), now, now, self.max_attempts))
+            db.execute("UPDATE tasks SET state = 'leased', worker = ?, token = ?, lease_expires = ?, "
+                       "attempts = attempts + 1 WHERE name IN (SELECT name FROM tasks WHERE state = 'queued' "
+                       "OR (state = 'leased' AND lease_expires < ?) LIMIT ?)",
+                       (worker, token, now + self.lease_seconds, now, count))
+            names = [name for (name,) in db.execute("SELECT name FROM tasks WHERE token = ?", (token,))]
+        return token, names
+
+    # Extends the leases of the given claims; returns how many images they
+    # still hold (fewer when a lease was lost to another worker)
+    def heartbeat(self, tokens):
+        expires = time.time() + self.lease_seconds
+        with self._write() as db:
+            return sum(db.execute("UPDATE tasks SET lease_expires = ? WHERE token = ? AND state = 'leased'",
+                                  (expires, token)).rowcount for token in tokens)
+
+    # Writes [(name, token, result)] in one transaction. A result is kept
+    # only if the token still holds the image; returns how many were kept.
+    # An image whose result has an error is queued again until it was
+    # claimed max_attempts times, and is then marked failed with the error.
+    def complete(self, finished):
+        now = time.time()
+        kept = 0
+        with self._write() as db:
+            for name, token, result in finished:
+                result_json = json.dumps(result, ensure_ascii=False)
+                if "error" in result and db.execute(
+                        "UPDATE tasks SET state = 'queued', result = ?, token = NULL, lease_expires = NULL "
+                        "WHERE name = ? AND token = ? AND state = 'leased' AND attempts < ?",
+                        (result_json, name, token, self.max_attempts)).rowcount:
+                    kept += 1
+                    continue
+                kept += db.execute(
+                    "UPDATE tasks SET state = ?, result = ?, finished = ?, token = NULL, lease_expires = NULL "
+                    "WHERE name = ? AND token = ? AND state = 'leased'",
+                    ("failed" if "error" in result else "done", result_json, now, name, token)).rowcount
+        return kept
+
+    # Gives images back to the queue without counting the attempt
+    # (a worker shutting down before it started them)
+    def release(self, claims):
+        with self._write() as db:
+            for name, token in claims:
+                db.execute("UPDATE tasks SET state = 'queued', token = NULL, lease_expires = NULL, "
+                           "attempts = attempts - 1 WHERE name = ? AND token = ? AND state = 'leased'", (name, token))
+
+    # {"queued": n, "leased": n, "expired": n, "done": n, "failed": n}
+    def counts(self):
+        counts = dict.fromkeys(("queued", "leased", "expired", "done", "failed"), 0)
+        with self._lock:
+            for state, count in self._db.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state"):
+                counts[state] = count
+            counts["expired"] = self._db.execute("SELECT COUNT(*) FROM tasks WHERE state = 'leased' "
+                                                 "AND lease_expires < ?", (time.time(),)).fetchone()[0]
+        return counts
+
+    # (name, result) of every finished image, read in pages so that a large
+    # queue is never held in memory
+    def results(self, page_size=10000):
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._db.execute("SELECT name, result FROM tasks WHERE state IN ('done', 'failed') "
+                                        "AND name > ? ORDER BY name LIMIT ?", (last, page_size)).fetchall()
+            if not rows:
+                return
+            for name, result in rows:
+                yield name, json.loads(result)
+            last = rows[-1][0]
+
+    def totals(self):
+        with self._lock:
+            row = self._db.execute("SELECT " + ", ".join(f"COALESCE(SUM(json_extract(result, '$.{category}')), 0)"
+                                                        for category in CATEGORY_FIELDS) +
+                                   " FROM tasks WHERE state = 'done'").fetchone()
+        return dict(zip(CATEGORY_FIELDS, row))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def queue_path(folder_path):
+    return os.path.join(folder_path, QUEUE_FILE_NAME)
+
+
+# Queues every image in the folder that is not queued yet (or changed)
+def enqueue_folder(folder_path, path=None):
+    work_queue = WorkQueue(path or queue_path(folder_path))
+    try:
+        added = work_queue.enqueue(scan_images(folder_path))
+        counts = work_queue.counts()
+    finally:
+        work_queue.close()
+    print(f"Queued {added} images ({sum(counts[state] for state in ('queued', 'leased', 'done', 'failed'))} in "
+          f"{path or queue_path(folder_path)}).")
+    return added
+
+
+# Claims and analyzes images until the queue is empty, `threads` at a time,
+# with up to `threads` more claimed ahead. `folder_path` is where this
+# machine sees the shared folder; names in the queue are relative to it.
+# Results are committed in groups of `commit_every` or every second. When
+# nothing is left to claim but other workers still hold leases, it waits
+# for them to finish or expire. Returns the worker's counts.
+def run_worker(folder_path, path=None, threads=16, analyze=None, commit_every=32, worker=None,
+               lease_seconds=QUEUE_LEASE_SECONDS):
+    if analyze is None:
+        from .multithreding import detect_and_classify as analyze
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    work_queue = WorkQueue(path or queue_path(folder_path), lease_seconds)
+    held = {}
+    held_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def keep_leases():
+        while not stopped.wait(work_queue.lease_seconds / 3):
+            with held_lock:
+                tokens = [token for token, names in held.items() if names]
+            if tokens:
+                try:
+                    work_queue.heartbeat(tokens)
+                except sqlite3.Error as e:
+                    print(f"[Moondream] Heartbeat error: {str(e)}")
+
+    heartbeat = threading.Thread(target=keep_leases, name="queue-heartbeat", daemon=True)
+    heartbeat.start()
+    executor = ThreadPoolExecutor(max_workers=threads)
+    pending = {}
+    finished = []
+    stats = {"worker": worker, "processed": 0, "committed": 0, "discarded": 0}
+    started = last_commit = time.perf_counter()
+
+    def commit():
+        nonlocal finished, last_commit
+        if finished:
+            kept = work_queue.complete(finished)
+            stats["committed"] += kept
+            stats["discarded"] += len(finished) - kept
+            finished = []
+        last_commit = time.perf_counter()
+
+    def collect(future):
+        name, token = pending.pop(future)
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"[Moondream] Error during detection ({name}): {str(e)}")
+            result = {"error": str(e)}
+        finished.append((name, token, result))
+        stats["processed"] += 1
+        with held_lock:
+            held[token].discard(name)
+            if not held[token]:
+                del held[token]
+
+    try:
+        while True:
+            if len(pending) < threads:
+                token, names = work_queue.claim(worker, threads)
+                if names:
+                    with held_lock:
+                        held[token] = set(names)
+                    for name in names:
+                        image_path = os.path.join(folder_path, *name.split("/"))
+                        pending[executor.submit(analyze, image_path)] = (name, token)
+            if not pending:
+                commit()
+                counts = work_queue.counts()
+                if not counts["queued"] and not counts["leased"]:
+                    break
+                # Other workers hold the rest: wait until they finish or their leases expire
+                time.sleep(min(1.0, work_queue.lease_seconds / 4))
+                continue
+            done, _ = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                collect(future)
+            if len(finished) >= commit_every or time.perf_counter() - last_commit >= 1.0:
+                commit()
+    finally:
+        # Images not started yet go back to the queue; running ones finish
+        executor.shutdown(wait=True, cancel_futures=True)
+        unstarted = [pending.pop(future) for future in list(pending) if future.cancelled()]
+        for future in list(pending):
+            collect(future)
+        commit()
+        if unstarted:
+            work_queue.release(unstarted)
+        stopped.set()
+        heartbeat.join()
+        work_queue.close()
+
+    seconds = time.perf_counter() - started
+    stats["seconds"] = round(seconds, 3)
+    stats["images_per_second"] = round(stats["processed"] / seconds, 2) if seconds else 0.0
+    print(f"{worker}: {stats['processed']} images in {seconds:.1f} s ({stats['images_per_second']} images/s), "
+          f"{stats['committed']} committed, {stats['discarded']} discarded (lease lost)")
+    return stats
+
+
+# Writes the finished results as <folder>/waste_results_queue.jsonl and the
+# totals as waste_results_queue_total.json (the streaming pipeline's format)
+def export_results(folder_path, path=None):
+    work_queue = WorkQueue(path or queue_path(folder_path))
+    results_path = os.path.join(folder_path, "waste_results_queue.jsonl")
+    try:
+        counts = work_queue.counts()
+        with open(results_path, "w", encoding="utf-8") as f:
+            for name, result in work_queue.results():
+                f.write(json.dumps({"file": name, **result}, ensure_ascii=False) + "\n")
+        totals = work_queue.totals()
+    finally:
+        work_queue.close()
+    with open(os.path.join(folder_path, "waste_results_queue_total.json"), "w", encoding="utf-8") as f:
+        json.dump(totals, f, indent=4, ensure_ascii=False)
+    print(f"Queue: {counts}")
+    print(f"Results saved to: {results_path}")
+    return totals